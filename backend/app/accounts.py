@@ -0,0 +1,139 @@
+"""
+Account summary: a user's active subscription, next payment and recent payments.
+
+Built with two queries however long the history is: the user row joined to
+its active subscription and plan (at most one, enforced by the
+one_active_subscription_per_user constraint), and a sliced prefetch of the
+latest payments with their plans. The result is cached per user for
+ACCOUNT_SUMMARY_TTL seconds under the exact email (lookups are
+case-sensitive, so addresses differing only in case are different users);
+payment and subscription changes drop that user's entry and plan edits
+retire every entry at once by bumping a generation counter.
+
+The counter lives in the cache with no timeout, but a local-memory cache
+may still cull it. It is then restarted from the current time in
+nanoseconds rather than from 1, so it never returns to a generation whose
+entries may still be cached.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, FilteredRelation, Prefetch, Q
+from django.utils import timezone
+
+from app.models import Payment, User
+
+
+HISTORY_SIZE = 5
+GENERATION_KEY = 'account_summary:generation'
+
+
+def _new_generation():
+    return time.time_ns()
+
+
+def _cache_key(email):
+    generation = cache.get_or_set(GENERATION_KEY, _new_generation, None)
+    return f'account_summary:{generation}:{email}'
+
+
+def _build(email):
+    """Return the summary dict, or None if there is no such user"""
+    user = (
+        User.objects.filter(email=email)
+        .annotate(
+            active=FilteredRelation('subscriptions', condition=Q(subscriptions__status='active')),
+            subscription_id=F('active__id'),
+            subscription_start=F('active__start_date'),
+            subscription_renewal=F('active__renewal_date'),
+            plan_name=F('active__plan__name'),
+            plan_price=F('active__plan__price'),
+            plan_currency=F('active__plan__currency'),
+            plan_features=F('active__plan__features'),
+        )
+        .prefetch_related(Prefetch(
+            'payments',
+            queryset=Payment.objects.select_related('plan').order_by('-payment_date', '-id')[:HISTORY_SIZE],
+            to_attr='recent_payments',
+        ))
+        .first()
+    )
+    if user is None:
+        return None
+
+    subscription = None
+    next_payment = None
+    if user.subscription_id is not None:
+        subscription = {
+            'id': user.subscription_id,
+            'plan_name': user.plan_name,
+            'plan_price': str(user.plan_price),
+            'plan_currency': user.plan_currency,
+            'plan_features': user.plan_features,
+            'status': 'active',
+            'start_date': user.subscription_start,
+            'renewal_date': user.subscription_renewal,
+        }
+        next_payment = {
+            'next_payment_date': user.subscription_renewal,
+            'plan_price': str(user.plan_price),
+            'plan_currency': user.plan_currency,
+            'auto_renew': True,
+        }
+
+    return {
+        'subscription': subscription,
+        'next_payment': next_payment,
+        'payment_history': [
+            {
+                'id': payment.id,
+                'amount': str(payment.amount),
+                'currency': payment.currency,
+                'plan_name': payment.plan.name,
+                'date': payment.payment_date,
+                'status': payment.status,
+                'transaction_id': payment.transaction_id
+            }
+            for payment in user.recent_payments
+        ],
+    }
+
+
+def get_account_summary(email):
+    """Return the (possibly cached) summary for `email`, or None if the user does not exist"""
+    key = _cache_key(email)
+    summary = cache.get(key)
+    if summary is None:
+        summary = _build(email)
+        if summary is None:
+            return None
+        cache.set(key, summary, getattr(settings, 'ACCOUNT_SUMMARY_TTL', 30))
+
+    # Days left is relative to now, so it is not part of the cached payload
+    next_payment = summary['next_payment']
+    if next_payment and next_payment['next_payment_date']:
+        days = (next_payment['next_payment_date'] - timezone.now()).days
+        summary = {**summary, 'next_payment': {**next_payment, 'days_until_payment': max(0, days)}}
+    elif next_payment:
+        summary = {**summary, 'next_payment': {**next_payment, 'days_until_payment': 0}}
+    return summary
+
+
+def invalidate_account_summary(email):
+    """Drop one user's cached summary"""
+    cache.delete(_cache_key(email))
+
+
+def invalidate_account_summaries(user_ids):
+    """Drop the cached summaries of `user_ids` (one query for their emails)"""
+    emails = User.objects.filter(id__in=set(user_ids)).values_list('email', flat=True)
+    cache.delete_many([_cache_key(email) for email in emails])
+
+
+def invalidate_all_account_summaries():
+    """Retire every cached summary (a plan's name, price or features changed)"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, _new_generation(), None)
@@ -0,0 +1,297 @@
+"""
+Data access for the admin dashboard charts and analytics endpoints.
+
+Everything here reads through the Django ORM (and therefore the pooled
+database connection) and pushes grouping into SQL instead of looping in Python.
+"""
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    Avg, Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum,
+    Value, When,
+)
+from django.db.models.functions import Coalesce, ExtractHour, TruncDate
+from django.utils import timezone
+
+from app.models import Cost, Plan, Subscription, UserSession
+
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def parse_date_window(params):
+    """Read optional ?from=YYYY-MM-DD&to=YYYY-MM-DD, raising ValueError on bad input"""
+    window = []
+    for name in ('from', 'to'):
+        raw = params.get(name)
+        if not raw:
+            window.append(None)
+            continue
+        try:
+            window.append(date.fromisoformat(raw))
+        except ValueError:
+            raise ValueError(f"'{name}' must be a date in YYYY-MM-DD format")
+    start, end = window
+    if start and end and start > end:
+        raise ValueError("'from' must not be after 'to'")
+    return start, end
+
+
+def day_bounds(start=None, end=None):
+    """Convert an inclusive date window into aware [start, end) datetimes"""
+    tz = timezone.get_current_timezone()
+    start_dt = datetime.combine(start, time.min, tzinfo=tz) if start else None
+    end_dt = datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz) if end else None
+    return start_dt, end_dt
+
+
+def fill_daily_gaps(totals, start, end, default=0):
+    """Expand {date: value} into an ordered [(date, value)] list, using `default` for missing days"""
+    days = (end - start).days + 1
+    return [
+        (start + timedelta(days=i), totals.get(start + timedelta(days=i), default))
+        for i in range(days)
+    ]
+
+
+# Days a recurring cost is spread over
+RECURRENCE_DAYS = {'monthly': 30, 'yearly': 365}
+
+
+def daily_cost_series(start, end, plan=None):
+    """Return [(date, amortized cost)] for every day in [start, end] with one query.
+
+    Monthly and yearly costs are charged amount/30 and amount/365 per day for
+    every day of their billing period (all history when `period_start` is
+    empty, open-ended when `period_end` is). One-time costs are spread evenly
+    over their period.
+    """
+    costs = Cost.objects.filter(
+        Q(period_start__lte=end) | Q(period_start__isnull=True),
+        Q(period_end__gte=start) | Q(period_end__isnull=True),
+    ).exclude(recurrence='one_time', period_start__isnull=True)
+    if plan is not None:
+        costs = costs.filter(plan=plan)
+
+    # Per-day rate changes, summed into a running total below
+    days = (end - start).days + 1
+    changes = [Decimal('0')] * (days + 1)
+    for amount, recurrence, period_start, period_end in costs.values_list(
+            'amount', 'recurrence', 'period_start', 'period_end'):
+        if recurrence == 'one_time':
+            period_end = period_end or period_start
+            rate = amount / ((period_end - period_start).days + 1)
+        else:
+            rate = amount / RECURRENCE_DAYS[recurrence]
+        first = max((period_start - start).days, 0) if period_start else 0
+        last = min((period_end - start).days, days - 1) if period_end else days - 1
+        changes[first] += rate
+        changes[last + 1] -= rate
+
+    series = []
+    rate = Decimal('0')
+    for i in range(days):
+        rate += changes[i]
+        series.append((start + timedelta(days=i), float(round(rate, 2))))
+    return series
+
+
+def daily_session_minutes(start=None, end=None):
+    """Return [(date, minutes online)] for every day in the window with one grouped query.
+
+    Without an explicit window the series spans the first to the last day
+    that has sessions; with no sessions at all it is just today.
+    """
+    sessions = UserSession.objects.all()
+    start_dt, end_dt = day_bounds(start, end)
+    if start_dt:
+        sessions = sessions.filter(login_time__gte=start_dt)
+    if end_dt:
+        sessions = sessions.filter(login_time__lt=end_dt)
+
+    rows = (
+        sessions
+        .annotate(day=TruncDate('login_time'))
+        .values('day')
+        .annotate(total=Sum('duration_minutes'))
+        .order_by('day')
+    )
+    totals = {row['day']: row['total'] or 0 for row in rows}
+
+    today = timezone.localdate()
+    start = start or (min(totals) if totals else (end or today))
+    end = end or (max(totals) if totals else max(start, today))
+    return fill_daily_gaps(totals, start, end)
+
+
+def plan_subscription_counts():
+    """Return [(plan name, subscription count)] with one grouped query"""
+    rows = (
+        Subscription.objects
+        .values('plan__name')
+        .annotate(count=Count('id'))
+        .order_by('plan__name')
+    )
+    return [(row['plan__name'], row['count']) for row in rows]
+
+
+def plan_analytics():
+    """Plans annotated with active_users, total_revenue, monthly_cost, net_profit and profit_margin.
+
+    Subscription counts and cost sums are correlated subqueries rather than
+    joins, so one plan's costs are never multiplied by its subscriptions and
+    the whole table is one query however many plans exist. All money figures
+    are computed in SQL as decimals.
+    """
+    active_users = (
+        Subscription.objects.filter(plan=OuterRef('pk'), status='active')
+        .order_by().values('plan').annotate(count=Count('id')).values('count')
+    )
+    monthly_cost = (
+        Cost.objects.filter(plan=OuterRef('pk'))
+        .order_by().values('plan').annotate(total=Sum('amount')).values('total')
+    )
+    zero = Value(Decimal('0.00'), output_field=MONEY)
+    return (
+        Plan.objects
+        .annotate(
+            active_users=Coalesce(Subquery(active_users, output_field=IntegerField()), 0),
+            monthly_cost=Coalesce(Subquery(monthly_cost, output_field=MONEY), zero),
+        )
+        .annotate(total_revenue=ExpressionWrapper(F('active_users') * F('price'), output_field=MONEY))
+        .annotate(net_profit=ExpressionWrapper(F('total_revenue') - F('monthly_cost'), output_field=MONEY))
+        .annotate(profit_margin=Case(
+            When(total_revenue__gt=0,
+                 then=ExpressionWrapper(F('net_profit') * 100 / F('total_revenue'), output_field=MONEY)),
+            default=zero,
+            output_field=MONEY,
+        ))
+        .order_by('id')
+    )
+
+
+def cost_breakdown():
+    """Return [(description, amount)] for every cost row in insertion order"""
+    rows = Cost.objects.order_by('id').values_list('description', 'amount')
+    return [(description, float(amount)) for description, amount in rows]
+
+
+class UserActivityAnalytics:
+    """Builds the admin user-activity payload with a fixed number of grouped queries.
+
+    overview (1 aggregate), online users (1), daily activity (1 TruncDate
+    group), top users (1) and hourly activity (1 ExtractHour group) — five
+    queries no matter how much history is stored.
+    """
+
+    ONLINE_WINDOW = timedelta(minutes=15)
+    TOP_USERS_LIMIT = 10
+
+    def __init__(self, now=None):
+        self.now = now or timezone.now()
+        self.today_start = self.now.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.week_start = self.today_start - timedelta(days=7)
+        self.sessions = UserSession.objects.all()
+
+    def _online_filter(self):
+        return Q(logout_time__isnull=True, login_time__gte=self.now - self.ONLINE_WINDOW)
+
+    def overview(self):
+        totals = self.sessions.aggregate(
+            total_active_users=Count('user', distinct=True),
+            today_active=Count('user', distinct=True, filter=Q(login_time__gte=self.today_start)),
+            week_active=Count('user', distinct=True, filter=Q(login_time__gte=self.week_start)),
+            currently_online=Count('user', distinct=True, filter=self._online_filter()),
+            avg_duration=Avg('duration_minutes', filter=Q(duration_minutes__gt=0)),
+            total_minutes=Sum('duration_minutes'),
+        )
+        return {
+            'total_active_users': totals['total_active_users'],
+            'currently_online': totals['currently_online'],
+            'today_active': totals['today_active'],
+            'week_active': totals['week_active'],
+            'avg_session_minutes': round(totals['avg_duration'] or 0, 1),
+            'total_time_hours': round((totals['total_minutes'] or 0) / 60, 1),
+        }
+
+    def online_users(self):
+        active_sessions = (
+            self.sessions
+            .filter(self._online_filter())
+            .select_related('user')
+            .order_by('-login_time')
+        )
+        online_users = []
+        seen_users = set()
+        for session in active_sessions:
+            if session.user.email not in seen_users:
+                online_users.append({
+                    'email': session.user.email,
+                    'id': str(session.user.id),
+                    'last_active': session.login_time.isoformat()
+                })
+                seen_users.add(session.user.email)
+        return online_users
+
+    def daily_activity(self):
+        rows = (
+            self.sessions
+            .annotate(day=TruncDate('login_time'))
+            .values('day')
+            .annotate(active_users=Count('user', distinct=True), total=Sum('duration_minutes'))
+            .order_by('day')
+        )
+        per_day = {row['day']: (row['active_users'], row['total'] or 0) for row in rows}
+        if per_day:
+            start, end = min(per_day), max(per_day)
+        else:
+            start = end = self.today_start.date()
+
+        return [
+            {
+                'date': day.strftime('%Y-%m-%d'),
+                'active_users': active_users,
+                'total_minutes': total_time,
+                'total_hours': round(total_time / 60, 1)
+            }
+            for day, (active_users, total_time) in fill_daily_gaps(per_day, start, end, default=(0, 0))
+        ]
+
+    def top_users(self):
+        top_users_data = self.sessions.values('user__email', 'user__id').annotate(
+            total_time=Sum('duration_minutes'),
+            session_count=Count('id')
+        ).order_by('-total_time')[:self.TOP_USERS_LIMIT]
+
+        top_users = []
+        for user in top_users_data:
+            hours = (user['total_time'] or 0) // 60
+            minutes = (user['total_time'] or 0) % 60
+            top_users.append({
+                'email': user['user__email'],
+                'total_minutes': user['total_time'] or 0,
+                'total_formatted': f"{hours}h {minutes}m",
+                'session_count': user['session_count']
+            })
+        return top_users
+
+    def hourly_activity(self):
+        rows = (
+            self.sessions
+            .annotate(hour=ExtractHour('login_time'))
+            .values('hour')
+            .annotate(users=Count('user', distinct=True))
+            .order_by('hour')
+        )
+        per_hour = {row['hour']: row['users'] for row in rows}
+        return [{'hour': f"{hour:02d}:00", 'users': per_hour.get(hour, 0)} for hour in range(24)]
+
+    def build(self):
+        return {
+            'overview': self.overview(),
+            'online_users': self.online_users(),
+            'top_users': self.top_users(),
+            'daily_activity': self.daily_activity(),
+            'hourly_activity': self.hourly_activity()
+        }
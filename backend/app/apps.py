@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class AppConfig(AppConfig): # Vechea era CoreConfig
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'app' # Vechea era 'core'
\ No newline at end of file
+    name = 'app' # Vechea era 'core'
+
+    def ready(self):
+        # Drop cached dashboard figures whenever the underlying rows change
+        from . import signals  # noqa: F401
@@ -0,0 +1,64 @@
+"""
+Public plans catalog cache.
+
+The serialized plan list is kept at two levels: a per-process copy (checked
+first, trusted for PLANS_CATALOG_LOCAL_TTL seconds) and Django's cache,
+shared by every worker. Any Plan save/delete drops both, so the next request
+rebuilds it with one query. The JSON bytes and their ETag are stored
+together, so a hit never touches the database or the serializer.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from app.models import Plan
+
+
+CACHE_KEY = 'plans_catalog'
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def plan_payload(plan):
+    """Public representation of a plan, shared by the catalog and the plan write endpoints"""
+    return {
+        "id": plan.id,
+        "name": plan.name,
+        "price": float(plan.price),
+        "currency": plan.currency,
+        "features": plan.features,
+    }
+
+
+def _build():
+    body = json.dumps([plan_payload(plan) for plan in Plan.objects.order_by('id')]).encode('utf-8')
+    return {'body': body, 'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"'}
+
+
+def get_catalog():
+    """Return {'body': JSON bytes, 'etag': quoted ETag} for the current plan list"""
+    global _local
+    local = _local
+    if local is not None and local[0] > time.monotonic():
+        return local[1]
+
+    catalog = cache.get(CACHE_KEY)
+    if catalog is None:
+        catalog = _build()
+        cache.set(CACHE_KEY, catalog, None)
+    with _local_lock:
+        _local = (time.monotonic() + getattr(settings, 'PLANS_CATALOG_LOCAL_TTL', 5), catalog)
+    return catalog
+
+
+def invalidate_catalog():
+    """Drop the shared and the in-process copy after a plan changes"""
+    global _local
+    with _local_lock:
+        _local = None
+    cache.delete(CACHE_KEY)
@@ -0,0 +1,158 @@
+"""
+Chart rendering helpers shared by the matplotlib chart endpoints.
+
+Every chart endpoint accepts the same query string contract:
+
+    ?format=png|svg|webp|auto&width=<px>&height=<px>&dpi=<n>
+
+The rendered bytes are cached per (chart, data, format, size) so repeated
+dashboard loads don't re-run matplotlib.
+"""
+import hashlib
+from io import BytesIO
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+CHART_CONTENT_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "webp": "image/webp",
+}
+
+MIN_PIXELS = 100
+MAX_PIXELS = 4000
+MIN_DPI = 50
+MAX_DPI = 300
+
+
+class ChartOptionsError(ValueError):
+    """Raised when the chart query string is invalid"""
+
+
+class ChartOptions:
+    """Parsed ?format/width/height/dpi parameters for a chart request"""
+
+    def __init__(self, fmt, width, height, dpi, explicit_size):
+        self.format = fmt
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.explicit_size = explicit_size
+
+    @property
+    def figsize(self):
+        return (self.width / self.dpi, self.height / self.dpi)
+
+    def cache_suffix(self):
+        tight = "exact" if self.explicit_size else "tight"
+        return f"{self.format}:{self.width}x{self.height}@{self.dpi}:{tight}"
+
+
+def _int_param(params, name, default, low, high):
+    raw = params.get(name)
+    if raw in (None, ""):
+        return default
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ChartOptionsError(f"'{name}' must be an integer")
+    if value < low or value > high:
+        raise ChartOptionsError(f"'{name}' must be between {low} and {high}")
+    return value
+
+
+def parse_chart_options(request, default_figsize=(8, 6), default_dpi=100, preferred_format="png"):
+    """Read the chart contract from the query string.
+
+    `format=auto` picks `preferred_format` (svg for line charts, webp for
+    raster charts), falling back to png when the client doesn't accept webp.
+    """
+    params = request.GET
+    fmt = (params.get("format") or "png").lower()
+    if fmt == "auto":
+        fmt = preferred_format
+        if fmt == "webp" and "image/webp" not in request.META.get("HTTP_ACCEPT", ""):
+            fmt = "png"
+    if fmt not in CHART_CONTENT_TYPES:
+        raise ChartOptionsError(
+            f"Unsupported format '{fmt}'. Use one of: {', '.join(CHART_CONTENT_TYPES)}, auto"
+        )
+
+    dpi = _int_param(params, "dpi", default_dpi, MIN_DPI, MAX_DPI)
+    default_width = int(default_figsize[0] * dpi)
+    default_height = int(default_figsize[1] * dpi)
+    width = _int_param(params, "width", default_width, MIN_PIXELS, MAX_PIXELS)
+    height = _int_param(params, "height", default_height, MIN_PIXELS, MAX_PIXELS)
+    explicit_size = bool(params.get("width") or params.get("height"))
+
+    return ChartOptions(fmt, width, height, dpi, explicit_size)
+
+
+def _encode(fig, options):
+    """Serialize a figure in the requested format using the smallest encoding"""
+    savefig_kwargs = {"facecolor": fig.get_facecolor(), "dpi": options.dpi}
+    if not options.explicit_size:
+        # Keep the historical look (tight bounding box) when no size was asked for
+        savefig_kwargs["bbox_inches"] = "tight"
+
+    buf = BytesIO()
+    if options.format == "svg":
+        # Drop the timestamp so identical charts produce identical bytes
+        fig.savefig(buf, format="svg", metadata={"Date": None}, **savefig_kwargs)
+        return buf.getvalue()
+
+    fig.savefig(buf, format="png", **savefig_kwargs)
+    buf.seek(0)
+    image = Image.open(buf)
+    out = BytesIO()
+    if options.format == "webp":
+        image.save(out, format="WEBP", quality=85, method=6)
+    else:
+        image.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def render_chart(name, data_key, draw, options):
+    """Return encoded chart bytes, rendering through `draw(fig, ax)` on a cache miss.
+
+    `data_key` must capture everything the chart depends on (labels, values,
+    titles) so that a change in the data produces a new cache entry.
+    """
+    digest = hashlib.sha1(repr(data_key).encode("utf-8")).hexdigest()
+    cache_key = f"chart:{name}:{digest}:{options.cache_suffix()}"
+
+    content = cache.get(cache_key)
+    if content is not None:
+        return content
+
+    fig, ax = plt.subplots(figsize=options.figsize, dpi=options.dpi)
+    try:
+        draw(fig, ax)
+        content = _encode(fig, options)
+    finally:
+        plt.close(fig)
+
+    cache.set(cache_key, content, getattr(settings, "CHART_CACHE_TIMEOUT", 300))
+    return content
+
+
+def chart_response(request, name, data_key, draw, default_figsize=(8, 6), default_dpi=100,
+                   preferred_format="png"):
+    """Parse the request, render (or fetch) the chart and wrap it in an HttpResponse"""
+    try:
+        options = parse_chart_options(request, default_figsize, default_dpi, preferred_format)
+    except ChartOptionsError as e:
+        return HttpResponse(str(e), status=400, content_type="text/plain")
+
+    content = render_chart(name, data_key, draw, options)
+    response = HttpResponse(content, content_type=CHART_CONTENT_TYPES[options.format])
+    if request.GET.get("format", "").lower() == "auto":
+        response["Vary"] = "Accept"
+    return response
@@ -0,0 +1,140 @@
+"""
+Checkout PaymentIntent reuse.
+
+Reopening the checkout for the same (user, plan, amount, currency) returns
+the PaymentIntent created last time instead of asking Stripe for a new one.
+Intents left open past CHECKOUT_INTENT_TTL are cancelled in batches by
+`manage.py sweep_checkout_intents`.
+
+Intents are created for the user's Stripe Customer with
+setup_future_usage='off_session', so the card is saved for renewals.
+"""
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from app.models import CheckoutIntent, User
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'CHECKOUT_INTENT_TTL', 3600))
+
+
+def ensure_stripe_customer(gateway, user_email):
+    """Return the Stripe customer id for `user_email`, creating the customer (and account) once"""
+    user = User.objects.filter(email=user_email).first()
+    if user is None:
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(email=user_email, role='user')
+        except IntegrityError:
+            user = User.objects.get(email=user_email)  # Created concurrently
+    if user.stripe_customer_id:
+        return user.stripe_customer_id
+
+    customer = gateway.create_customer(email=user_email, metadata={'user_id': str(user.id)},
+                                       idempotency_key=f"customer-{user.id}")
+    # Conditional update: if a concurrent checkout stored a customer first, keep that one
+    User.objects.filter(id=user.id, stripe_customer_id='').update(stripe_customer_id=customer.id)
+    return User.objects.values_list('stripe_customer_id', flat=True).get(id=user.id)
+
+
+def get_or_create_checkout_intent(gateway, user_email, plan, amount, currency, metadata):
+    """Return (payment_intent_id, client_secret, reused) for a checkout of `plan`"""
+    key = {'user_email': user_email, 'plan': plan, 'amount': amount, 'currency': currency}
+    existing = CheckoutIntent.objects.filter(status='open', **key).first()
+    # Conditional update so an intent the sweeper just claimed is not handed out
+    if existing and CheckoutIntent.objects.filter(id=existing.id, status='open').update(expires_at=_expiry()):
+        return existing.payment_intent_id, existing.client_secret, True
+
+    intent = gateway.create_payment_intent(
+        amount=amount,
+        currency=currency,
+        customer=ensure_stripe_customer(gateway, user_email),
+        setup_future_usage='off_session',
+        automatic_payment_methods={'enabled': True},
+        metadata=metadata,
+    )
+    try:
+        CheckoutIntent.objects.create(payment_intent_id=intent.id, client_secret=intent.client_secret,
+                                      expires_at=_expiry(), **key)
+    except IntegrityError:
+        # A concurrent request stored one first; use it and drop ours
+        existing = CheckoutIntent.objects.filter(status='open', **key).first()
+        if existing is None:
+            raise
+        gateway.cancel_payment_intent(intent.id)
+        return existing.payment_intent_id, existing.client_secret, True
+    return intent.id, intent.client_secret, False
+
+
+def mark_checkout_intent(payment_intent_id, status):
+    """Record the outcome of an intent so it is neither reused nor swept"""
+    CheckoutIntent.objects.filter(payment_intent_id=payment_intent_id, status='open').update(status=status)
+
+
+def sweep_stale_intents(gateway, batch_size=100, limit=None):
+    """Cancel expired open intents at Stripe, `batch_size` at a time.
+
+    Each batch is claimed before calling Stripe: the expired open rows are
+    locked with SKIP LOCKED and closed by an UPDATE that re-checks the
+    expiry, so an intent a checkout has just extended is never cancelled,
+    and only the rows actually claimed are sent to Stripe. Intents Stripe
+    refuses to cancel are re-read: ones that succeeded are recorded as
+    such, the rest are reopened for the next sweep. Returns
+    {'canceled': n, 'succeeded': n, 'reopened': n}.
+    """
+    counts = {'canceled': 0, 'succeeded': 0, 'reopened': 0}
+    while limit is None or sum(counts.values()) < limit:
+        size = batch_size if limit is None else min(batch_size, limit - sum(counts.values()))
+        with transaction.atomic():
+            now = timezone.now()
+            ids = list(
+                CheckoutIntent.objects.select_for_update(skip_locked=True)
+                .filter(status='open', expires_at__lt=now)
+                .order_by('expires_at').values_list('id', flat=True)[:size]
+            )
+            if not ids:
+                break
+            claimed = CheckoutIntent.objects.filter(id__in=ids, status='open', expires_at__lt=now)
+            batch = list(claimed)
+            claimed.update(status='canceled')
+        if not batch:
+            continue
+
+        succeeded, reopened = [], []
+        for checkout in batch:
+            try:
+                gateway.cancel_payment_intent(checkout.payment_intent_id)
+                counts['canceled'] += 1
+                continue
+            except stripe.InvalidRequestError:
+                try:
+                    intent_status = gateway.retrieve_payment_intent(checkout.payment_intent_id).status
+                except stripe.StripeError:
+                    intent_status = None
+            except stripe.StripeError:
+                intent_status = None
+
+            if intent_status == 'succeeded':
+                succeeded.append(checkout.id)
+            elif intent_status == 'canceled':
+                counts['canceled'] += 1
+            else:
+                reopened.append(checkout.id)
+
+        if succeeded:
+            CheckoutIntent.objects.filter(id__in=succeeded).update(status='succeeded')
+            counts['succeeded'] += len(succeeded)
+        for checkout_id in reopened:
+            # Retry on the next sweep rather than spinning on it now
+            try:
+                with transaction.atomic():
+                    CheckoutIntent.objects.filter(id=checkout_id).update(status='open', expires_at=_expiry())
+                counts['reopened'] += 1
+            except IntegrityError:
+                pass  # A newer open intent exists for the same checkout; this one stays closed
+    return counts
@@ -0,0 +1,161 @@
+"""
+Bulk cost import and batch mutations.
+
+A batch (CSV or JSON rows) is validated in one pass — one query for the
+referenced plans, one for the rows being updated — and written with
+`bulk_create`/`bulk_update` inside a single transaction, so either every
+row lands or none does. The dashboard snapshot is invalidated once per batch.
+"""
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from io import StringIO
+
+from django.db import transaction
+
+from app.models import Cost, Plan
+from app.signals import batched_invalidation, invalidate_snapshot
+
+
+MAX_BULK_COSTS = 5000
+BULK_BATCH_SIZE = 500
+
+# Columns accepted in a batch row besides `id` (present only for updates)
+COST_FIELDS = ('description', 'amount', 'currency', 'category', 'plan_id', 'recurrence',
+               'period_start', 'period_end')
+
+
+class CostImportError(Exception):
+    """Raised with per-row errors when a batch does not validate"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid row(s)")
+        self.errors = errors
+
+
+def rows_from_csv(text):
+    """Parse a CSV batch with a header row into dicts, dropping empty cells"""
+    reader = csv.DictReader(StringIO(text))
+    return [
+        {column.strip(): value.strip() for column, value in row.items() if column and value not in (None, '')}
+        for row in reader
+    ]
+
+
+def _parse_row(row, is_update):
+    """Return {field: value} for the supplied columns, raising ValueError on the first bad one"""
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    unknown = set(row) - set(COST_FIELDS) - {'id'}
+    if unknown:
+        raise ValueError(f"unknown column(s): {', '.join(sorted(unknown))}")
+
+    values = {}
+    for field in COST_FIELDS:
+        if field not in row or row[field] in (None, ''):
+            continue
+        raw = row[field]
+        if field == 'amount':
+            try:
+                amount = Decimal(str(raw)).quantize(Decimal('0.01'))
+            except InvalidOperation:
+                raise ValueError(f"amount '{raw}' is not a number")
+            if amount < 0:
+                raise ValueError("amount must not be negative")
+            values[field] = amount
+        elif field in ('period_start', 'period_end'):
+            try:
+                values[field] = date.fromisoformat(str(raw))
+            except ValueError:
+                raise ValueError(f"{field} must be a date in YYYY-MM-DD format")
+        elif field == 'plan_id':
+            try:
+                values[field] = int(raw)
+            except (TypeError, ValueError):
+                raise ValueError(f"plan_id '{raw}' is not an integer")
+        elif field == 'recurrence':
+            if raw not in dict(Cost.RECURRENCE_CHOICES):
+                raise ValueError(f"unsupported recurrence '{raw}'")
+            values[field] = raw
+        else:
+            values[field] = str(raw)
+
+    if not is_update:
+        for required in ('description', 'amount'):
+            if required not in values:
+                raise ValueError(f"{required} is required")
+    return values
+
+
+def validate_cost_rows(rows):
+    """Validate a batch and return (new Cost objects, updated Cost objects, updated field names)"""
+    if not isinstance(rows, list) or not rows:
+        raise CostImportError([{'row': None, 'error': 'expected a non-empty list of cost rows'}])
+    if len(rows) > MAX_BULK_COSTS:
+        raise CostImportError([{'row': None, 'error': f'at most {MAX_BULK_COSTS} rows per batch'}])
+
+    errors = []
+    parsed = []
+    for index, row in enumerate(rows):
+        try:
+            cost_id = int(row['id']) if isinstance(row, dict) and row.get('id') not in (None, '') else None
+            parsed.append((index, cost_id, _parse_row(row, is_update=cost_id is not None)))
+        except (TypeError, ValueError) as e:
+            errors.append({'row': index, 'error': str(e)})
+
+    plan_ids = {values['plan_id'] for _, _, values in parsed if 'plan_id' in values}
+    known_plans = set(Plan.objects.filter(id__in=plan_ids).values_list('id', flat=True)) if plan_ids else set()
+    update_ids = [cost_id for _, cost_id, _ in parsed if cost_id is not None]
+    existing = Cost.objects.in_bulk(update_ids) if update_ids else {}
+
+    new_costs = []
+    updated_costs = {}
+    updated_fields = set()
+    for index, cost_id, values in parsed:
+        if 'plan_id' in values and values['plan_id'] not in known_plans:
+            errors.append({'row': index, 'error': f"plan {values['plan_id']} not found"})
+            continue
+        if cost_id is None:
+            cost = Cost(**{'currency': 'EUR', 'category': 'hosting', **values})
+            new_costs.append(cost)
+        else:
+            cost = existing.get(cost_id)
+            if cost is None:
+                errors.append({'row': index, 'error': f"cost {cost_id} not found"})
+                continue
+            if cost_id in updated_costs:
+                errors.append({'row': index, 'error': f"cost {cost_id} appears more than once"})
+                continue
+            for field, value in values.items():
+                setattr(cost, field, value)
+            updated_fields.update(values)
+            updated_costs[cost_id] = cost
+
+        if cost.period_start and cost.period_end and cost.period_start > cost.period_end:
+            errors.append({'row': index, 'error': "period_start must not be after period_end"})
+        cost.apply_default_period()
+        if cost_id is not None and cost.recurrence == 'one_time':
+            updated_fields.update(('period_start', 'period_end'))
+
+    if errors:
+        raise CostImportError(errors)
+    return new_costs, list(updated_costs.values()), sorted(updated_fields)
+
+
+def save_cost_rows(new_costs, updated_costs, updated_fields):
+    """Write a validated batch in one transaction and invalidate the snapshot once"""
+    with transaction.atomic():
+        created = Cost.objects.bulk_create(new_costs, batch_size=BULK_BATCH_SIZE)
+        if updated_costs and updated_fields:
+            Cost.objects.bulk_update(updated_costs, updated_fields, batch_size=BULK_BATCH_SIZE)
+    # bulk_create/bulk_update skip post_save, so drop the cached figures here; after commit, because
+    # the idempotent bulk endpoint runs this inside an outer transaction and a render could re-cache old costs
+    transaction.on_commit(invalidate_snapshot)
+    return created
+
+
+def delete_costs(cost_ids):
+    """Delete a batch of costs in one transaction; returns the number deleted"""
+    with transaction.atomic(), batched_invalidation():
+        deleted, _ = Cost.objects.filter(id__in=cost_ids).delete()
+    return deleted
@@ -0,0 +1,76 @@
+"""
+Idempotency keys for mutating endpoints.
+
+The first request carrying an `Idempotency-Key` header stores its response;
+retries with the same key and body get that response back instead of writing
+again. The key row is inserted in the same transaction as the work, so a
+failed attempt leaves nothing behind and a concurrent retry waits on the
+unique index until the first attempt commits, then replays it.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+
+from app.models import IdempotencyKey
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body"""
+
+
+def request_fingerprint(payload):
+    """Stable hash of a parsed request body"""
+    encoded = json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def stored_response(scope, key, fingerprint):
+    """Return (status_code, payload) already stored for the key, or None.
+
+    Lets callers skip slow pre-work (e.g. a Stripe API call) on a retry
+    before entering `run_idempotent`.
+    """
+    if not key:
+        return None
+    record = IdempotencyKey.objects.filter(scope=scope, key=key, status_code__isnull=False).first()
+    if record is None:
+        return None
+    if record.request_hash != fingerprint:
+        raise IdempotencyConflict(f"Idempotency key '{key}' was already used with a different request")
+    return record.status_code, record.response
+
+
+def run_idempotent(scope, key, fingerprint, handler):
+    """Run `handler() -> (status_code, payload)` at most once per (scope, key).
+
+    Returns (status_code, payload, replayed). Without a key the handler just
+    runs. Error responses (>= 400) are rolled back and not stored, so the
+    client can fix the request and retry with the same key.
+    """
+    if not key:
+        status_code, payload = handler()
+        return status_code, payload, False
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(scope=scope, key=key, request_hash=fingerprint)
+        except IntegrityError:
+            record = IdempotencyKey.objects.get(scope=scope, key=key)
+            if record.request_hash != fingerprint:
+                raise IdempotencyConflict(f"Idempotency key '{key}' was already used with a different request")
+            return record.status_code, record.response, True
+
+        status_code, payload = handler()
+        if status_code >= 400:
+            transaction.set_rollback(True)
+            return status_code, payload, False
+
+        # Normalize through JSON so the first response and every replay are identical
+        payload = json.loads(json.dumps(payload, cls=DjangoJSONEncoder))
+        record.status_code = status_code
+        record.response = payload
+        record.save(update_fields=['status_code', 'response'])
+        return status_code, payload, False
@@ -0,0 +1,72 @@
+"""
+Per-user payment aggregates (UserPaymentStats).
+
+A new paid payment bumps its user's row with one conditional UPDATE of F()
+expressions inside the payment's transaction. Edits, deletes and bulk writes
+recompute the affected users from their payments instead (an indexed scan
+of those users' rows only). Every user has a row, created with the account,
+so lifetime value can be sorted on directly.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from app.models import Payment, UserPaymentStats
+
+
+def ensure_payment_stats(user_ids):
+    """Create empty stats rows for users that have none (one INSERT)"""
+    UserPaymentStats.objects.bulk_create([UserPaymentStats(user_id=user_id) for user_id in set(user_ids)],
+                                         ignore_conflicts=True)
+
+
+def record_payment(payment):
+    """Add one newly inserted paid payment to its user's totals"""
+    paid_at = Value(payment.payment_date)
+    with transaction.atomic():
+        updated = UserPaymentStats.objects.filter(user_id=payment.user_id).update(
+            total_paid=F('total_paid') + payment.amount,
+            payment_count=F('payment_count') + 1,
+            # SQLite's MIN/MAX of NULL is NULL, hence the Coalesce
+            first_payment_at=Coalesce(Least('first_payment_at', paid_at), paid_at),
+            last_payment_at=Coalesce(Greatest('last_payment_at', paid_at), paid_at),
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                UserPaymentStats.objects.create(user_id=payment.user_id, total_paid=payment.amount, payment_count=1,
+                                                first_payment_at=payment.payment_date,
+                                                last_payment_at=payment.payment_date)
+        except IntegrityError:
+            # Created concurrently; fall back to the increment
+            record_payment(payment)
+
+
+def refresh_payment_stats(user_ids):
+    """Recompute the totals of `user_ids` from their paid payments in one UPDATE"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    paid = Payment.objects.filter(user=OuterRef('user_id'), status='paid').order_by().values('user')
+    ensure_payment_stats(user_ids)
+    UserPaymentStats.objects.filter(user_id__in=user_ids).update(
+        total_paid=Coalesce(Subquery(paid.annotate(total=Sum('amount')).values('total')),
+                            Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        payment_count=Coalesce(Subquery(paid.annotate(count=Count('id')).values('count')), Value(0)),
+        first_payment_at=Subquery(paid.annotate(first=Min('payment_date')).values('first')),
+        last_payment_at=Subquery(paid.annotate(last=Max('payment_date')).values('last')),
+    )
+
+
+def stats_payload(stats):
+    if stats is None:
+        return {'total_paid': 0.0, 'payment_count': 0, 'first_payment_at': None, 'last_payment_at': None}
+    return {
+        'total_paid': float(stats.total_paid),
+        'payment_count': stats.payment_count,
+        'first_payment_at': stats.first_payment_at,
+        'last_payment_at': stats.last_payment_at,
+    }
@@ -0,0 +1,287 @@
+"""
+Management command to benchmark the hot Payment/Subscription/UserSession queries
+Usage: python manage.py benchmark_queries --i-know-this-locks-tables [--users 2000] [--repeat 20] [--keep]
+
+Seeds a synthetic dataset, then prints the EXPLAIN plan and median timing of
+each query shape with the composite/partial indexes in place and again with
+them dropped. Everything runs in one transaction that is rolled back at the
+end (pass --keep to leave the seeded rows), so the database needs
+transactional DDL (PostgreSQL or SQLite).
+
+Dropping the indexes inside that transaction takes ACCESS EXCLUSIVE locks on
+the payment, subscription and session tables on PostgreSQL (SQLite locks the
+whole database) until the run ends, blocking every read and write of them.
+The command therefore refuses to run unless BENCHMARK_DATABASE says the
+database is a dedicated benchmark copy or --i-know-this-locks-tables is passed.
+"""
+
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from app.ledger import refresh_payment_stats
+from app.models import Payment, Plan, Subscription, User, UserSession
+
+
+# Indexes added for these query shapes (migration 0014)
+BENCHMARK_INDEXES = (
+    (Payment, 'payment_status_date_idx'),
+    (Payment, 'payment_user_date_idx'),
+    (Subscription, 'subscription_user_status_idx'),
+    (Subscription, 'subscription_plan_status_idx'),
+    (Subscription, 'subscription_active_start_idx'),
+    (UserSession, 'session_login_time_idx'),
+    (UserSession, 'session_open_user_idx'),
+)
+
+# Each shape mirrors a query the views, reports or analytics run
+QUERY_SHAPES = (
+    ('payment revenue window', lambda ctx: Payment.objects.filter(
+        status='paid', payment_date__gte=ctx['now'] - timedelta(days=7)
+    ).values('status').annotate(total=Sum('amount'))),
+    ('payment user history', lambda ctx: Payment.objects.filter(
+        user=ctx['user']
+    ).order_by('-payment_date')[:5]),
+    ('subscription user active', lambda ctx: Subscription.objects.filter(
+        user=ctx['user'], status='active'
+    ).order_by('-start_date')[:1]),
+    ('subscription plan active', lambda ctx: Subscription.objects.filter(
+        plan=ctx['plan'], status='active', start_date__lte=ctx['now']
+    ).values('plan').annotate(count=Count('id'))),
+    ('subscription active total', lambda ctx: Subscription.objects.filter(
+        status='active', start_date__lte=ctx['now'] - timedelta(days=30)
+    ).values('status').annotate(count=Count('id'))),
+    ('session open for user', lambda ctx: UserSession.objects.filter(
+        user=ctx['user'], logout_time__isnull=True
+    ).order_by('-login_time')[:1]),
+    ('session login range', lambda ctx: UserSession.objects.filter(
+        login_time__gte=ctx['now'] - timedelta(days=1), login_time__lt=ctx['now']
+    ).order_by().values('user').distinct()),
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Seed a large dataset and compare query plans/timings with and without the hot-path indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=2000,
+            help='Synthetic users to create'
+        )
+        parser.add_argument(
+            '--payments-per-user',
+            type=int,
+            default=12,
+            help='Payments created per user'
+        )
+        parser.add_argument(
+            '--sessions-per-user',
+            type=int,
+            default=30,
+            help='Sessions created per user'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='History spread over this many days'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Runs per query; the median is reported'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT statement'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for reproducible data'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Commit the seeded rows instead of rolling them back'
+        )
+        parser.add_argument(
+            '--i-know-this-locks-tables',
+            action='store_true',
+            dest='locks_ok',
+            help='Run even though this is not a dedicated benchmark database (blocks the hot tables while it runs)'
+        )
+
+    def handle(self, *args, **options):
+        if not (options['locks_ok'] or getattr(settings, 'BENCHMARK_DATABASE', False)):
+            raise CommandError(
+                'benchmark_queries drops indexes inside a transaction, which locks the payment, subscription '
+                'and session tables until it finishes. Run it against a dedicated copy (BENCHMARK_DATABASE=1) '
+                'or pass --i-know-this-locks-tables.'
+            )
+        if not connection.features.can_rollback_ddl:
+            raise CommandError(f'{connection.vendor} cannot roll back DDL; use PostgreSQL or SQLite')
+
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                self.seed(rng, options)
+                self.analyze()
+                ctx = self.context(rng)
+
+                self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+                with_indexes = self.run_shapes(ctx, options['repeat'])
+
+                # Savepoint: the dropped indexes come back when it rolls back
+                with transaction.atomic():
+                    # Plain DROP INDEX: SQLite's schema editor refuses to run inside a transaction
+                    with connection.cursor() as cursor:
+                        for model, name in BENCHMARK_INDEXES:
+                            cursor.execute(f'DROP INDEX {connection.ops.quote_name(self.index(model, name).name)}')
+                    self.analyze()
+                    self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+                    without_indexes = self.run_shapes(ctx, options['repeat'])
+                    transaction.set_rollback(True)
+
+                self.summary(with_indexes, without_indexes)
+                if not options['keep']:
+                    raise _Rollback()
+        except _Rollback:
+            self.stdout.write(self.style.NOTICE('- Rolled back the seeded data (use --keep to commit it)'))
+
+    @staticmethod
+    def index(model, name):
+        for index in model._meta.indexes:
+            if index.name == name:
+                return index
+        raise CommandError(f'{model.__name__} has no index {name}; run migrate first')
+
+    def seed(self, rng, options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        days = max(options['days'], 1)
+        started = time.monotonic()
+
+        plans = list(Plan.objects.all()[:3])
+        if not plans:
+            plans = Plan.objects.bulk_create([
+                Plan(name=f'Bench {tier}', price=Decimal(price))
+                for tier, price in (('Basic', '4.99'), ('Pro', '9.99'), ('Premium', '19.99'))
+            ])
+
+        marker = f'{int(time.time())}-{rng.randrange(10 ** 6)}'
+        users = []
+        for i in range(options['users']):
+            user = User(email=f'bench{i}-{marker}@playatac.local', role='user')
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users, batch_size=batch_size)
+        users = list(User.objects.filter(email__endswith=f'-{marker}@playatac.local'))
+
+        # auto_now_add overwrites dates on insert, so rows are dated afterwards, one UPDATE per day
+        dated = {Payment: {}, Subscription: {}}
+        subscriptions = []
+        payments = []
+        sessions = []
+        for user in users:
+            plan = rng.choice(plans)
+            subscriptions.append(Subscription(user=user, plan=plan, status=rng.choices(
+                ('active', 'canceled', 'trial'), weights=(70, 25, 5))[0]))
+            for _ in range(options['payments_per_user']):
+                payments.append(Payment(user=user, plan=plan, amount=plan.price, status=rng.choices(
+                    ('paid', 'pending', 'failed'), weights=(90, 4, 6))[0]))
+            for _ in range(options['sessions_per_user']):
+                login_time = now - timedelta(days=rng.randrange(days), minutes=rng.randrange(24 * 60))
+                duration = rng.randint(5, 180)
+                # ~2% of sessions were never closed
+                is_open = rng.random() < 0.02
+                sessions.append(UserSession(
+                    user=user,
+                    login_time=login_time,
+                    logout_time=None if is_open else login_time + timedelta(minutes=duration),
+                    duration_minutes=0 if is_open else duration,
+                ))
+
+        for model, rows in ((Subscription, subscriptions), (Payment, payments)):
+            for row in model.objects.bulk_create(rows, batch_size=batch_size):
+                dated[model].setdefault(rng.randrange(days), []).append(row.pk)
+        UserSession.objects.bulk_create(sessions, batch_size=batch_size)
+
+        date_field = {Payment: 'payment_date', Subscription: 'start_date'}
+        for model, by_day in dated.items():
+            for day, ids in by_day.items():
+                for start in range(0, len(ids), batch_size):
+                    model.objects.filter(pk__in=ids[start:start + batch_size]).update(
+                        **{date_field[model]: now - timedelta(days=day)})
+
+        # bulk_create skips the post_save that gives each user a payment stats row and keeps it current
+        refresh_payment_stats(user.id for user in users)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Seeded {len(users)} users, {len(subscriptions)} subscriptions, {len(payments)} payments '
+            f'and {len(sessions)} sessions in {time.monotonic() - started:.1f}s'
+        ))
+
+    @staticmethod
+    def analyze():
+        """Refresh planner statistics so the plans reflect the seeded volume"""
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            return
+        with connection.cursor() as cursor:
+            for model in (Payment, Subscription, UserSession):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    @staticmethod
+    def context(rng):
+        # The user with the most sessions is the worst case for per-user lookups
+        top = (UserSession.objects.order_by().values('user')
+               .annotate(count=Count('id')).order_by('-count').first())
+        return {
+            'now': timezone.now(),
+            'user': User.objects.get(pk=top['user']) if top else rng.choice(list(User.objects.all()[:100])),
+            'plan': Plan.objects.order_by('id').first(),
+        }
+
+    def run_shapes(self, ctx, repeat):
+        timings = {}
+        for name, build in QUERY_SHAPES:
+            queryset = build(ctx)
+            plan = queryset.explain()
+            samples = []
+            for _ in range(max(repeat, 1)):
+                started = time.perf_counter()
+                list(build(ctx))
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(samples)
+
+            self.stdout.write(f'{name}: {timings[name]:.2f} ms (median of {len(samples)})')
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+        return timings
+
+    def summary(self, with_indexes, without_indexes):
+        self.stdout.write(self.style.MIGRATE_HEADING('Summary (median ms)'))
+        width = max(len(name) for name, _ in QUERY_SHAPES)
+        self.stdout.write(f"{'query'.ljust(width)}  {'without':>9}  {'with':>9}  {'speedup':>8}")
+        for name, _ in QUERY_SHAPES:
+            before, after = without_indexes[name], with_indexes[name]
+            speedup = f'{before / after:.1f}x' if after else '-'
+            self.stdout.write(f'{name.ljust(width)}  {before:>9.2f}  {after:>9.2f}  {speedup:>8}')
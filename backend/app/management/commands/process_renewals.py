@@ -0,0 +1,69 @@
+"""
+Management command to charge or expire due subscription renewals
+Usage: python manage.py process_renewals [--batch-size 200] [--concurrency 8] [--limit N] [--watch]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.renewals import demo_charger, process_due_renewals, stripe_charger
+from app.stripe_client import get_stripe_gateway
+from app.views import _get_stripe_secret_key, _is_demo_mode
+
+
+class Command(BaseCommand):
+    help = 'Renew due subscriptions in batches (charging through Stripe, or locally in demo mode)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'RENEWAL_BATCH_SIZE', 200),
+            help='Subscriptions claimed per batch'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'RENEWAL_CONCURRENCY', 8),
+            help='Charges in flight at once'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Stop after this many subscriptions per run'
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep running, processing due renewals every RENEWAL_INTERVAL seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=getattr(settings, 'RENEWAL_INTERVAL', 60),
+            help='Seconds between runs with --watch'
+        )
+
+    def handle(self, *args, **options):
+        secret_key = _get_stripe_secret_key()
+        if _is_demo_mode(secret_key):
+            self.stdout.write(self.style.NOTICE('- Demo mode: renewals are charged by the local stub'))
+            charger = demo_charger
+        else:
+            charger = stripe_charger(get_stripe_gateway(secret_key))
+
+        while True:
+            started = time.monotonic()
+            counts = process_due_renewals(charger, options['batch_size'], options['concurrency'], options['limit'])
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Renewed {counts['renewed']}, expired {counts['expired']}, past due {counts['past_due']}, "
+                f"skipped {counts['skipped']} subscriptions in {time.monotonic() - started:.1f}s"
+            ))
+            if not options['watch']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+"""
+Management command to recover report jobs lost by a restart
+Usage: python manage.py process_report_jobs [--stale-after 900]
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.reports import recover_report_jobs
+
+
+class Command(BaseCommand):
+    help = 'Rerun report jobs left pending and fail jobs left running by a stopped worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=getattr(settings, 'REPORT_JOB_TIMEOUT', 900),
+            help='Seconds after which a pending job is requeued and a running job is failed'
+        )
+
+    def handle(self, *args, **options):
+        # Requeued jobs are rendered here, not on a web worker
+        counts = recover_report_jobs(options['stale_after'], inline=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Requeued {counts['requeued']} and failed {counts['failed']} report jobs"
+        ))
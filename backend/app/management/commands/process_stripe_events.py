@@ -0,0 +1,31 @@
+"""
+Management command to process stored Stripe webhook events
+Usage: python manage.py process_stripe_events [--limit 100] [--stale-after 300]
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.stripe_webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Process Stripe webhook events left pending, failed or stuck processing in the inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100,
+            help='Maximum number of events to process'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=getattr(settings, 'STRIPE_EVENT_CLAIM_TIMEOUT', 300),
+            help='Seconds after which an event still processing is reclaimed'
+        )
+
+    def handle(self, *args, **options):
+        processed = process_pending_events(options['limit'], options['stale_after'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Processed {processed} Stripe events'))
@@ -0,0 +1,175 @@
+"""
+Management command to seed demo data for the admin dashboard
+Usage: python manage.py seed_demo_data [--users 5] [--days 30] [--max-sessions-per-day 5]
+"""
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from app.ledger import ensure_payment_stats
+from app.models import Cost, Plan, User, UserSession
+from app.signals import invalidate_snapshot
+
+
+# Monthly server cost per plan, matched on the plan name
+PLAN_SERVER_COSTS = (
+    ('premium', Decimal('100.00')),
+    ('pro', Decimal('50.00')),
+)
+DEFAULT_PLAN_SERVER_COST = Decimal('25.00')
+
+GENERAL_COSTS = [
+    {'description': 'Supabase Database Service', 'amount': Decimal('25.00'), 'category': 'supabase'},
+    {'description': 'CDN & Load Balancer', 'amount': Decimal('15.50'), 'category': 'cdn'},
+    {'description': 'SSL Certificates & Security', 'amount': Decimal('12.00'), 'category': 'hosting'},
+    {'description': 'Docker Registry & Monitoring', 'amount': Decimal('8.99'), 'category': 'docker'},
+]
+
+
+def plan_server_cost(plan):
+    """Demo monthly server cost for a plan (Premium=100, Pro=50, anything else=25)"""
+    plan_name = plan.name.lower()
+    for keyword, amount in PLAN_SERVER_COSTS:
+        if keyword in plan_name:
+            return amount
+    return DEFAULT_PLAN_SERVER_COST
+
+
+class Command(BaseCommand):
+    help = 'Seed demo user sessions and hosting costs using bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=5,
+            help='Number of users to generate sessions for (demo users are created if needed)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Number of days of session history to generate'
+        )
+        parser.add_argument(
+            '--max-sessions-per-day',
+            type=int,
+            default=5,
+            help='Upper bound for sessions generated per day'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT statement'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for reproducible data'
+        )
+        parser.add_argument(
+            '--skip-sessions',
+            action='store_true',
+            help='Do not generate user sessions'
+        )
+        parser.add_argument(
+            '--skip-costs',
+            action='store_true',
+            help='Do not generate hosting costs'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Seed even if the tables already contain data'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            if not options['skip_sessions']:
+                if UserSession.objects.exists() and not options['force']:
+                    self.stdout.write(self.style.NOTICE('- Skipped sessions (table already has data, use --force)'))
+                else:
+                    users = self.ensure_users(options['users'], batch_size)
+                    created = self.seed_sessions(
+                        rng, users, options['days'], options['max_sessions_per_day'], batch_size
+                    )
+                    self.stdout.write(self.style.SUCCESS(f'✓ Created {created} user sessions'))
+
+            if not options['skip_costs']:
+                if Cost.objects.exists() and not options['force']:
+                    self.stdout.write(self.style.NOTICE('- Skipped costs (table already has data, use --force)'))
+                else:
+                    created = self.seed_costs(batch_size)
+                    self.stdout.write(self.style.SUCCESS(f'✓ Created {created} hosting costs'))
+
+    def ensure_users(self, count, batch_size):
+        """Return `count` users, creating demo accounts for the missing ones"""
+        users = list(User.objects.order_by('date_joined')[:count])
+        missing = count - len(users)
+        if missing > 0:
+            new_users = []
+            for i in range(missing):
+                user = User(email=f'demo{len(users) + i + 1}@playatac.local', role='user')
+                user.set_unusable_password()
+                new_users.append(user)
+            User.objects.bulk_create(new_users, batch_size=batch_size, ignore_conflicts=True)
+            users = list(User.objects.order_by('date_joined')[:count])
+            # bulk_create skips the post_save that gives each user a payment stats row
+            ensure_payment_stats(user.id for user in users)
+            self.stdout.write(self.style.SUCCESS(f'✓ Created {missing} demo users'))
+        return users
+
+    def seed_sessions(self, rng, users, days, max_sessions_per_day, batch_size):
+        if not users or max_sessions_per_day < 1:
+            return 0
+
+        now = timezone.now()
+        sessions = []
+        for day_offset in range(days):
+            day = now - timedelta(days=day_offset)
+
+            # Random number of sessions per day
+            num_sessions = rng.randint(1, min(max_sessions_per_day, len(users)))
+            for user in rng.sample(users, num_sessions):
+                # Random login time during the day and duration (15-180 minutes)
+                login_time = day.replace(hour=rng.randint(8, 20), minute=rng.randint(0, 59),
+                                         second=0, microsecond=0)
+                duration = rng.randint(15, 180)
+                sessions.append(UserSession(
+                    user=user,
+                    login_time=login_time,
+                    logout_time=login_time + timedelta(minutes=duration),
+                    duration_minutes=duration,
+                    ip_address='127.0.0.1'
+                ))
+
+        UserSession.objects.bulk_create(sessions, batch_size=batch_size)
+        return len(sessions)
+
+    def seed_costs(self, batch_size):
+        costs = [
+            Cost(
+                description=f'Server Infrastructure for {plan.name} Plan',
+                amount=plan_server_cost(plan),
+                category='hosting',
+                currency='EUR',
+                plan=plan
+            )
+            for plan in Plan.objects.all()
+        ]
+        costs.extend(Cost(currency='EUR', **general_cost) for general_cost in GENERAL_COSTS)
+
+        Cost.objects.bulk_create(costs, batch_size=batch_size)
+        # bulk_create skips post_save, so drop the cached dashboard figures once the seed commits
+        transaction.on_commit(invalidate_snapshot)
+        return len(costs)
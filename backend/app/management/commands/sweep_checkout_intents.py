@@ -0,0 +1,39 @@
+"""
+Management command to cancel abandoned checkout PaymentIntents
+Usage: python manage.py sweep_checkout_intents [--batch-size 100] [--limit 1000]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.checkout import sweep_stale_intents
+from app.stripe_client import get_stripe_gateway
+from app.views import _get_stripe_secret_key, _is_demo_mode
+
+
+class Command(BaseCommand):
+    help = 'Cancel open checkout PaymentIntents older than CHECKOUT_INTENT_TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Intents claimed and cancelled per batch'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Stop after this many intents'
+        )
+
+    def handle(self, *args, **options):
+        secret_key = _get_stripe_secret_key()
+        if _is_demo_mode(secret_key):
+            raise CommandError('STRIPE_SECRET_KEY is not configured')
+
+        counts = sweep_stale_intents(get_stripe_gateway(secret_key), options['batch_size'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Canceled {counts['canceled']} intents "
+            f"({counts['succeeded']} had already succeeded, {counts['reopened']} left for the next sweep)"
+        ))
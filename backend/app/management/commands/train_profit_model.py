@@ -15,7 +15,8 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, r2_score
 import joblib
 import os
-from app.models import Payment, Subscription, Cost, Plan, UserSession
+from app.analytics import daily_cost_series
+from app.models import Payment, Subscription, Plan, UserSession
 
 
 class Command(BaseCommand):
@@ -90,6 +91,9 @@ class Command(BaseCommand):
             date = payment.payment_date.date()
             dates.add(date)
         
+        # Amortized costs for the whole history in one query
+        daily_costs = dict(daily_cost_series(min(dates), max(dates))) if dates else {}
+
         for date in sorted(dates):
             # Get payments for this date
             day_start = timezone.datetime.combine(date, timezone.datetime.min.time())
@@ -111,9 +115,7 @@ class Command(BaseCommand):
             ).count()
             
             # Calculate costs (daily portion)
-            from django.db.models import Sum as DjangoSum
-            total_costs = Cost.objects.all().aggregate(total=DjangoSum('amount'))
-            daily_cost = float(total_costs.get('total') or 0) / 30  # Approximate daily cost
+            daily_cost = daily_costs.get(date, 0)
             
             # Calculate user activity
             sessions = UserSession.objects.filter(
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_reportjob_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cost',
+            name='period_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cost',
+            name='period_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cost',
+            name='recurrence',
+            field=models.CharField(choices=[('one_time', 'One time'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], default='monthly', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='cost',
+            index=models.Index(fields=['date'], name='app_cost_date_89de79_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cost',
+            index=models.Index(fields=['plan', 'date'], name='app_cost_plan_id_ff2a43_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:36
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_payments(apps, schema_editor):
+    """Keep one row per transaction id (the earliest paid one) before adding the constraint"""
+    Payment = apps.get_model('app', 'Payment')
+    duplicated = (
+        Payment.objects.exclude(transaction_id='')
+        .values('transaction_id').annotate(rows=Count('id')).filter(rows__gt=1)
+        .values_list('transaction_id', flat=True)
+    )
+    for transaction_id in duplicated:
+        rows = list(Payment.objects.filter(transaction_id=transaction_id).order_by('id'))
+        keep = next((row for row in rows if row.status == 'paid'), rows[0])
+        Payment.objects.filter(transaction_id=transaction_id).exclude(id=keep.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_stripeevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_payments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('transaction_id', ''), _negated=True), fields=('transaction_id',), name='unique_payment_transaction_id'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_payment_unique_transaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutIntent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_intent_id', models.CharField(max_length=255, unique=True)),
+                ('client_secret', models.CharField(max_length=255)),
+                ('user_email', models.EmailField(max_length=254)),
+                ('amount', models.PositiveIntegerField()),
+                ('currency', models.CharField(max_length=5)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('succeeded', 'Succeeded'), ('canceled', 'Canceled')], default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_intents', to='app.plan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='app_checkou_status_111956_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'open')), fields=('user_email', 'plan', 'amount', 'currency'), name='unique_open_checkout_intent')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:43
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def cancel_duplicate_active_subscriptions(apps, schema_editor):
+    """Keep each user's most recent active subscription and cancel the older ones"""
+    Subscription = apps.get_model('app', 'Subscription')
+    duplicated = (
+        Subscription.objects.filter(status='active')
+        .values('user').annotate(rows=Count('id')).filter(rows__gt=1)
+        .values_list('user', flat=True)
+    )
+    now = timezone.now()
+    for user_id in duplicated:
+        active = Subscription.objects.filter(user_id=user_id, status='active')
+        keep = active.order_by('-start_date', '-id').first()
+        active.exclude(id=keep.id).update(status='canceled', end_date=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_active_subscriptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('user',), name='one_active_subscription_per_user'),
+        ),
+    ]
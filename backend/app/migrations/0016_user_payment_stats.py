@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:50
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_payment_stats(apps, schema_editor):
+    """One stats row per existing user, totals computed with a single UPDATE"""
+    User = apps.get_model('app', 'User')
+    Payment = apps.get_model('app', 'Payment')
+    UserPaymentStats = apps.get_model('app', 'UserPaymentStats')
+
+    batch = []
+    for user_id in User.objects.values_list('id', flat=True).iterator(chunk_size=2000):
+        batch.append(UserPaymentStats(user_id=user_id))
+        if len(batch) == 2000:
+            UserPaymentStats.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    UserPaymentStats.objects.bulk_create(batch, ignore_conflicts=True)
+
+    paid = Payment.objects.filter(user=OuterRef('user_id'), status='paid').order_by().values('user')
+    UserPaymentStats.objects.update(
+        total_paid=Coalesce(Subquery(paid.annotate(total=Sum('amount')).values('total')),
+                            Value(Decimal('0')), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        payment_count=Coalesce(Subquery(paid.annotate(count=Count('id')).values('count')), Value(0)),
+        first_payment_at=Subquery(paid.annotate(first=Min('payment_date')).values('first')),
+        last_payment_at=Subquery(paid.annotate(last=Max('payment_date')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_one_active_subscription'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPaymentStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payment_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('first_payment_at', models.DateTimeField(blank=True, null=True)),
+                ('last_payment_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-total_paid', '-user'], name='payment_stats_ltv_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_payment_stats, migrations.RunPython.noop),
+    ]
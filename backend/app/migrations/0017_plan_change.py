@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_plan_change_payments(apps, schema_editor):
+    """Turn the zero-amount 'plan_change' Payment rows into PlanChange events and drop them"""
+    Payment = apps.get_model('app', 'Payment')
+    PlanChange = apps.get_model('app', 'PlanChange')
+    Subscription = apps.get_model('app', 'Subscription')
+
+    fake = Payment.objects.filter(status='plan_change')
+    subscription_ids = set(Subscription.objects.values_list('id', flat=True))
+    events = []
+    dates = []
+    for payment in fake.order_by('id').iterator(chunk_size=2000):
+        # transaction_id was plan_change_<subscription id>_<timestamp>; the old plan was never stored
+        parts = payment.transaction_id.split('_')
+        subscription_id = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
+        events.append(PlanChange(
+            user_id=payment.user_id,
+            subscription_id=subscription_id if subscription_id in subscription_ids else None,
+            to_plan_id=payment.plan_id,
+            currency=payment.currency,
+        ))
+        dates.append(payment.payment_date)
+    created = PlanChange.objects.bulk_create(events, batch_size=2000)
+    # changed_at is auto_now_add, so the original dates are carried over afterwards
+    for event, changed_at in zip(created, dates):
+        event.changed_at = changed_at
+    PlanChange.objects.bulk_update(created, ['changed_at'], batch_size=2000)
+    fake.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_user_payment_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('proration_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('currency', models.CharField(default='EUR', max_length=5)),
+                ('remaining_fraction', models.DecimalField(decimal_places=6, default=0, max_digits=7)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('from_plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.plan')),
+                ('subscription', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='plan_changes', to='app.subscription')),
+                ('to_plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.plan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-changed_at'], name='plan_change_user_idx')],
+            },
+        ),
+        migrations.RunPython(move_plan_change_payments, migrations.RunPython.noop),
+    ]
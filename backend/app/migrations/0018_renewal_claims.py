@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_plan_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='renewal_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='stripe_customer_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='status',
+            field=models.CharField(choices=[('active', 'Active'), ('canceled', 'Canceled'), ('trial', 'Trial'), ('past_due', 'Past due')], default='active', max_length=20),
+        ),
+    ]
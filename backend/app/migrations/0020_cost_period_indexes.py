@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_stripeevent_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cost',
+            index=models.Index(fields=['period_start', 'period_end'], name='cost_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cost',
+            index=models.Index(fields=['plan', 'period_start', 'period_end'], name='cost_plan_period_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 import uuid # 👈 Import nou pentru UUID
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 # Am schimbat AbstractUser cu AbstractBaseUser și PermissionsMixin
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager 
@@ -49,12 +50,20 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(default=timezone.now)
+    # Customer Stripe: cardul salvat la checkout e folosit la reinnoiri (off-session)
+    stripe_customer_id = models.CharField(max_length=255, blank=True)
 
     objects = CustomUserManager() # 👈 Folosim managerul nostru custom
 
     USERNAME_FIELD = 'email' # 👈 Login se face cu email
     REQUIRED_FIELDS = [] # 👈 Nu mai cerem alte câmpuri obligatorii la creare
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the admin user list
+            models.Index(fields=['-date_joined', '-id'], name='user_date_joined_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.email} ({self.role})"
 
@@ -81,6 +90,7 @@ class Subscription(models.Model):
         ("active", "Active"),
         ("canceled", "Canceled"),
         ("trial", "Trial"),
+        ("past_due", "Past due"),  # reinnoire fara card salvat; asteapta un checkout nou
     )
     # FK catre noul nostru User model
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="subscriptions")
@@ -89,6 +99,22 @@ class Subscription(models.Model):
     start_date = models.DateTimeField(auto_now_add=True)
     renewal_date = models.DateTimeField(null=True, blank=True)  # când trebuie plătit din nou
     end_date = models.DateTimeField(null=True, blank=True)
+    # Set while a renewal scheduler is charging this row outside its row lock
+    renewal_claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Un singur abonament activ per user; also serves the active-subscription point lookup
+            models.UniqueConstraint(fields=['user'], condition=models.Q(status='active'),
+                                    name='one_active_subscription_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'status', '-start_date'], name='subscription_user_status_idx'),
+            models.Index(fields=['plan', 'status', 'start_date'], name='subscription_plan_status_idx'),
+            # Doar abonamentele active: dashboard counts and renewals never look at the rest
+            models.Index(fields=['start_date'], condition=models.Q(status='active'),
+                         name='subscription_active_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.plan.name} ({self.status})"
@@ -112,6 +138,17 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="paid")
     transaction_id = models.CharField(max_length=100, blank=True)  # primit de la Stripe/alt procesator
 
+    class Meta:
+        constraints = [
+            # One row per processor transaction; manual payments may leave it blank
+            models.UniqueConstraint(fields=['transaction_id'], condition=~models.Q(transaction_id=''),
+                                    name='unique_payment_transaction_id'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'payment_date'], name='payment_status_date_idx'),
+            models.Index(fields=['user', '-payment_date'], name='payment_user_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.email} - {self.amount}{self.currency} ({self.status})"
 
@@ -120,12 +157,41 @@ class Payment(models.Model):
 # 5. COSTS (Admin only) - Enhanced for plan-specific costs
 # ======================
 class Cost(models.Model):
+    RECURRENCE_CHOICES = (
+        ("one_time", "One time"),
+        ("monthly", "Monthly"),
+        ("yearly", "Yearly"),
+    )
     description = models.CharField(max_length=255)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=5, default="EUR")
     date = models.DateTimeField(auto_now_add=True)
     category = models.CharField(max_length=50, blank=True)  # hosting, database, cdn, docker, supabase, etc.
     plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name="costs", null=True, blank=True)  # Optional: cost specific to a plan
+    # Perioada de facturare: recurring costs without a start apply to all history, open-ended without an end
+    recurrence = models.CharField(max_length=20, choices=RECURRENCE_CHOICES, default="monthly")
+    period_start = models.DateField(null=True, blank=True)
+    period_end = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['plan', 'date']),
+            # Daily cost series: costs whose billing period overlaps the window
+            models.Index(fields=['period_start', 'period_end'], name='cost_period_idx'),
+            models.Index(fields=['plan', 'period_start', 'period_end'], name='cost_plan_period_idx'),
+        ]
+
+    def apply_default_period(self):
+        """A one-time cost without a period is charged on the day it is recorded"""
+        if self.recurrence == "one_time" and self.period_start is None:
+            self.period_start = timezone.localtime(self.date).date() if self.date else timezone.localdate()
+        if self.recurrence == "one_time" and self.period_end is None:
+            self.period_end = self.period_start
+
+    def save(self, *args, **kwargs):
+        self.apply_default_period()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         plan_name = f" ({self.plan.name})" if self.plan else ""
@@ -145,6 +211,12 @@ class UserSession(models.Model):
     
     class Meta:
         ordering = ['-login_time']
+        indexes = [
+            models.Index(fields=['login_time'], name='session_login_time_idx'),
+            # Sesiuni deschise: logout looks up the user's latest session without a logout_time
+            models.Index(fields=['user', '-login_time'], condition=models.Q(logout_time__isnull=True),
+                         name='session_open_user_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.duration_minutes}min on {self.login_time.date()}"
@@ -226,4 +298,168 @@ class Friendship(models.Model):
         return cls.objects.filter(
             friend=user,
             status='pending'
-        ).select_related('user')
\ No newline at end of file
+        ).select_related('user')
+
+# ======================
+# 9. REPORT JOBS
+# ======================
+class ReportJob(models.Model):
+    """Background PDF report generation tracked by id"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file_path = models.CharField(max_length=500, blank=True)
+    file_name = models.CharField(max_length=255, blank=True)
+    file_size = models.PositiveIntegerField(default=0)
+    detailed = models.BooleanField(default=False)
+    period_start = models.DateField(null=True, blank=True)
+    period_end = models.DateField(null=True, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    pages = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Report {self.id} ({self.status})'
+
+
+# ======================
+# 10. IDEMPOTENCY KEYS
+# ======================
+class IdempotencyKey(models.Model):
+    """Stored result of a mutating request so client retries replay it instead of writing twice"""
+    scope = models.CharField(max_length=50)  # endpoint, ex. costs.bulk
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key_per_scope'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.key}'
+
+
+# ======================
+# 11. STRIPE WEBHOOK INBOX
+# ======================
+class StripeEvent(models.Model):
+    """Verified Stripe webhook event, stored before processing so none is lost or handled twice"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    )
+    id = models.CharField(max_length=255, primary_key=True)  # evt_... de la Stripe, dedup pe el
+    type = models.CharField(max_length=100)
+    livemode = models.BooleanField(default=False)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # cand a intrat in 'processing'
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.id} {self.type} ({self.status})'
+
+
+# ======================
+# 12. CHECKOUT INTENTS
+# ======================
+class CheckoutIntent(models.Model):
+    """Open Stripe PaymentIntent reused while the same user checks out the same plan and amount"""
+    STATUS_CHOICES = (
+        ('open', 'Open'),
+        ('succeeded', 'Succeeded'),
+        ('canceled', 'Canceled'),
+    )
+    payment_intent_id = models.CharField(max_length=255, unique=True)
+    client_secret = models.CharField(max_length=255)
+    user_email = models.EmailField()
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name="checkout_intents")
+    amount = models.PositiveIntegerField()  # in cents, as sent to Stripe
+    currency = models.CharField(max_length=5)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_email', 'plan', 'amount', 'currency'],
+                                    condition=models.Q(status='open'), name='unique_open_checkout_intent'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.payment_intent_id} {self.user_email} ({self.status})'
+
+
+# ======================
+# 13. PAYMENT LEDGER (agregate per user)
+# ======================
+class UserPaymentStats(models.Model):
+    """Running totals of a user's paid payments, kept in step with Payment by app.ledger"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="payment_stats")
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payment_count = models.PositiveIntegerField(default=0)
+    first_payment_at = models.DateTimeField(null=True, blank=True)
+    last_payment_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_paid', '-user'], name='payment_stats_ltv_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.total_paid} over {self.payment_count} payments"
+
+
+# ======================
+# 14. PLAN CHANGES (istoric schimbari de plan)
+# ======================
+class PlanChange(models.Model):
+    """A switch of an active subscription to another plan, with the proration it implies"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="plan_changes")
+    subscription = models.ForeignKey(Subscription, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name="plan_changes")
+    from_plan = models.ForeignKey(Plan, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    to_plan = models.ForeignKey(Plan, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # Pozitiv = de plata la upgrade, negativ = credit la downgrade
+    proration_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    currency = models.CharField(max_length=5, default="EUR")
+    remaining_fraction = models.DecimalField(max_digits=7, decimal_places=6, default=0)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-changed_at'], name='plan_change_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.from_plan_id} -> {self.to_plan_id} ({self.proration_amount}{self.currency})"
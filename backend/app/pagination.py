@@ -0,0 +1,97 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are selected with `WHERE (key1, key2) < (last key1, last key2)` on an
+indexed ordering instead of OFFSET, so fetching page 1000 costs the same as
+page 1. Cursors are opaque base64 tokens holding the last row's keys.
+"""
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Filtered counts stop here; the response then says the count is a lower bound
+COUNT_LIMIT = 10000
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the list of key values in a cursor, raising ValueError if it is malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def parse_limit(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Read ?limit=, raising ValueError outside 1..maximum"""
+    if raw in (None, ''):
+        return default
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError("'limit' must be an integer")
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"'limit' must be between 1 and {maximum}")
+    return limit
+
+
+def after_cursor(queryset, keys, cursor, descending=True):
+    """Filter `queryset` to the rows strictly after `cursor` in (keys) order"""
+    values = decode_cursor(cursor)
+    if len(values) != len(keys):
+        raise ValueError('Invalid cursor')
+    op = 'lt' if descending else 'gt'
+    condition = Q()
+    # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+    for i, key in enumerate(keys):
+        equal = {keys[j]: values[j] for j in range(i)}
+        condition |= Q(**equal, **{f'{key}__{op}': values[i]})
+    return queryset.filter(condition)
+
+
+def keyset_page(queryset, keys, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=True):
+    """Return (rows, next_cursor) for one page of a values() queryset ordered by `keys`.
+
+    The rows must include every key column. One extra row is fetched to
+    know whether another page exists.
+    """
+    ordering = [f'-{key}' if descending else key for key in keys]
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = after_cursor(queryset, keys, cursor, descending)
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][key] for key in keys])
+    return rows, next_cursor
+
+
+def approximate_count(queryset, filtered):
+    """Return (count, is_exact) without scanning big tables.
+
+    Unfiltered PostgreSQL tables use the planner's row estimate from
+    pg_class; anything else is counted up to COUNT_LIMIT.
+    """
+    if not filtered and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 / 0 means the table was never analyzed
+        if row and row[0] > 0:
+            return int(row[0]), False
+    count = queryset.order_by()[:COUNT_LIMIT + 1].count()
+    return min(count, COUNT_LIMIT), count <= COUNT_LIMIT
@@ -0,0 +1,120 @@
+"""
+Payment confirmation shared by the browser confirm endpoint and Stripe webhooks.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from app.checkout import mark_checkout_intent
+from app.models import Payment, Subscription, User
+
+
+SUBSCRIPTION_PERIOD = timedelta(days=30)  # Monthly subscription
+
+
+def _lock_user(email):
+    """Return the user row locked FOR UPDATE, creating the account if needed"""
+    try:
+        return User.objects.select_for_update().get(email=email)
+    except User.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            User.objects.create_user(email=email, role='user')
+    except IntegrityError:
+        pass  # Created concurrently by another confirmation
+    return User.objects.select_for_update().get(email=email)
+
+
+def active_subscription(user, for_update=False):
+    """Return the user's active subscription with its plan, or None.
+
+    The one_active_subscription_per_user constraint guarantees at most one
+    row, so this is a point lookup on the partial unique index.
+    """
+    subscriptions = Subscription.objects.select_related('plan')
+    if for_update:
+        subscriptions = subscriptions.select_for_update(of=('self',))
+    return subscriptions.filter(user=user, status='active').first()
+
+
+def swap_active_subscription(user, plan, renewal_date=None):
+    """Close the user's active subscription and open a new one on `plan`.
+
+    Both statements run in one savepoint. If a concurrent swap committed an
+    active row after our UPDATE ran, the partial unique constraint rejects
+    the INSERT and the swap is retried once against the new row.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+                # A past_due row is superseded by the new checkout too
+                Subscription.objects.filter(user=user, status__in=['active', 'past_due']).update(
+                    status='canceled', end_date=now)
+                return Subscription.objects.create(
+                    user=user,
+                    plan=plan,
+                    status='active',
+                    renewal_date=renewal_date or now + SUBSCRIPTION_PERIOD
+                )
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def _existing(transaction_id):
+    payment = Payment.objects.filter(transaction_id=transaction_id, status='paid').select_related('user').first()
+    if payment is None:
+        return None
+    return payment, active_subscription(payment.user), False
+
+
+def activate_paid_plan(user_email, plan, amount=None, currency=None, transaction_id=''):
+    """Record a paid payment and make `plan` the user's only active subscription.
+
+    Runs in one transaction with the user row locked, so concurrent
+    confirmations for the same user are serialized. Returns
+    (payment, subscription, created); a transaction id that is already
+    recorded as paid returns the existing payment with created=False
+    (the unique constraint on Payment.transaction_id backs this up).
+    """
+    if transaction_id:
+        existing = _existing(transaction_id)
+        if existing is not None:
+            return existing
+
+    with transaction.atomic():
+        user = _lock_user(user_email)
+        if transaction_id:
+            # Re-check under the lock: a concurrent request may have just committed it
+            existing = _existing(transaction_id)
+            if existing is not None:
+                return existing
+
+        # A failed attempt on the same payment intent becomes the paid record
+        payment = Payment.objects.filter(transaction_id=transaction_id).first() if transaction_id else None
+        if payment is None:
+            payment = Payment(transaction_id=transaction_id)
+        payment.user = user
+        payment.plan = plan
+        payment.amount = Decimal(str(amount)) if amount not in (None, "") else Decimal(plan.price)
+        payment.currency = (currency or plan.currency or 'EUR').upper()
+        payment.status = 'paid'
+        try:
+            with transaction.atomic():
+                payment.save()
+        except IntegrityError:
+            # Same transaction id recorded by a path that does not lock this user (e.g. another email)
+            existing = _existing(transaction_id)
+            if existing is None:
+                raise
+            return existing
+
+        subscription = swap_active_subscription(user, plan)
+        if transaction_id:
+            # Paid intents must not be handed out again or swept
+            mark_checkout_intent(transaction_id, 'succeeded')
+    return payment, subscription, True
@@ -0,0 +1,66 @@
+"""
+Plan changes.
+
+Switching plans keeps the subscription and its renewal date and records a
+PlanChange event with the proration for the rest of the current period:
+(new price - old price) * remaining / period, positive when the user owes
+the difference and negative when they are owed a credit. The subscription
+row is locked, re-read, swapped and the event written in one transaction.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from app.models import PlanChange
+from app.payments import SUBSCRIPTION_PERIOD, active_subscription
+
+
+CENT = Decimal('0.01')
+
+
+class PlanChangeError(Exception):
+    """The change cannot be made; the message is safe to show to the user"""
+
+
+class NoActiveSubscription(PlanChangeError):
+    pass
+
+
+def remaining_fraction(renewal_date, now=None):
+    """Share of the current period still ahead, clamped to [0, 1]"""
+    if renewal_date is None:
+        return Decimal('0')
+    now = now or timezone.now()
+    remaining = Decimal((renewal_date - now).total_seconds()) / Decimal(SUBSCRIPTION_PERIOD.total_seconds())
+    return min(max(remaining, Decimal('0')), Decimal('1')).quantize(Decimal('0.000001'))
+
+
+def prorate(from_price, to_price, fraction):
+    return ((Decimal(to_price) - Decimal(from_price)) * fraction).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def change_plan(user, new_plan, now=None):
+    """Move the user's active subscription to `new_plan` and return the PlanChange"""
+    with transaction.atomic():
+        subscription = active_subscription(user, for_update=True)
+        if subscription is None:
+            raise NoActiveSubscription('No active subscription found')
+        old_plan = subscription.plan
+        if old_plan.id == new_plan.id:
+            raise PlanChangeError(f'Already subscribed to {new_plan.name}')
+        if old_plan.currency.upper() != new_plan.currency.upper():
+            raise PlanChangeError('Cannot switch between plans billed in different currencies')
+
+        fraction = remaining_fraction(subscription.renewal_date, now)
+        subscription.plan = new_plan
+        subscription.save(update_fields=['plan'])
+        return PlanChange.objects.create(
+            user=user,
+            subscription=subscription,
+            from_plan=old_plan,
+            to_plan=new_plan,
+            proration_amount=prorate(old_plan.price, new_plan.price, fraction),
+            currency=new_plan.currency.upper(),
+            remaining_fraction=fraction,
+        )
@@ -0,0 +1,224 @@
+"""
+Subscription renewals.
+
+Due subscriptions (active, renewal_date <= now) are claimed in keyset-ordered
+batches: a short transaction locks the rows with SELECT ... FOR UPDATE SKIP
+LOCKED and stamps renewal_claimed_at, so several schedulers can run side by
+side without charging anyone twice. The charges then run on a small thread
+pool with no row locks or transaction held, and each batch's outcomes are
+written in a second short transaction with one bulk_create and one
+bulk_update. A claim older than RENEWAL_CLAIM_TIMEOUT (a scheduler that died
+mid-batch) is picked up again; charges use an idempotency key derived from
+the subscription and its renewal date, so the retry replays Stripe's result
+instead of charging again.
+
+Renewals charge the card saved at checkout (setup_future_usage='off_session'
+on the user's Stripe Customer). A subscription with no saved card is not
+expired: it becomes past_due until the user checks out again.
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from app.accounts import invalidate_account_summaries
+from app.ledger import refresh_payment_stats
+from app.models import Payment, Subscription
+from app.pagination import after_cursor, encode_cursor
+from app.payments import SUBSCRIPTION_PERIOD
+from app.signals import invalidate_snapshot
+
+
+RENEWED = 'renewed'
+EXPIRED = 'expired'
+PAST_DUE = 'past_due'
+SKIPPED = 'skipped'
+
+
+class RenewalDeclined(Exception):
+    """The charge was refused; the subscription expires"""
+
+
+class NoSavedPaymentMethod(Exception):
+    """There is no card to charge off-session; the subscription becomes past_due"""
+
+
+def demo_charger(subscription, source):
+    """Local stand-in for Stripe used in demo mode: every renewal succeeds"""
+    return f"pi_demo_renewal_{subscription.id}_{uuid.uuid4().hex[:12]}"
+
+
+def stripe_charger(gateway):
+    """Charge renewals off-session with the payment method of the user's last paid intent"""
+    def charge(subscription, source):
+        if not source or source.startswith(('pi_demo', 'pi_mock')):
+            raise NoSavedPaymentMethod('no Stripe payment to renew from')
+        try:
+            previous = gateway.retrieve_payment_intent(source)
+            payment_method = previous.payment_method
+            customer = previous.customer
+            if not payment_method or not customer:
+                raise NoSavedPaymentMethod(f"payment intent {source} has no saved customer card")
+            plan = subscription.plan
+            intent = gateway.create_payment_intent(
+                amount=int(plan.price * 100),
+                currency=plan.currency.lower(),
+                customer=customer if isinstance(customer, str) else customer.id,
+                payment_method=payment_method if isinstance(payment_method, str) else payment_method.id,
+                off_session=True,
+                confirm=True,
+                metadata={'plan_id': plan.id, 'subscription_id': subscription.id, 'renewal': 'true'},
+                idempotency_key=f"renewal-{subscription.id}-{subscription.renewal_date.timestamp():.0f}",
+            )
+        except (stripe.CardError, stripe.InvalidRequestError) as e:
+            raise RenewalDeclined(str(e))
+        if intent.status != 'succeeded':
+            raise RenewalDeclined(f"payment intent {intent.id} is {intent.status}")
+        return intent.id
+    return charge
+
+
+def _payment_sources(subscriptions):
+    """{user_id: transaction id of the user's latest paid payment} in one query"""
+    user_ids = {subscription.user_id for subscription in subscriptions}
+    sources = {}
+    rows = (
+        Payment.objects.filter(user_id__in=user_ids, status='paid').exclude(transaction_id='')
+        .order_by('user_id', '-payment_date').values_list('user_id', 'transaction_id')
+    )
+    for user_id, transaction_id in rows:
+        sources.setdefault(user_id, transaction_id)
+    return sources
+
+
+def _charge(charger, subscription, source):
+    if subscription.plan.price <= 0:
+        return RENEWED, ''
+    try:
+        return RENEWED, charger(subscription, source)
+    except RenewalDeclined as e:
+        print(f"Renewal of subscription {subscription.id} declined: {str(e)}")
+        return EXPIRED, None
+    except NoSavedPaymentMethod as e:
+        print(f"Renewal of subscription {subscription.id} is past due: {str(e)}")
+        return PAST_DUE, None
+    except stripe.StripeError as e:
+        # Network trouble or Stripe outage: leave it due for the next run
+        print(f"Renewal of subscription {subscription.id} skipped: {str(e)}")
+        return SKIPPED, None
+
+
+def _claim(now, size, keys, cursor):
+    """Lock, stamp and return the next batch of unclaimed due subscriptions"""
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'RENEWAL_CLAIM_TIMEOUT', 600))
+    with transaction.atomic():
+        due = (
+            Subscription.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('plan')
+            .filter(status='active', renewal_date__lte=now)
+            .filter(Q(renewal_claimed_at__isnull=True) | Q(renewal_claimed_at__lt=stale))
+            .order_by(*keys)
+        )
+        if cursor:
+            due = after_cursor(due, keys, cursor, descending=False)
+        batch = list(due[:size])
+        claimed_at = timezone.now()
+        Subscription.objects.filter(id__in=[subscription.id for subscription in batch]).update(
+            renewal_claimed_at=claimed_at)
+    for subscription in batch:
+        subscription.renewal_claimed_at = claimed_at
+    return batch
+
+
+def _record(outcomes, now):
+    """Write a batch's payments and subscription changes with one statement each.
+
+    Rows whose claim was taken over (or that stopped being active) while they
+    were being charged are left to whoever holds them now. Returns the
+    outcomes actually recorded.
+    """
+    with transaction.atomic():
+        held = set(
+            Subscription.objects.select_for_update(of=('self',))
+            .filter(status='active', id__in=[subscription.id for subscription, _ in outcomes],
+                    renewal_claimed_at=outcomes[0][0].renewal_claimed_at)
+            .values_list('id', flat=True)
+        )
+        payments = []
+        changed = []
+        recorded = []
+        for subscription, (outcome, transaction_id) in outcomes:
+            if subscription.id not in held:
+                print(f"Renewal of subscription {subscription.id} ({outcome}) not recorded: claim lost")
+                recorded.append((subscription, (SKIPPED, None)))
+                continue
+            subscription.renewal_claimed_at = None
+            changed.append(subscription)
+            recorded.append((subscription, (outcome, transaction_id)))
+            plan = subscription.plan
+            if outcome == RENEWED:
+                if plan.price > 0:
+                    payments.append(Payment(user_id=subscription.user_id, plan=plan, amount=Decimal(plan.price),
+                                            currency=plan.currency.upper(), status='paid',
+                                            transaction_id=transaction_id))
+                # One charge covers the missed periods too: move past `now` on the same billing anchor,
+                # so a long-overdue row is not claimed (and charged) again later in this run
+                subscription.renewal_date += SUBSCRIPTION_PERIOD
+                while subscription.renewal_date <= now:
+                    subscription.renewal_date += SUBSCRIPTION_PERIOD
+            elif outcome == EXPIRED:
+                payments.append(Payment(user_id=subscription.user_id, plan=plan, amount=Decimal(plan.price),
+                                        currency=plan.currency.upper(), status='failed'))
+                subscription.status = 'canceled'
+                subscription.end_date = subscription.renewal_date
+            elif outcome == PAST_DUE:
+                # Nothing was charged, so no payment row; access stops until the next checkout
+                subscription.status = 'past_due'
+            # SKIPPED: only the claim is released, so the next run retries it
+
+        Payment.objects.bulk_create(payments)
+        Subscription.objects.bulk_update(changed, ['renewal_date', 'status', 'end_date', 'renewal_claimed_at'])
+        # bulk_create skips post_save, so the ledger is recomputed for the batch's payers in one UPDATE
+        refresh_payment_stats(payment.user_id for payment in payments if payment.status == 'paid')
+        user_ids = [subscription.user_id for subscription in changed]
+        if user_ids:
+            transaction.on_commit(lambda: invalidate_account_summaries(user_ids))
+    return recorded
+
+
+def process_due_renewals(charger, batch_size=200, concurrency=8, limit=None, now=None):
+    """Renew, expire or mark past due every due subscription.
+
+    Returns {'renewed', 'expired', 'past_due', 'skipped'} counts.
+    """
+    now = now or timezone.now()
+    counts = {RENEWED: 0, EXPIRED: 0, PAST_DUE: 0, SKIPPED: 0}
+    keys = ['renewal_date', 'id']
+    cursor = None
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix='playatac-renewal') as pool:
+        while limit is None or sum(counts.values()) < limit:
+            size = batch_size if limit is None else min(batch_size, limit - sum(counts.values()))
+            batch = _claim(now, size, keys, cursor)
+            if not batch:
+                break
+            cursor = encode_cursor([batch[-1].renewal_date.isoformat(), batch[-1].id])
+
+            # No transaction or row lock is held while Stripe is called
+            sources = _payment_sources(batch)
+            results = pool.map(lambda s: _charge(charger, s, sources.get(s.user_id)), batch)
+            outcomes = _record(list(zip(batch, results)), now)
+
+            for _, (outcome, _) in outcomes:
+                counts[outcome] += 1
+
+    if counts[RENEWED] or counts[EXPIRED] or counts[PAST_DUE]:
+        # bulk writes skip post_save, so drop the cached dashboard figures once
+        invalidate_snapshot()
+    return counts
@@ -0,0 +1,761 @@
+"""
+Admin dashboard PDF report: data collection, rendering and background jobs.
+
+The report used to be built inside GeneratePDFReportView. It is split into
+`ReportSnapshot` (database reads, shared with the analytics endpoints) and
+`render_report_pdf()` (ReportLab) so it can run either inline or in the
+background report worker pool.
+"""
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from itertools import chain
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import PageBreak, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from app.analytics import day_bounds, fill_daily_gaps, plan_analytics
+from app.models import Cost, Payment, ReportJob, User, UserSession
+from app.workers import submit, submit_after_commit
+
+
+class ReportSnapshot:
+    """Every admin dashboard figure, gathered once in a fixed number of queries.
+
+    Revenue (1 conditional aggregate + 1 TruncDate group for the 30 day
+    chart), users (1 aggregate), plans with revenue, cost and margin computed
+    in SQL (1) and cost rows (1). The revenue, plan and cost endpoints, the PDF report
+    and the JSON/CSV exports all read from the same snapshot, which is cached
+    for REPORT_SNAPSHOT_TTL seconds and dropped whenever costs, plans or
+    payments change.
+    """
+
+    CACHE_KEY = 'report_snapshot'
+    DAILY_CHART_DAYS = 30
+
+    def __init__(self, now=None):
+        self.now = now or timezone.now()
+        self.revenue = {}
+        self.daily_chart = []
+        self.users = {}
+        self.plans = []
+        self.costs = []
+
+    @classmethod
+    def build(cls, now=None):
+        snapshot = cls(now)
+        snapshot._collect_revenue()
+        snapshot._collect_users()
+        snapshot._collect_costs()
+        snapshot._collect_plans()
+        return snapshot
+
+    @classmethod
+    def current(cls):
+        """Return the cached snapshot, building it on a miss"""
+        snapshot = cache.get(cls.CACHE_KEY)
+        if snapshot is None:
+            snapshot = cls.build()
+            cache.set(cls.CACHE_KEY, snapshot, getattr(settings, 'REPORT_SNAPSHOT_TTL', 60))
+        return snapshot
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.CACHE_KEY)
+
+    def _collect_revenue(self):
+        today_start = self.now.replace(hour=0, minute=0, second=0, microsecond=0)
+        week_start = today_start - timedelta(days=7)
+        month_start = self.now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        paid = Payment.objects.filter(status='paid')
+        totals = paid.aggregate(
+            daily=Sum('amount', filter=Q(payment_date__gte=today_start)),
+            weekly=Sum('amount', filter=Q(payment_date__gte=week_start)),
+            monthly=Sum('amount', filter=Q(payment_date__gte=month_start)),
+            total=Sum('amount'),
+        )
+        self.revenue = {period: float(amount or 0) for period, amount in totals.items()}
+
+        chart_start = today_start - timedelta(days=self.DAILY_CHART_DAYS - 1)
+        rows = (
+            paid.filter(payment_date__gte=chart_start)
+            .annotate(day=TruncDate('payment_date'))
+            .values('day')
+            .annotate(amount=Sum('amount'))
+            .order_by('day')
+        )
+        per_day = {row['day']: float(row['amount'] or 0) for row in rows}
+        self.daily_chart = [
+            {'date': day.strftime('%Y-%m-%d'), 'amount': amount}
+            for day, amount in fill_daily_gaps(per_day, chart_start.date(), today_start.date(), default=0.0)
+        ]
+
+    def _collect_users(self):
+        self.users = User.objects.aggregate(
+            total=Count('id'),
+            admins=Count('id', filter=Q(role='admin')),
+        )
+
+    def _collect_costs(self):
+        self.costs = [
+            {
+                'id': cost.id,
+                'description': cost.description,
+                'amount': str(cost.amount),
+                'currency': cost.currency,
+                'date': cost.date,
+                'category': cost.category,
+                'plan_id': cost.plan_id,
+                'recurrence': cost.recurrence,
+                'period_start': cost.period_start,
+                'period_end': cost.period_end
+            }
+            for cost in Cost.objects.order_by('-date')
+        ]
+
+    def _collect_plans(self):
+        self.plans = [
+            {
+                'id': plan.id,
+                'name': plan.name,
+                'price_per_user': float(plan.price),
+                'active_users': plan.active_users,
+                'total_revenue': float(plan.total_revenue),
+                'monthly_cost': float(plan.monthly_cost),
+                'net_profit': float(plan.net_profit),
+                'profit_margin': float(plan.profit_margin),
+                'currency': plan.currency,
+                'status': 'Profitable' if plan.net_profit >= 0 else 'Loss'
+            }
+            for plan in plan_analytics()
+        ]
+
+    @property
+    def total_costs(self):
+        return sum(float(cost['amount']) for cost in self.costs)
+
+    def cost_categories(self):
+        categories = {}
+        for cost in self.costs:
+            category = cost['category'] or 'Other'
+            categories[category] = categories.get(category, 0) + float(cost['amount'])
+        return categories
+
+    def revenue_payload(self):
+        """Response body of RevenueAnalyticsView"""
+        return dict(self.revenue, dailyChart=self.daily_chart, monthlyChart=[])
+
+    def report_data(self):
+        """The figures shown in the PDF report (also the report cache key input)"""
+        return {
+            'revenue': self.revenue,
+            'users': self.users,
+            'total_plans': len(self.plans),
+            'plan_analytics': self.plans,
+            'cost_categories': self.cost_categories(),
+            'total_monthly_costs': self.total_costs,
+        }
+
+    def to_json(self):
+        data = self.report_data()
+        data['generated_at'] = self.now.isoformat()
+        data['daily_revenue'] = self.daily_chart
+        return data
+
+    def to_csv(self):
+        """Flatten the report into section,name,metric,value rows"""
+        out = StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['section', 'name', 'metric', 'value'])
+        for period, amount in self.revenue.items():
+            writer.writerow(['revenue', period, 'amount', f"{amount:.2f}"])
+        for point in self.daily_chart:
+            writer.writerow(['daily_revenue', point['date'], 'amount', f"{point['amount']:.2f}"])
+        for metric, value in self.users.items():
+            writer.writerow(['users', 'all', metric, value])
+        for plan in self.plans:
+            for metric in ('active_users', 'price_per_user', 'total_revenue', 'monthly_cost',
+                           'net_profit', 'profit_margin'):
+                writer.writerow(['plans', plan['name'], metric, plan[metric]])
+        for category, total in self.cost_categories().items():
+            writer.writerow(['costs', category, 'amount', f"{total:.2f}"])
+        writer.writerow(['costs', 'TOTAL', 'amount', f"{self.total_costs:.2f}"])
+        return out.getvalue()
+
+
+def collect_report_data():
+    """Figures for the PDF report, taken from the shared snapshot"""
+    return ReportSnapshot.current().report_data()
+
+
+def _table_style(header_font_size=12, body_font_size=10, align='LEFT', total_row=False):
+    """Green-header table style used by every report table"""
+    body_end = -2 if total_row else -1
+    commands = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22c55e')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), align),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, body_end), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 1), (-1, -1), body_font_size),
+        ('ROWBACKGROUNDS', (0, 1), (-1, body_end), [colors.white, colors.lightgrey]),
+    ]
+    if total_row:
+        commands += [
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f9ff')),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ]
+    return TableStyle(commands)
+
+
+def _draw_page_number(canvas, doc):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 8)
+    canvas.setFillColor(colors.HexColor('#6b7280'))
+    canvas.drawRightString(A4[0] - 72, 30, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+class StreamingStory(list):
+    """Flowable list that is filled from an iterator while ReportLab builds.
+
+    `BaseDocTemplate.build()` only works on the head of its list (len,
+    [0], del [0] and re-inserting split parts), so keeping a small buffer
+    topped up is enough to lay out any number of pages without holding
+    every flowable in memory.
+    """
+
+    def __init__(self, flowables, buffer_size=8):
+        super().__init__()
+        self._source = iter(flowables)
+        self._buffer_size = buffer_size
+
+    def __len__(self):
+        while self._source is not None and super().__len__() < self._buffer_size:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return super().__len__()
+
+
+# Rows per detail table; each table is laid out and dropped before the next is built
+DETAIL_ROWS_PER_TABLE = 40
+
+
+def _detail_tables(title, header, rows, col_widths, on_rows=None):
+    """Yield a section heading then `rows` split into tables of DETAIL_ROWS_PER_TABLE"""
+    styles = getSampleStyleSheet()
+    heading_style = ParagraphStyle('DetailHeading', parent=styles['Heading2'], fontSize=16,
+                                   spaceAfter=12, textColor=colors.HexColor('#1f2937'), alignment=TA_LEFT)
+    yield PageBreak()
+    yield Paragraph(title, heading_style)
+
+    chunk = []
+    written = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == DETAIL_ROWS_PER_TABLE:
+            written += len(chunk)
+            yield _detail_table(header, chunk, col_widths)
+            chunk = []
+            if on_rows:
+                on_rows(written)
+    if chunk:
+        written += len(chunk)
+        yield _detail_table(header, chunk, col_widths)
+        if on_rows:
+            on_rows(written)
+    if not written:
+        yield Paragraph("No records in this period.", styles['Normal'])
+
+
+def _detail_table(header, rows, col_widths):
+    table = Table([header] + rows, colWidths=col_widths, repeatRows=1)
+    table.setStyle(_table_style(header_font_size=9, body_font_size=8))
+    return table
+
+
+def detail_flowables(start=None, end=None, progress=None):
+    """Detail sections for the report: every payment and per-user activity in [start, end].
+
+    Rows are read with `.iterator(chunk_size=...)` and turned into tables on
+    demand, so pass the result to `render_report_pdf(details=...)` as is.
+    `progress(done, total)` is called after each table with row counts.
+    """
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    start_dt, end_dt = day_bounds(start, end)
+
+    payments = Payment.objects.all()
+    sessions = UserSession.objects.all()
+    if start_dt:
+        payments = payments.filter(payment_date__gte=start_dt)
+        sessions = sessions.filter(login_time__gte=start_dt)
+    if end_dt:
+        payments = payments.filter(payment_date__lt=end_dt)
+        sessions = sessions.filter(login_time__lt=end_dt)
+
+    payments = payments.order_by('payment_date', 'pk').values_list(
+        'payment_date', 'user__email', 'plan__name', 'amount', 'currency', 'status'
+    )
+    activity = sessions.values('user__email').annotate(
+        sessions=Count('id'),
+        minutes=Sum('duration_minutes'),
+        last_login=Max('login_time'),
+    ).order_by('user__email').values_list('user__email', 'sessions', 'minutes', 'last_login')
+
+    payment_total = payments.count()
+    total = payment_total + activity.count()
+
+    def report(done):
+        if progress:
+            progress(done, total)
+
+    payment_rows = (
+        [paid_at.strftime('%Y-%m-%d %H:%M'), email, plan or '-', f"{amount:.2f}", currency, status]
+        for paid_at, email, plan, amount, currency, status in payments.iterator(chunk_size=chunk_size)
+    )
+    yield from _detail_tables(
+        "💳 Payments", ['Date', 'User', 'Plan', 'Amount', 'Currency', 'Status'], payment_rows,
+        [1.2*inch, 2*inch, 0.9*inch, 0.7*inch, 0.6*inch, 0.7*inch], on_rows=report
+    )
+
+    activity_rows = (
+        [email, str(count), str(minutes or 0), last_login.strftime('%Y-%m-%d %H:%M')]
+        for email, count, minutes, last_login in activity.iterator(chunk_size=chunk_size)
+    )
+    yield from _detail_tables(
+        "👥 User Activity", ['User', 'Sessions', 'Minutes', 'Last Login'], activity_rows,
+        [2.6*inch, 0.9*inch, 0.9*inch, 1.4*inch],
+        on_rows=lambda done: report(payment_total + done)
+    )
+
+
+def render_report_pdf(data, out, generated_at=None, details=None):
+    """Render report data collected by `collect_report_data` as a PDF into `out`.
+
+    `details` is an optional iterable of extra flowables (see
+    `detail_flowables`) inserted before the footer. Returns the page count.
+    """
+    generated_at = generated_at or datetime.now()
+    doc = SimpleDocTemplate(out, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+
+    # Container for the 'Flowable' objects
+    story = []
+
+    # Styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        textColor=colors.HexColor('#22c55e'),
+        alignment=TA_CENTER
+    )
+
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=12,
+        textColor=colors.HexColor('#1f2937'),
+        alignment=TA_LEFT
+    )
+
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=6,
+        alignment=TA_LEFT
+    )
+
+    revenue = data['revenue']
+    total_monthly_costs = data['total_monthly_costs']
+
+    # Header
+    story.append(Paragraph("🎮 PlayAtac Business Analytics Report", title_style))
+    story.append(Paragraph(f"Generated on {(generated_at + timedelta(hours=3)).strftime('%B %d, %Y at %I:%M %p')}", normal_style))
+    story.append(Spacer(1, 30))
+
+    # Executive Summary Section
+    story.append(Paragraph("📊 Executive Summary", heading_style))
+
+    summary_data = [
+        ['Metric', 'Value'],
+        ['Total Users', f"{data['users']['total']}"],
+        ['Admin Users', f"{data['users']['admins']}"],
+        ['Available Plans', f"{data['total_plans']}"],
+        ['Total Revenue', f"€{revenue['total']:.2f}"],
+        ['Monthly Revenue', f"€{revenue['monthly']:.2f}"],
+        ['Monthly Costs', f"€{total_monthly_costs:.2f}"],
+        ['Net Profit', f"€{revenue['total'] - total_monthly_costs:.2f}"],
+    ]
+
+    summary_table = Table(summary_data, colWidths=[2.5*inch, 2*inch])
+    summary_table.setStyle(_table_style())
+    story.append(summary_table)
+    story.append(Spacer(1, 20))
+
+    # Revenue Analytics Section
+    story.append(Paragraph("💰 Revenue Analytics", heading_style))
+
+    revenue_data = [
+        ['Period', 'Revenue'],
+        ['Daily', f"€{revenue['daily']:.2f}"],
+        ['Weekly', f"€{revenue['weekly']:.2f}"],
+        ['Monthly', f"€{revenue['monthly']:.2f}"],
+        ['Total (All Time)', f"€{revenue['total']:.2f}"],
+    ]
+
+    revenue_table = Table(revenue_data, colWidths=[2.5*inch, 2*inch])
+    revenue_table.setStyle(_table_style())
+    story.append(revenue_table)
+    story.append(Spacer(1, 20))
+
+    # Plan Profitability Analysis Section
+    story.append(Paragraph("📈 Plan Profitability Analysis", heading_style))
+
+    plan_data = [['Plan Name', 'Users', 'Price/User', 'Revenue', 'Server Cost', 'Net Profit', 'Margin %', 'Status']]
+    for analytics in data['plan_analytics']:
+        plan_data.append([
+            analytics['name'],
+            f"{analytics['active_users']}",
+            f"€{analytics['price_per_user']:.2f}",
+            f"€{analytics['total_revenue']:.2f}",
+            f"€{analytics['monthly_cost']:.2f}",
+            f"€{analytics['net_profit']:.2f}",
+            f"{analytics['profit_margin']:.1f}%",
+            analytics['status']
+        ])
+
+    plan_table = Table(plan_data, colWidths=[1.2*inch, 0.6*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.7*inch, 0.7*inch])
+    plan_table.setStyle(_table_style(header_font_size=10, body_font_size=9, align='CENTER'))
+    story.append(plan_table)
+    story.append(Spacer(1, 20))
+
+    # Infrastructure Costs Section
+    story.append(Paragraph("🏗️ Infrastructure Cost Breakdown", heading_style))
+
+    cost_data = [['Category', 'Monthly Cost', '% of Total']]
+    for category, total in data['cost_categories'].items():
+        percentage = (total / total_monthly_costs * 100) if total_monthly_costs > 0 else 0
+        cost_data.append([
+            category.title(),
+            f"€{total:.2f}",
+            f"{percentage:.1f}%"
+        ])
+
+    # Add total row
+    cost_data.append(['TOTAL', f"€{total_monthly_costs:.2f}", '100.0%'])
+
+    cost_table = Table(cost_data, colWidths=[2*inch, 1.5*inch, 1*inch])
+    cost_table.setStyle(_table_style(total_row=True))
+    story.append(cost_table)
+    story.append(Spacer(1, 30))
+
+    # Footer
+    footer = []
+    footer.append(Paragraph("PlayAtac Business Intelligence",
+                 ParagraphStyle('Footer', parent=styles['Normal'], fontSize=10,
+                                textColor=colors.HexColor('#6b7280'), alignment=TA_CENTER)))
+    footer.append(Paragraph("This report was automatically generated by the Admin Dashboard system.",
+                 ParagraphStyle('FooterSub', parent=styles['Normal'], fontSize=8,
+                                textColor=colors.HexColor('#6b7280'), alignment=TA_CENTER)))
+    footer.append(Paragraph(f"© {generated_at.year} PlayAtac. All rights reserved.",
+                 ParagraphStyle('Copyright', parent=styles['Normal'], fontSize=8,
+                                textColor=colors.HexColor('#6b7280'), alignment=TA_CENTER)))
+
+    if details is None:
+        doc.build(story + footer, onFirstPage=_draw_page_number, onLaterPages=_draw_page_number)
+    else:
+        # Detail sections are pulled lazily so only a few tables exist at once
+        doc.build(StreamingStory(chain(story, details, footer)),
+                  onFirstPage=_draw_page_number, onLaterPages=_draw_page_number)
+    return doc.page
+
+
+def render_report_bytes(data, generated_at=None):
+    buffer = BytesIO()
+    render_report_pdf(data, buffer, generated_at)
+    return buffer.getvalue()
+
+
+def report_filename(generated_at=None):
+    generated_at = generated_at or datetime.now()
+    return f"PlayAtac_Dashboard_Report_{generated_at.strftime('%Y%m%d_%H%M%S')}.pdf"
+
+
+# ======================
+# Report file store
+# ======================
+
+def reports_root():
+    root = str(getattr(settings, 'REPORTS_ROOT', os.path.join(settings.BASE_DIR, 'reports')))
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+# ======================
+# Content-addressed report cache
+# ======================
+
+# Bump whenever render_report_pdf changes its output for the same data
+REPORT_TEMPLATE_VERSION = 2
+
+
+def report_digest(data, generated_at=None, template_version=REPORT_TEMPLATE_VERSION):
+    """Hash of everything the PDF shows (data, its timestamp, template version), used as cache key and ETag"""
+    payload = json.dumps({'template': template_version, 'generated_at': generated_at, 'data': data},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """PDF bytes stored on disk under their content digest.
+
+    Concurrent misses for the same digest are generated once (single-flight):
+    the first caller renders while the others wait on a per-digest lock and
+    then read the stored file. Within a process that lock is a
+    threading.Lock; across processes it is a `cache.add()` key, so it only
+    spans processes when CACHES points at a shared backend (Redis,
+    memcached, database). With the default local-memory cache each process
+    may render the same report once. Entries older than `max_age` seconds
+    are evicted, then the oldest ones until the cache fits in `max_bytes`.
+    """
+
+    RENDER_LOCK_TIMEOUT = 120  # seconds another process waits for a render in progress
+
+    def __init__(self, root=None, max_age=None, max_bytes=None):
+        self._root = root
+        self._max_age = max_age
+        self._max_bytes = max_bytes
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @property
+    def root(self):
+        root = self._root or os.path.join(reports_root(), 'cache')
+        os.makedirs(root, exist_ok=True)
+        return root
+
+    @property
+    def max_age(self):
+        return self._max_age if self._max_age is not None else getattr(settings, 'REPORT_CACHE_MAX_AGE', 24 * 3600)
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes if self._max_bytes is not None else getattr(settings, 'REPORT_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+
+    def path(self, digest):
+        return os.path.join(self.root, f"{digest}.pdf")
+
+    def get(self, digest):
+        try:
+            with open(self.path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _lock_for(self, digest):
+        with self._locks_guard:
+            return self._locks.setdefault(digest, threading.Lock())
+
+    def get_or_create(self, digest, build):
+        """Return (pdf bytes, created) for `digest`, calling `build()` at most once per miss"""
+        content = self.get(digest)
+        if content is not None:
+            return content, False
+
+        lock = self._lock_for(digest)
+        with lock:
+            content = self.get(digest)
+            if content is not None:
+                return content, False
+
+            shared_key = f'report_render:{digest}'
+            deadline = time.monotonic() + self.RENDER_LOCK_TIMEOUT
+            while not cache.add(shared_key, os.getpid(), self.RENDER_LOCK_TIMEOUT):
+                # Another process is rendering this digest: wait for its file
+                time.sleep(0.1)
+                content = self.get(digest)
+                if content is not None:
+                    return content, False
+                if time.monotonic() > deadline:
+                    break
+            try:
+                content = build()
+                path = self.path(digest)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            finally:
+                cache.delete(shared_key)
+
+        with self._locks_guard:
+            self._locks.pop(digest, None)
+        self.evict()
+        return content, True
+
+    def evict(self):
+        """Drop expired entries, then the oldest ones until under the size limit"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.pdf'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+report_cache = ReportCache()
+
+
+def get_cached_report(snapshot=None):
+    """Return (digest, pdf bytes, generated_at) for the current snapshot, rendering only on a miss.
+
+    The PDF is stamped with the snapshot's time rather than the render time,
+    and that time is part of the digest, so a cache hit never shows a stale
+    "Generated on" and `report_filename(generated_at)` matches the contents.
+    """
+    snapshot = snapshot or ReportSnapshot.current()
+    data = snapshot.report_data()
+    generated_at = snapshot.now
+    digest = report_digest(data, generated_at)
+    content, _ = report_cache.get_or_create(digest, lambda: render_report_bytes(data, generated_at))
+    return digest, content, generated_at
+
+
+# ======================
+# Background report jobs
+# ======================
+
+def enqueue_report_job(detailed=False, period_start=None, period_end=None):
+    """Create a pending report job and hand it to the worker pool once committed"""
+    job = ReportJob.objects.create(detailed=detailed, period_start=period_start, period_end=period_end)
+    submit_after_commit(run_report_job, job.id)
+    return job
+
+
+def _progress_updater(job_id):
+    """Return a progress(done, total) callback that writes whole percent changes to the job"""
+    last = {'percent': -1}
+
+    def update(done, total):
+        # 100 is only written once the file is in place
+        percent = min(99, done * 100 // total) if total else 99
+        if percent > last['percent']:
+            ReportJob.objects.filter(id=job_id).update(progress=percent)
+            last['percent'] = percent
+    return update
+
+
+def run_report_job(job_id):
+    """Generate the PDF for a job into the report file store.
+
+    The job is claimed with a conditional UPDATE, so a job requeued by
+    `recover_report_jobs` is only run by one worker. Returns None if it was
+    already claimed.
+    """
+    started_at = timezone.now()
+    if not ReportJob.objects.filter(id=job_id, status='pending').update(status='running', started_at=started_at):
+        return None
+    job = ReportJob.objects.get(id=job_id)
+
+    path = os.path.join(reports_root(), f"{job.id}.pdf")
+    tmp_path = f"{path}.tmp"
+    try:
+        if job.detailed:
+            # Detail sections depend on the period and grow with the data, so
+            # they are streamed straight to disk instead of the report cache
+            snapshot = ReportSnapshot.current()
+            generated_at = snapshot.now
+            details = detail_flowables(job.period_start, job.period_end, progress=_progress_updater(job.id))
+            with open(tmp_path, 'wb') as out:
+                job.pages = render_report_pdf(snapshot.report_data(), out, generated_at, details=details)
+        else:
+            _, content, generated_at = get_cached_report()
+            with open(tmp_path, 'wb') as out:
+                out.write(content)
+        os.replace(tmp_path, path)
+
+        job.status = 'done'
+        job.file_path = path
+        job.file_name = report_filename(generated_at)
+        job.file_size = os.path.getsize(path)
+        job.progress = 100
+    except Exception as e:
+        print(f"Report job {job.id} failed: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'file_path', 'file_name', 'file_size', 'pages', 'progress', 'error',
+                            'finished_at'])
+    return job
+
+
+def recover_report_jobs(stale_after=None, inline=False):
+    """Requeue or fail jobs the in-process worker pool lost in a restart.
+
+    Jobs still pending `stale_after` seconds after they were created are
+    submitted to the worker pool again (or run here with `inline=True`);
+    jobs running for longer than that are marked failed (their worker died
+    mid-render) so clients stop polling. Returns {'requeued': n, 'failed': n}.
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'REPORT_JOB_TIMEOUT', 900)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+
+    failed = ReportJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='failed', error='worker stopped while generating the report', finished_at=timezone.now())
+    job_ids = list(ReportJob.objects.filter(status='pending', created_at__lt=cutoff).values_list('id', flat=True))
+    for job_id in job_ids:
+        if inline:
+            run_report_job(job_id)
+        else:
+            submit(run_report_job, job_id)
+    return {'requeued': len(job_ids), 'failed': failed}
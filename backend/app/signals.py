@@ -0,0 +1,101 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from app.accounts import invalidate_account_summary, invalidate_all_account_summaries
+from app.catalog import invalidate_catalog
+from app.ledger import ensure_payment_stats, record_payment, refresh_payment_stats
+from app.models import Cost, Payment, Plan, Subscription, User
+from app.reports import ReportSnapshot
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batched_invalidation():
+    """Collapse snapshot invalidations from many row changes into one at the end of the block"""
+    depth = getattr(_batch, 'depth', 0)
+    _batch.depth = depth + 1
+    if not depth:
+        _batch.dirty = False
+    try:
+        yield
+    finally:
+        _batch.depth = depth
+        if not depth and _batch.dirty:
+            ReportSnapshot.invalidate()
+
+
+def invalidate_snapshot():
+    """Drop the cached snapshot now, or once at the end of an enclosing batch"""
+    if getattr(_batch, 'depth', 0):
+        _batch.dirty = True
+    else:
+        ReportSnapshot.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Cost)
+@receiver([post_save, post_delete], sender=Payment)
+@receiver([post_save, post_delete], sender=Plan)
+@receiver([post_save, post_delete], sender=Subscription)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_report_snapshot(sender, **kwargs):
+    """Any change to dashboard source rows makes the cached snapshot stale"""
+    invalidate_snapshot()
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def invalidate_plans_catalog(sender, **kwargs):
+    """Plan create/update/delete from any path refreshes the public catalog"""
+    invalidate_catalog()
+    # Again after commit, in case a concurrent read cached the pre-commit rows
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_user_account_summary(sender, instance, **kwargs):
+    """A payment or subscription change makes that user's account summary stale"""
+    if sender.user.is_cached(instance):
+        email = instance.user.email
+    else:
+        email = User.objects.filter(pk=instance.user_id).values_list('email', flat=True).first()
+    if email is None:
+        return
+    invalidate_account_summary(email)
+    # Again after commit, in case a concurrent read cached the pre-commit rows
+    transaction.on_commit(lambda: invalidate_account_summary(email))
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def invalidate_plan_account_summaries(sender, **kwargs):
+    """Summaries embed plan names and prices, so a plan edit retires all of them"""
+    invalidate_all_account_summaries()
+    transaction.on_commit(invalidate_all_account_summaries)
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_stats(sender, instance, created, **kwargs):
+    """Keep the user's payment totals in the same transaction as the payment"""
+    if created:
+        if instance.status == 'paid':
+            record_payment(instance)
+    else:
+        # Status or amount may have changed (e.g. a failed attempt upgraded to paid)
+        refresh_payment_stats([instance.user_id])
+
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_stats(sender, instance, **kwargs):
+    refresh_payment_stats([instance.user_id])
+
+
+@receiver(post_save, sender=User)
+def create_payment_stats(sender, instance, created, **kwargs):
+    """Every user gets a (zero) stats row so lifetime value sorts without outer joins"""
+    if created:
+        ensure_payment_stats([instance.id])
@@ -0,0 +1,209 @@
+"""
+Shared Stripe API client.
+
+One `stripe.StripeClient` per process, backed by a pooled `requests.Session`
+so TLS connections are reused across requests, with explicit connect/read
+timeouts. The SDK's own retries are disabled; `StripeGateway` retries
+network errors, 429s and 5xx responses itself with jittered exponential
+backoff, bounded by a per-call time budget and by a retry token bucket
+shared by every call in the process: each retry spends a token and each
+success earns back a fraction of one, so during a Stripe outage the
+process stops retrying instead of multiplying its traffic. POSTs carry one
+idempotency key for all attempts, so a retried create cannot charge twice.
+
+Per-operation call counts, retries, errors and latencies are served by
+`GET /api/stripe/metrics/`.
+"""
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+POOL_SIZE = 10
+
+
+class CallMetrics:
+    """Per-operation call counts, retries, errors and latency percentiles (in process)"""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._window = window
+        self._ops = {}
+
+    def record(self, operation, seconds, attempts, ok):
+        with self._lock:
+            op = self._ops.setdefault(operation, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'latencies': deque(maxlen=self._window)
+            })
+            op['calls'] += 1
+            op['retries'] += attempts - 1
+            op['errors'] += 0 if ok else 1
+            op['latencies'].append(seconds)
+
+    def snapshot(self):
+        """{operation: {calls, errors, retries, p50_ms, p95_ms, max_ms}} over the recent window"""
+        with self._lock:
+            result = {}
+            for operation, op in self._ops.items():
+                latencies = sorted(op['latencies'])
+                pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+                result[operation] = {
+                    'calls': op['calls'],
+                    'errors': op['errors'],
+                    'retries': op['retries'],
+                    'p50_ms': pick(0.5) if latencies else None,
+                    'p95_ms': pick(0.95) if latencies else None,
+                    'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+                }
+            return result
+
+
+class RetryTokens:
+    """Token bucket limiting retries across all calls (a shared retry budget)"""
+
+    def __init__(self, capacity=10.0, refill=0.1):
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self.refill = refill
+        self._tokens = capacity
+
+    def take(self):
+        """Spend one token for a retry; False when the budget is exhausted"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def success(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.refill)
+
+    @property
+    def available(self):
+        with self._lock:
+            return round(self._tokens, 2)
+
+
+def _retryable(error):
+    if isinstance(error, (stripe.APIConnectionError, stripe.RateLimitError)):
+        return True
+    return isinstance(error, stripe.APIError) and (error.http_status or 0) >= 500
+
+
+class StripeGateway:
+    """Timeout-bounded, retrying wrapper around the Stripe calls the app makes"""
+
+    def __init__(self, api_key, api_base=None, connect_timeout=3.0, read_timeout=15.0,
+                 max_retries=2, retry_budget=20.0, backoff_base=0.25, backoff_max=2.0,
+                 retry_tokens=10.0, retry_token_refill=0.1):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        self.api_key = api_key
+        self.client = stripe.StripeClient(
+            api_key,
+            http_client=stripe.RequestsClient(timeout=(connect_timeout, read_timeout), session=session),
+            max_network_retries=0,
+            base_addresses={'api': api_base} if api_base else None,
+        )
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = CallMetrics()
+        self.retry_tokens = RetryTokens(retry_tokens, retry_token_refill)
+
+    def _call(self, operation, fn):
+        started = time.monotonic()
+        deadline = started + self.retry_budget
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = fn()
+            except stripe.StripeError as e:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                delay = random.uniform(delay / 2, delay)
+                if (not _retryable(e) or attempt > self.max_retries
+                        or time.monotonic() + delay >= deadline or not self.retry_tokens.take()):
+                    self.metrics.record(operation, time.monotonic() - started, attempt, ok=False)
+                    raise
+                print(f"Stripe {operation} attempt {attempt} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self.metrics.record(operation, time.monotonic() - started, attempt, ok=True)
+            self.retry_tokens.success()
+            return result
+
+    def metrics_snapshot(self):
+        """Call metrics plus the shared retry budget left, as served by the metrics endpoint"""
+        return {
+            'operations': self.metrics.snapshot(),
+            'retry_tokens': {'available': self.retry_tokens.available, 'capacity': self.retry_tokens.capacity},
+        }
+
+    def create_payment_intent(self, idempotency_key=None, **params):
+        options = {'idempotency_key': idempotency_key or f"pi-create-{uuid.uuid4()}"}
+        return self._call('payment_intents.create',
+                          lambda: self.client.v1.payment_intents.create(params=params, options=options))
+
+    def create_customer(self, idempotency_key=None, **params):
+        options = {'idempotency_key': idempotency_key or f"customer-create-{uuid.uuid4()}"}
+        return self._call('customers.create',
+                          lambda: self.client.v1.customers.create(params=params, options=options))
+
+    def cancel_payment_intent(self, intent_id):
+        options = {'idempotency_key': f"pi-cancel-{intent_id}"}
+        return self._call('payment_intents.cancel',
+                          lambda: self.client.v1.payment_intents.cancel(intent_id, options=options))
+
+    def retrieve_payment_intent(self, intent_id):
+        return self._call('payment_intents.retrieve',
+                          lambda: self.client.v1.payment_intents.retrieve(intent_id))
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_stripe_gateway(api_key):
+    """Return the process-wide gateway for `api_key`, rebuilding it if the key changed"""
+    global _gateway
+    gateway = _gateway
+    if gateway is not None and gateway.api_key == api_key:
+        return gateway
+    with _gateway_lock:
+        if _gateway is None or _gateway.api_key != api_key:
+            _gateway = StripeGateway(
+                api_key,
+                api_base=getattr(settings, 'STRIPE_API_BASE', None),
+                connect_timeout=getattr(settings, 'STRIPE_CONNECT_TIMEOUT', 3.0),
+                read_timeout=getattr(settings, 'STRIPE_READ_TIMEOUT', 15.0),
+                max_retries=getattr(settings, 'STRIPE_MAX_RETRIES', 2),
+                retry_budget=getattr(settings, 'STRIPE_RETRY_BUDGET', 20.0),
+                retry_tokens=getattr(settings, 'STRIPE_RETRY_TOKENS', 10.0),
+                retry_token_refill=getattr(settings, 'STRIPE_RETRY_TOKEN_REFILL', 0.1),
+            )
+        return _gateway
+
+
+def current_stripe_gateway():
+    """Return the shared gateway if one has been built in this process, else None"""
+    return _gateway
+
+
+def set_stripe_gateway(gateway):
+    """Swap the shared gateway (tests point it at a local stub server)"""
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway
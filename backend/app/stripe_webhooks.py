@@ -0,0 +1,150 @@
+"""
+Stripe webhook inbox.
+
+The webhook view only verifies the signature and inserts the event into
+`StripeEvent` (the event id is the primary key, so redeliveries are
+no-ops), then answers 200. Processing happens on the background worker
+pool after commit, or later via `manage.py process_stripe_events` for
+anything left pending or failed, or left processing for longer than
+STRIPE_EVENT_CLAIM_TIMEOUT by a worker that crashed or was redeployed.
+"""
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from app.models import Payment, Plan, StripeEvent, User
+from app.payments import activate_paid_plan
+from app.workers import submit_after_commit
+
+
+MAX_ATTEMPTS = 5
+
+
+class WebhookError(Exception):
+    """Raised for payloads that fail verification"""
+
+
+def record_event(payload, sig_header, secret=None):
+    """Verify a webhook delivery and store it; returns (event, created)"""
+    secret = secret or getattr(settings, 'STRIPE_WEBHOOK_SECRET', None)
+    if not secret:
+        raise WebhookError('STRIPE_WEBHOOK_SECRET is not configured')
+    try:
+        stripe.Webhook.construct_event(payload, sig_header, secret)
+    except ValueError:
+        raise WebhookError('Invalid payload')
+    except stripe.error.SignatureVerificationError:
+        raise WebhookError('Invalid signature')
+
+    data = json.loads(payload)
+    event, created = StripeEvent.objects.get_or_create(
+        id=data['id'],
+        defaults={'type': data.get('type', ''), 'livemode': bool(data.get('livemode')), 'payload': data},
+    )
+    if created:
+        submit_after_commit(process_stripe_event, event.id)
+    return event, created
+
+
+def _handle_payment_intent_succeeded(intent):
+    metadata = intent.get('metadata') or {}
+    if metadata.get('renewal') == 'true' or Payment.objects.filter(transaction_id=intent['id'],
+                                                                   status='paid').exists():
+        # Off-session renewals are recorded by the renewal scheduler itself
+        return
+    if not metadata.get('user_email') or not metadata.get('plan_id'):
+        raise ValueError('payment intent metadata is missing user_email or plan_id')
+    plan = Plan.objects.get(id=metadata['plan_id'])
+    cents = intent.get('amount_received') or intent.get('amount')
+    amount = Decimal(cents) / 100 if cents is not None else None
+    activate_paid_plan(metadata['user_email'], plan, amount, intent.get('currency'), intent['id'])
+
+
+def _handle_payment_intent_failed(intent):
+    metadata = intent.get('metadata') or {}
+    if Payment.objects.filter(transaction_id=intent['id']).exists():
+        return
+    user = User.objects.filter(email=metadata.get('user_email')).first()
+    plan = Plan.objects.filter(id=metadata.get('plan_id')).first()
+    if user is None or plan is None:
+        return
+    Payment.objects.create(
+        user=user,
+        plan=plan,
+        amount=Decimal(intent.get('amount') or 0) / 100,
+        currency=(intent.get('currency') or plan.currency).upper(),
+        status='failed',
+        transaction_id=intent['id']
+    )
+
+
+# event type -> handler(data.object); other types are stored and marked ignored
+HANDLERS = {
+    'payment_intent.succeeded': _handle_payment_intent_succeeded,
+    'payment_intent.payment_failed': _handle_payment_intent_failed,
+}
+
+
+def _claimable(stale_after=None):
+    """Events waiting for a worker: pending, failed, or claimed by one that never finished"""
+    if stale_after is None:
+        stale_after = getattr(settings, 'STRIPE_EVENT_CLAIM_TIMEOUT', 300)
+    stale = timezone.now() - timedelta(seconds=stale_after)
+    return StripeEvent.objects.filter(
+        Q(status__in=['pending', 'failed']) | Q(status='processing', claimed_at__lt=stale),
+        attempts__lt=MAX_ATTEMPTS,
+    )
+
+
+def process_stripe_event(event_id, stale_after=None):
+    """Apply one stored event. Safe to call repeatedly: only one caller claims it."""
+    claimed_at = timezone.now()
+    claimed = _claimable(stale_after).filter(id=event_id).update(
+        status='processing', attempts=F('attempts') + 1, claimed_at=claimed_at)
+    if not claimed:
+        return None
+
+    event = StripeEvent.objects.get(id=event_id)
+    handler = HANDLERS.get(event.type)
+    try:
+        if handler is None:
+            event.status = 'ignored'
+        else:
+            with transaction.atomic():
+                handler(event.payload['data']['object'])
+            event.status = 'processed'
+        event.error = ''
+    except Exception as e:
+        print(f"Stripe event {event.id} ({event.type}) failed: {str(e)}")
+        event.status = 'failed'
+        event.error = str(e)
+
+    event.processed_at = timezone.now()
+    # Only while the claim is still ours; a stale claim may have been taken over meanwhile
+    StripeEvent.objects.filter(id=event.id, claimed_at=claimed_at).update(
+        status=event.status, error=event.error, processed_at=event.processed_at)
+    return event
+
+
+def process_pending_events(limit=100, stale_after=None):
+    """Process stored events that are pending, failed or stuck processing; returns how many were attempted"""
+    if stale_after is None:
+        stale_after = getattr(settings, 'STRIPE_EVENT_CLAIM_TIMEOUT', 300)
+    # Stuck on their last attempt: give up on them like any other exhausted event
+    StripeEvent.objects.filter(
+        status='processing', claimed_at__lt=timezone.now() - timedelta(seconds=stale_after),
+        attempts__gte=MAX_ATTEMPTS,
+    ).update(status='failed', error='worker stopped while processing the event')
+
+    event_ids = list(
+        _claimable(stale_after).order_by('received_at').values_list('id', flat=True)[:limit]
+    )
+    for event_id in event_ids:
+        process_stripe_event(event_id, stale_after)
+    return len(event_ids)
@@ -0,0 +1,87 @@
+"""
+Shared Supabase client.
+
+`create_client` builds a new HTTP session every time it is called, so views
+must go through `get_supabase_client()` which keeps one client per process.
+When `SUPABASE_USE_FAKE` is enabled (local development, tests) an in-memory
+stand-in with the same `table().select().eq().limit().execute()` surface is
+returned instead, so nothing talks to the network.
+"""
+import threading
+
+from django.conf import settings
+
+
+class LocalSupabaseResponse:
+    def __init__(self, data):
+        self.data = data
+        self.error = None
+
+
+class _LocalQuery:
+    def __init__(self, rows):
+        self._rows = rows
+        self._columns = None
+        self._filters = []
+        self._limit = None
+
+    def select(self, columns="*"):
+        if columns.strip() != "*":
+            self._columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, value))
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def execute(self):
+        rows = [
+            row for row in self._rows
+            if all(row.get(column) == value for column, value in self._filters)
+        ]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        if self._columns:
+            rows = [{c: row.get(c) for c in self._columns} for row in rows]
+        return LocalSupabaseResponse(rows)
+
+
+class LocalSupabaseClient:
+    """In-memory fake of the Supabase client for local runs and tests"""
+
+    def __init__(self, tables=None):
+        self.tables = tables if tables is not None else {}
+
+    def table(self, name):
+        return _LocalQuery(self.tables.setdefault(name, []))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_supabase_client():
+    """Return the process-wide Supabase client, creating it on first use"""
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            if getattr(settings, "SUPABASE_USE_FAKE", False):
+                _client = LocalSupabaseClient()
+            else:
+                from supabase import create_client
+                _client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    return _client
+
+
+def set_supabase_client(client):
+    """Replace the shared client (pass None to reset it)"""
+    global _client
+    with _client_lock:
+        _client = client
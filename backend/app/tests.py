@@ -7,7 +7,7 @@ from rest_framework import status
 from decimal import Decimal
 from datetime import timedelta
 import os
-from supabase import create_client
+from app.supabase_client import get_supabase_client, set_supabase_client, LocalSupabaseClient
 from .models import Plan, Subscription, Payment, Cost, UserSession
 
 User = get_user_model()
@@ -26,7 +26,7 @@ class SupabaseConnectionTest(TestCase):
         
         # Try to create a Supabase client
         try:
-            supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+            supabase = get_supabase_client()
             
             # Test a simple query - try to fetch plans
             response = supabase.table("app_plan").select("*").limit(1).execute()
@@ -203,3 +203,1466 @@ class UserSessionTrackingTest(TestCase):
         self.assertEqual(total_minutes, 360)  # 3 sessions × 120 minutes
         
         print(f"✅ Multiple sessions test passed. Total time: {total_minutes} minutes")
+
+
+class ChartFormatTest(TestCase):
+    """Test 6: Chart endpoints honour the format/size contract"""
+
+    def setUp(self):
+        """Create one session so the activity chart has data"""
+        self.user = User.objects.create_user(
+            email="charttest@example.com",
+            password="testpass123"
+        )
+        login_time = timezone.now() - timedelta(days=1)
+        UserSession.objects.create(
+            user=self.user,
+            login_time=login_time,
+            logout_time=login_time + timedelta(minutes=90),
+            duration_minutes=90
+        )
+
+    def test_chart_formats(self):
+        """Test that PNG, SVG and WebP are served with the right content type"""
+        expected = {'png': 'image/png', 'svg': 'image/svg+xml', 'webp': 'image/webp'}
+        for fmt, content_type in expected.items():
+            response = self.client.get('/charts/user-activity/', {'format': fmt, 'width': 400, 'height': 200})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], content_type)
+            self.assertGreater(len(response.content), 0)
+
+        png = self.client.get('/charts/user-activity/', {'format': 'png', 'width': 400, 'height': 200})
+        from PIL import Image
+        from io import BytesIO
+        self.assertEqual(Image.open(BytesIO(png.content)).size, (400, 200))
+
+        print("✅ Chart format test passed")
+
+    def test_invalid_chart_options(self):
+        """Test that unknown formats and out-of-range sizes are rejected"""
+        self.assertEqual(self.client.get('/charts/user-activity/', {'format': 'gif'}).status_code, 400)
+        self.assertEqual(self.client.get('/charts/user-activity/', {'width': 10}).status_code, 400)
+        self.assertEqual(self.client.get('/charts/user-activity/', {'dpi': 'abc'}).status_code, 400)
+
+
+class ChartDataAccessTest(TestCase):
+    """Test 7: Chart data is read through the ORM, not per-request Supabase clients"""
+
+    def setUp(self):
+        """Create two plans with subscriptions and a couple of costs"""
+        self.user = User.objects.create_user(email="chartdata@example.com", password="testpass123")
+        pro = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        premium = Plan.objects.create(name="Premium", price=Decimal("19.99"))
+        other = User.objects.create_user(email="chartdata2@example.com", password="testpass123")
+        Subscription.objects.create(user=self.user, plan=pro, status='canceled')
+        Subscription.objects.create(user=self.user, plan=pro, status='active')
+        Subscription.objects.create(user=other, plan=premium, status='active')
+        Cost.objects.create(description="CDN", amount=Decimal("15.50"), category="cdn")
+
+    def test_plan_counts_single_query(self):
+        """Test that subscription counts per plan come from one grouped query"""
+        from app.analytics import plan_subscription_counts
+
+        with self.assertNumQueries(1):
+            counts = plan_subscription_counts()
+        self.assertEqual(counts, [("Premium", 1), ("Pro", 2)])
+
+        self.assertEqual(self.client.get('/piechart.png').status_code, 200)
+        self.assertEqual(self.client.get('/charts/monthly-costs/', {'format': 'svg'})['Content-Type'], 'image/svg+xml')
+
+    def test_shared_supabase_client(self):
+        """Test that the Supabase client is created once and can be swapped for a fake"""
+        fake = LocalSupabaseClient({'app_plan': [{'id': 1, 'name': 'Pro'}, {'id': 2, 'name': 'Premium'}]})
+        set_supabase_client(fake)
+        try:
+            self.assertIs(get_supabase_client(), get_supabase_client())
+            response = get_supabase_client().table('app_plan').select('name').eq('id', 2).execute()
+            self.assertEqual(response.data, [{'name': 'Premium'}])
+        finally:
+            set_supabase_client(None)
+
+
+class DailyActivitySeriesTest(TestCase):
+    """Test 8: Daily activity series is built from one grouped query"""
+
+    def setUp(self):
+        """Create sessions spread over two months with gaps"""
+        self.user = User.objects.create_user(email="series@example.com", password="testpass123")
+        self.today = timezone.localdate()
+        for days_ago, minutes in [(60, 30), (60, 15), (10, 45), (0, 20)]:
+            login_time = timezone.now().replace(hour=12, minute=0) - timedelta(days=days_ago)
+            UserSession.objects.create(user=self.user, login_time=login_time, duration_minutes=minutes)
+
+    def test_series_is_gap_filled_in_one_query(self):
+        """Test that every day is present and only one query runs"""
+        from app.analytics import daily_session_minutes
+
+        with self.assertNumQueries(1):
+            series = daily_session_minutes()
+
+        self.assertEqual(len(series), 61)
+        self.assertEqual(series[0], (self.today - timedelta(days=60), 45))
+        self.assertEqual(series[50], (self.today - timedelta(days=10), 45))
+        self.assertEqual(series[1][1], 0)
+        self.assertEqual(series[-1], (self.today, 20))
+
+    def test_window_filter(self):
+        """Test the ?from=&to= window on the helper and the chart endpoint"""
+        from app.analytics import daily_session_minutes
+
+        start = self.today - timedelta(days=12)
+        end = self.today - timedelta(days=5)
+        series = daily_session_minutes(start, end)
+        self.assertEqual(len(series), 8)
+        self.assertEqual(sum(minutes for _, minutes in series), 45)
+
+        response = self.client.get('/charts/user-activity/', {'from': start.isoformat(), 'to': end.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/charts/user-activity/', {'from': 'yesterday'}).status_code, 400)
+
+
+class UserActivityAnalyticsQueryTest(TestCase):
+    """Test 9: Activity analytics payload is built with a fixed number of queries"""
+
+    def setUp(self):
+        """Create a month of sessions for three users, one of them online"""
+        now = timezone.now()
+        self.users = [
+            User.objects.create_user(email=f"activity{i}@example.com", password="testpass123")
+            for i in range(3)
+        ]
+        for day in range(30):
+            for user in self.users:
+                login_time = (now - timedelta(days=day + 1)).replace(hour=10 + day % 5, minute=0)
+                UserSession.objects.create(
+                    user=user,
+                    login_time=login_time,
+                    logout_time=login_time + timedelta(minutes=60),
+                    duration_minutes=60
+                )
+        UserSession.objects.create(user=self.users[0], login_time=now - timedelta(minutes=5))
+
+    def test_query_count_is_constant(self):
+        """Test that the payload never costs more than five queries"""
+        from app.analytics import UserActivityAnalytics
+
+        with self.assertNumQueries(5):
+            payload = UserActivityAnalytics().build()
+
+        overview = payload['overview']
+        self.assertEqual(overview['total_active_users'], 3)
+        self.assertEqual(overview['currently_online'], 1)
+        self.assertEqual(overview['total_time_hours'], 90.0)
+        self.assertEqual(overview['avg_session_minutes'], 60.0)
+        self.assertEqual([u['email'] for u in payload['online_users']], ["activity0@example.com"])
+        self.assertGreaterEqual(len(payload['daily_activity']), 30)
+        self.assertEqual(len(payload['hourly_activity']), 24)
+        self.assertEqual(sum(h['users'] for h in payload['hourly_activity'][10:15]), 15)
+        self.assertEqual(payload['top_users'][0]['session_count'], 31)
+
+        response = self.client.get('/api/analytics/user-activity/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['overview'], overview)
+
+
+class SeedDemoDataTest(TestCase):
+    """Test 10: Demo data comes from the seed command, never from read endpoints"""
+
+    def test_read_endpoints_do_not_write(self):
+        """Test that empty dashboards stay empty after being read"""
+        User.objects.create_user(email="reader@example.com", password="testpass123")
+        Plan.objects.create(name="Pro", price=Decimal("9.99"))
+
+        self.assertEqual(self.client.get('/api/analytics/user-activity/').status_code, 200)
+        self.assertEqual(self.client.get('/charts/user-activity/').status_code, 200)
+        self.assertEqual(self.client.get('/api/hosting-costs/').json(), [])
+
+        self.assertEqual(UserSession.objects.count(), 0)
+        self.assertEqual(Cost.objects.count(), 0)
+
+    def test_seed_command(self):
+        """Test that the command seeds sessions, users and costs in bulk"""
+        from django.core.management import call_command
+        from io import StringIO
+
+        from app.reports import ReportSnapshot
+
+        Plan.objects.create(name="Premium", price=Decimal("19.99"))
+        ReportSnapshot.invalidate()
+        self.assertEqual(ReportSnapshot.current().costs, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('seed_demo_data', users=3, days=10, seed=42, stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 3)
+        # The cached snapshot is dropped, so the seeded costs show up immediately
+        self.assertEqual(len(ReportSnapshot.current().costs), 5)
+        self.assertGreaterEqual(UserSession.objects.count(), 10)
+        self.assertEqual(Cost.objects.get(plan__name="Premium").amount, Decimal("100.00"))
+        self.assertEqual(Cost.objects.count(), 5)
+
+        # Running again without --force leaves the data alone
+        sessions = UserSession.objects.count()
+        call_command('seed_demo_data', stdout=StringIO())
+        self.assertEqual(UserSession.objects.count(), sessions)
+        self.assertEqual(Cost.objects.count(), 5)
+
+
+class ReportJobTest(TestCase):
+    """Test 11: PDF reports are generated by background jobs and downloaded from the file store"""
+
+    def setUp(self):
+        """Point the report file store at a temporary directory"""
+        import tempfile
+        from django.test import override_settings
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(REPORTS_ROOT=self.tmpdir.name)
+        self.settings_override.enable()
+        plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        user = User.objects.create_user(email="report@example.com", password="testpass123")
+        Payment.objects.create(user=user, plan=plan, amount=plan.price, status='paid')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def test_job_lifecycle(self):
+        """Test POST -> status -> download for a report job"""
+        from app.reports import run_report_job
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post('/api/reports/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        job_id = response.json()['id']
+
+        self.assertEqual(self.client.get(f'/api/reports/{job_id}/').json()['status'], 'pending')
+        self.assertEqual(self.client.get(f'/api/reports/{job_id}/download/').status_code, 409)
+
+        # Run the worker inline instead of on the thread pool
+        run_report_job(job_id)
+
+        job = self.client.get(f'/api/reports/{job_id}/').json()
+        self.assertEqual(job['status'], 'done')
+        self.assertGreater(job['file_size'], 0)
+
+        download = self.client.get(job['download_url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+    def test_detailed_job_streams_pages(self):
+        """Test that a detailed report grows page by page and records progress"""
+        from app.reports import run_report_job
+
+        user = User.objects.get(email="report@example.com")
+        plan = Plan.objects.get(name="Pro")
+        Payment.objects.bulk_create([
+            Payment(user=user, plan=plan, amount=plan.price, status='paid') for _ in range(200)
+        ])
+
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post('/api/reports/', {'detailed': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['id']
+        self.assertTrue(response.json()['detailed'])
+
+        run_report_job(job_id)
+
+        job = self.client.get(f'/api/reports/{job_id}/').json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['progress'], 100)
+        # 201 payments at 40 rows per table need several pages after the summary
+        self.assertGreater(job['pages'], 5)
+        print(f"✅ Detailed report rendered {job['pages']} pages")
+
+    def test_lost_jobs_recovered(self):
+        """Test that jobs lost by a restart are rerun or failed, and a claimed job runs once"""
+        from io import StringIO
+        from django.core.management import call_command
+        from app.models import ReportJob
+        from app.reports import run_report_job
+
+        long_ago = timezone.now() - timedelta(hours=1)
+        lost = ReportJob.objects.create()
+        crashed = ReportJob.objects.create(status='running', started_at=long_ago)
+        fresh = ReportJob.objects.create()
+        ReportJob.objects.filter(id__in=[lost.id, crashed.id]).update(created_at=long_ago)
+
+        call_command('process_report_jobs', stdout=StringIO())
+
+        self.assertEqual(ReportJob.objects.get(id=lost.id).status, 'done')
+        self.assertEqual(ReportJob.objects.get(id=crashed.id).status, 'failed')
+        self.assertEqual(ReportJob.objects.get(id=fresh.id).status, 'pending')
+        # Already finished: a late duplicate submission does nothing
+        self.assertIsNone(run_report_job(lost.id))
+
+    def test_invalid_period_rejected(self):
+        """Test that a malformed report period is a 400"""
+        response = self.client.post('/api/reports/', {'detailed': True, 'from': 'yesterday'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sync_report_still_works(self):
+        """Test that the synchronous endpoint renders the same report"""
+        response = self.client.get('/api/generate-pdf-report/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+class ReportCacheTest(TestCase):
+    """Test 12: Identical report data is rendered once and served with a strong ETag"""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_single_flight(self):
+        """Test that concurrent misses for the same digest build only once"""
+        import threading
+        import time as time_module
+        from app.reports import ReportCache
+
+        cache = ReportCache(root=self.tmpdir.name)
+        builds = []
+
+        def build():
+            builds.append(1)
+            time_module.sleep(0.05)
+            return b'%PDF-test'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_create('abc', build)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual({content for content, _ in results}, {b'%PDF-test'})
+        self.assertEqual(sum(1 for _, created in results if created), 1)
+
+    def test_eviction_by_size(self):
+        """Test that the oldest entries are dropped once the cache is over its size limit"""
+        import os
+        import time as time_module
+        from app.reports import ReportCache
+
+        cache = ReportCache(root=self.tmpdir.name, max_bytes=25)
+        now = time_module.time()
+        for i, digest in enumerate(['first', 'second', 'third']):
+            cache.get_or_create(digest, lambda: b'x' * 10)
+            os.utime(cache.path(digest), (now - 100 + i, now - 100 + i))
+        cache.evict()
+
+        self.assertIsNone(cache.get('first'))
+        self.assertIsNotNone(cache.get('third'))
+
+    def test_etag_round_trip(self):
+        """Test that the report endpoint answers 304 for a matching If-None-Match"""
+        from django.test import override_settings
+
+        with override_settings(REPORTS_ROOT=self.tmpdir.name):
+            first = self.client.get('/api/generate-pdf-report/')
+            self.assertEqual(first.status_code, 200)
+            etag = first['ETag']
+
+            second = self.client.get('/api/generate-pdf-report/')
+            self.assertEqual(second['ETag'], etag)
+            self.assertEqual(second.content, first.content)
+
+            not_modified = self.client.get('/api/generate-pdf-report/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304)
+
+    def test_report_stamped_with_snapshot_time(self):
+        """Test that the cached PDF, its digest and its file name all use the snapshot's time"""
+        from django.core.cache import cache
+        from django.test import override_settings
+        from app.reports import ReportSnapshot, get_cached_report, report_filename
+
+        cache.clear()
+        with override_settings(REPORTS_ROOT=self.tmpdir.name):
+            digest, _, generated_at = get_cached_report()
+            self.assertEqual(generated_at, ReportSnapshot.current().now)
+
+            response = self.client.get('/api/generate-pdf-report/')
+            self.assertEqual(response['ETag'], f'"{digest}"')
+            self.assertIn(report_filename(generated_at), response['Content-Disposition'])
+
+            # Same figures, newer snapshot: a new stamp, so a new digest instead of a stale hit
+            ReportSnapshot.invalidate()
+            later = ReportSnapshot.build(now=generated_at + timedelta(minutes=5))
+            self.assertNotEqual(get_cached_report(later)[0], digest)
+
+    def test_single_flight_across_processes(self):
+        """Test that a render held by another process (shared cache key) is waited for, not repeated"""
+        import threading
+        from django.core.cache import cache as django_cache
+        from app.reports import ReportCache
+
+        cache = ReportCache(root=self.tmpdir.name)
+        django_cache.add('report_render:other', 'other-pid', 60)
+
+        def other_process_finishes():
+            with open(cache.path('other'), 'wb') as f:
+                f.write(b'%PDF-other')
+            django_cache.delete('report_render:other')
+
+        timer = threading.Timer(0.2, other_process_finishes)
+        timer.start()
+        content, created = cache.get_or_create('other', lambda: self.fail('rendered twice'))
+        timer.join()
+        self.assertEqual((content, created), (b'%PDF-other', False))
+
+
+class ReportSnapshotTest(TestCase):
+    """Test 13: Dashboard endpoints and exports share one snapshot computation"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.user = User.objects.create_user(email="snapshot@example.com", password="testpass123")
+        self.pro = Plan.objects.create(name="Pro", price=Decimal("10.00"))
+        self.premium = Plan.objects.create(name="Premium", price=Decimal("20.00"))
+        Subscription.objects.create(user=self.user, plan=self.pro, status='active')
+        Payment.objects.create(user=self.user, plan=self.pro, amount=Decimal("10.00"), status='paid')
+        Payment.objects.create(user=self.user, plan=self.pro, amount=Decimal("5.00"), status='failed')
+        Cost.objects.create(description="Pro servers", amount=Decimal("4.00"), category="hosting", plan=self.pro)
+        Cost.objects.create(description="CDN", amount=Decimal("1.50"), category="cdn")
+
+    def test_dashboard_and_export_share_queries(self):
+        """Test that revenue, plans, costs and a JSON export cost one snapshot build"""
+        with self.assertNumQueries(5):
+            revenue = self.client.get('/api/analytics/revenue/').json()
+            plans = self.client.get('/api/analytics/plans/').json()
+            costs = self.client.get('/api/hosting-costs/').json()
+            export = self.client.get('/api/reports/snapshot/', {'format': 'json'}).json()
+
+        self.assertEqual(revenue['total'], 10.0)
+        self.assertEqual(revenue['daily'], 10.0)
+        self.assertEqual(len(revenue['dailyChart']), 30)
+        self.assertEqual(revenue['dailyChart'][-1]['amount'], 10.0)
+        self.assertEqual(len(costs), 2)
+
+        pro = next(p for p in plans if p['name'] == "Pro")
+        self.assertEqual(pro['active_users'], 1)
+        self.assertEqual(pro['monthly_cost'], 4.0)
+        self.assertEqual(pro['net_profit'], 6.0)
+        self.assertEqual(export['total_monthly_costs'], 5.5)
+        self.assertEqual(export['users']['total'], 1)
+
+    def test_plan_analytics_single_query(self):
+        """Test that plan figures stay one query and are not inflated by joins"""
+        from app.analytics import plan_analytics
+
+        other = User.objects.create_user(email="snapshot2@example.com", password="testpass123")
+        Subscription.objects.create(user=other, plan=self.pro, status='active')
+        Subscription.objects.create(user=other, plan=self.pro, status='canceled')
+        Cost.objects.create(description="Pro backups", amount=Decimal("0.10"), plan=self.pro)
+        for i in range(50):
+            Plan.objects.create(name=f"Bulk {i}", price=Decimal("1.00"))
+
+        with self.assertNumQueries(1):
+            plans = {plan.name: plan for plan in plan_analytics()}
+
+        pro = plans["Pro"]
+        self.assertEqual(pro.active_users, 2)
+        self.assertEqual(pro.total_revenue, Decimal("20.00"))
+        self.assertEqual(pro.monthly_cost, Decimal("4.10"))
+        self.assertEqual(pro.net_profit, Decimal("15.90"))
+        self.assertEqual(pro.profit_margin, Decimal("79.50"))
+        self.assertEqual(plans["Premium"].profit_margin, Decimal("0.00"))
+        self.assertEqual(len(plans), 52)
+
+    def test_snapshot_invalidated_on_change(self):
+        """Test that creating a cost is visible on the next read"""
+        self.assertEqual(len(self.client.get('/api/hosting-costs/').json()), 2)
+        self.client.post('/api/hosting-costs/', {'description': 'Backups', 'amount': '3.00'})
+        self.assertEqual(len(self.client.get('/api/hosting-costs/').json()), 3)
+
+    def test_csv_and_pdf_exports(self):
+        """Test the CSV and PDF renderings of the snapshot"""
+        csv_response = self.client.get('/api/reports/snapshot/', {'format': 'csv'})
+        self.assertEqual(csv_response.status_code, 200)
+        self.assertIn('costs,TOTAL,amount,5.50', csv_response.content.decode())
+
+        pdf_response = self.client.get('/api/reports/snapshot/', {'format': 'pdf'})
+        self.assertTrue(pdf_response.content.startswith(b'%PDF'))
+        self.assertEqual(self.client.get('/api/reports/snapshot/', {'format': 'xml'}).status_code, 400)
+
+
+class DataExportTest(TestCase):
+    """Test 14: Streaming CSV/NDJSON exports"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="export@example.com", password="testpass123")
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        for i in range(3):
+            Payment.objects.create(user=self.user, plan=self.plan, amount=Decimal("9.99"),
+                                   status='paid', transaction_id=f'txn_{i}')
+        old = Payment.objects.create(user=self.user, plan=self.plan, amount=Decimal("1.00"), status='paid')
+        Payment.objects.filter(id=old.id).update(payment_date=timezone.now() - timedelta(days=40))
+
+    def test_csv_export(self):
+        """Test that the CSV export streams a header plus one line per row"""
+        response = self.client.get('/api/exports/payments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'user_id', 'user_email'])
+        self.assertEqual(len(lines), 5)
+
+    def test_ndjson_export_with_window_and_gzip(self):
+        """Test the NDJSON format, the date window and gzip compression"""
+        import gzip
+        import json
+
+        since = (timezone.localdate() - timedelta(days=7)).isoformat()
+        response = self.client.get('/api/exports/payments/', {'format': 'ndjson', 'from': since, 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['user_email'], "export@example.com")
+        self.assertEqual(rows[0]['amount'], "9.99")
+
+    def test_unknown_resource(self):
+        """Test that unknown resources and formats are rejected"""
+        self.assertEqual(self.client.get('/api/exports/secrets/').status_code, 404)
+        self.assertEqual(self.client.get('/api/exports/users/', {'format': 'xlsx'}).status_code, 400)
+
+
+class CostLedgerTest(TestCase):
+    """Test 15: Costs are amortized per day over their billing period"""
+
+    def setUp(self):
+        from datetime import date
+        self.start = date(2025, 1, 1)
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        Cost.objects.create(description="Servers", amount=Decimal("30.00"), recurrence='monthly',
+                            plan=self.plan, period_start=date(2025, 1, 5))
+        Cost.objects.create(description="Domain", amount=Decimal("36.50"), recurrence='yearly')
+        Cost.objects.create(description="Migration", amount=Decimal("20.00"), recurrence='one_time',
+                            period_start=date(2025, 1, 2), period_end=date(2025, 1, 3))
+
+    def test_daily_series_single_query(self):
+        """Test monthly, yearly and one-time amortization in one query"""
+        from app.analytics import daily_cost_series
+
+        with self.assertNumQueries(1):
+            series = dict(daily_cost_series(self.start, self.start + timedelta(days=9)))
+
+        self.assertEqual(len(series), 10)
+        self.assertEqual(series[self.start], 0.10)                           # yearly only
+        self.assertEqual(series[self.start + timedelta(days=1)], 10.10)      # + one-time
+        self.assertEqual(series[self.start + timedelta(days=3)], 0.10)
+        self.assertEqual(series[self.start + timedelta(days=4)], 1.10)       # + monthly
+
+        plan_series = dict(daily_cost_series(self.start, self.start + timedelta(days=9), plan=self.plan))
+        self.assertEqual(plan_series[self.start], 0)
+        self.assertEqual(plan_series[self.start + timedelta(days=9)], 1.0)
+
+    def test_one_time_cost_defaults_to_its_day(self):
+        """Test that a one-time cost without a period is charged on the day it is recorded"""
+        cost = Cost.objects.create(description="Audit", amount=Decimal("5.00"), recurrence='one_time')
+        self.assertEqual(cost.period_start, timezone.localdate())
+        self.assertEqual(cost.period_end, timezone.localdate())
+
+    def test_daily_endpoint(self):
+        """Test the amortized cost series endpoint and its validation"""
+        response = self.client.get('/api/hosting-costs/daily/', {'from': '2025-01-01', 'to': '2025-01-02'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'date': '2025-01-01', 'amount': 0.1},
+            {'date': '2025-01-02', 'amount': 10.1},
+        ])
+        self.assertEqual(self.client.get('/api/hosting-costs/daily/', {'from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/hosting-costs/daily/', {'plan_id': 'pro'}).status_code, 400)
+        response = self.client.post('/api/hosting-costs/', {'description': 'X', 'amount': '1.00',
+                                                           'recurrence': 'weekly'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CostBulkImportTest(TestCase):
+    """Test 16: Batch cost import, update and delete with idempotency keys"""
+
+    def setUp(self):
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        self.existing = Cost.objects.create(description="CDN", amount=Decimal("10.00"), category="cdn")
+
+    def test_json_batch_creates_and_updates(self):
+        """Test that one JSON batch creates new rows and updates existing ones"""
+        rows = [
+            {'description': 'Servers', 'amount': '40.00', 'plan_id': self.plan.id},
+            {'description': 'Migration', 'amount': '12.5', 'recurrence': 'one_time',
+             'period_start': '2025-03-01', 'period_end': '2025-03-10'},
+            {'id': self.existing.id, 'amount': '11.00'},
+        ]
+        response = self.client.post('/api/hosting-costs/bulk/', {'costs': rows}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['updated'], 1)
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.amount, Decimal("11.00"))
+        self.assertEqual(self.existing.description, "CDN")
+        self.assertEqual(Cost.objects.get(description="Servers").plan, self.plan)
+        self.assertEqual(Cost.objects.count(), 3)
+
+    def test_csv_batch_and_validation(self):
+        """Test CSV upload and that one bad row rejects the whole batch"""
+        csv_body = "description,amount,category\nBackups,5.00,hosting\nDNS,abc,hosting\n"
+        response = self.client.post('/api/hosting-costs/bulk/', csv_body, content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'row': 1, 'error': "amount 'abc' is not a number"}])
+        self.assertEqual(Cost.objects.count(), 1)
+
+        response = self.client.post('/api/hosting-costs/bulk/', csv_body.replace('abc', '2.00'),
+                                    content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Cost.objects.count(), 3)
+
+    def test_idempotent_retry(self):
+        """Test that a retried upload with the same key does not duplicate rows"""
+        body = {'costs': [{'description': 'Servers', 'amount': '40.00'}]}
+        first = self.client.post('/api/hosting-costs/bulk/', body, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='march-invoices')
+        retry = self.client.post('/api/hosting-costs/bulk/', body, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='march-invoices')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Cost.objects.filter(description='Servers').count(), 1)
+
+        other = self.client.post('/api/hosting-costs/bulk/', {'costs': [{'description': 'X', 'amount': '1'}]},
+                                 content_type='application/json', HTTP_IDEMPOTENCY_KEY='march-invoices')
+        self.assertEqual(other.status_code, 422)
+
+    def test_snapshot_invalidated_after_commit(self):
+        """Test that the cached figures are dropped only once the idempotent batch commits"""
+        from unittest import mock
+
+        with mock.patch('app.costs.invalidate_snapshot') as invalidate:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                self.client.post('/api/hosting-costs/bulk/', {'costs': [{'description': 'S', 'amount': '4'}]},
+                                 content_type='application/json', HTTP_IDEMPOTENCY_KEY='april-invoices')
+            invalidate.assert_not_called()
+            for callback in callbacks:
+                callback()
+            invalidate.assert_called_once()
+
+    def test_batch_delete(self):
+        """Test deleting several costs in one request"""
+        extra = Cost.objects.create(description="DNS", amount=Decimal("1.00"))
+        response = self.client.delete('/api/hosting-costs/bulk/', {'ids': [self.existing.id, extra.id]},
+                                      content_type='application/json')
+        self.assertEqual(response.json(), {'deleted': 2})
+        self.assertFalse(Cost.objects.exists())
+
+
+class PlansCatalogCacheTest(TestCase):
+    """Test 17: The public plans catalog is cached and served with ETag/304"""
+
+    def setUp(self):
+        from app.catalog import invalidate_catalog
+        invalidate_catalog()
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+
+    def test_cached_catalog_and_conditional_get(self):
+        """Test that repeat reads skip the database and If-None-Match gets a 304"""
+        first = self.client.get('/api/plans/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('max-age=', first['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/plans/')
+            not_modified = self.client.get('/api/plans/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_plan_changes_invalidate_catalog(self):
+        """Test that updating a plan changes the catalog and its ETag"""
+        etag = self.client.get('/api/plans/')['ETag']
+        self.client.put('/api/plans/', {'id': self.plan.id, 'price': '12.00'}, content_type='application/json')
+
+        response = self.client.get('/api/plans/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['price'], 12.0)
+
+
+class UserListPaginationTest(TestCase):
+    """Test 18: Admin user list is keyset-paginated, filterable and projectable"""
+
+    def setUp(self):
+        joined = timezone.now()
+        users = [
+            User(email=f"user{i:02d}@example.com", role='admin' if i % 5 == 0 else 'user',
+                 is_active=i % 7 != 0, date_joined=joined - timedelta(minutes=i % 3))
+            for i in range(25)
+        ]
+        User.objects.bulk_create(users)
+
+    def test_pages_cover_every_user_once(self):
+        """Test that following next_cursor walks all users newest first without repeats"""
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 10, **({'cursor': cursor} if cursor else {})}
+            page = self.client.get('/api/users/', params).json()
+            seen.extend(page['results'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len({u['id'] for u in seen}), 25)
+        joined = [u['created_at'] for u in seen]
+        self.assertEqual(joined, sorted(joined, reverse=True))
+        self.assertEqual(page['count'], 25)
+
+    def test_filters_and_fields(self):
+        """Test role/is_active/email_prefix filters and the fields projection"""
+        page = self.client.get('/api/users/', {'role': 'admin', 'is_active': 'true', 'fields': 'id,email'}).json()
+        self.assertEqual(page['count'], 4)
+        self.assertTrue(all(set(u) == {'id', 'email'} for u in page['results']))
+
+        page = self.client.get('/api/users/', {'email_prefix': 'USER1'}).json()
+        self.assertEqual(page['count'], 10)
+        self.assertTrue(page['count_is_exact'])
+
+        self.assertEqual(self.client.get('/api/users/', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/users/', {'cursor': 'nope'}).status_code, 400)
+
+
+class StripeWebhookTest(TestCase):
+    """Test 19: Stripe webhooks are verified, stored once and processed asynchronously"""
+
+    SECRET = 'whsec_test_secret'
+
+    def setUp(self):
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+
+    def _signed_post(self, event, secret=None):
+        """POST an event signed locally the way Stripe signs deliveries"""
+        import hashlib
+        import hmac
+        import json
+        import time
+        from django.test import override_settings
+
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new((secret or self.SECRET).encode(), f"{timestamp}.{payload}".encode(),
+                             hashlib.sha256).hexdigest()
+        with override_settings(STRIPE_WEBHOOK_SECRET=self.SECRET):
+            return self.client.post('/api/stripe/webhook/', payload, content_type='application/json',
+                                    HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}")
+
+    def _event(self, event_id, event_type='payment_intent.succeeded'):
+        return {
+            'id': event_id,
+            'object': 'event',
+            'type': event_type,
+            'livemode': False,
+            'data': {'object': {
+                'id': 'pi_webhook_1', 'object': 'payment_intent', 'amount': 999, 'amount_received': 999,
+                'currency': 'eur', 'metadata': {'user_email': 'webhook@example.com', 'plan_id': str(self.plan.id)},
+            }},
+        }
+
+    def test_event_stored_once_and_processed(self):
+        """Test that a redelivered event is stored once and activates the plan once"""
+        from app.models import StripeEvent
+        from app.stripe_webhooks import process_stripe_event
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            first = self._signed_post(self._event('evt_1'))
+            retry = self._signed_post(self._event('evt_1'))
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(retry.json()['duplicate'])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(StripeEvent.objects.get(id='evt_1').status, 'pending')
+
+        # Run the worker inline; a second run finds nothing to claim
+        process_stripe_event('evt_1')
+        self.assertIsNone(process_stripe_event('evt_1'))
+
+        self.assertEqual(StripeEvent.objects.get(id='evt_1').status, 'processed')
+        payment = Payment.objects.get(transaction_id='pi_webhook_1')
+        self.assertEqual(payment.amount, Decimal("9.99"))
+        self.assertEqual(Subscription.objects.get(user__email='webhook@example.com').status, 'active')
+
+    def test_bad_signature_rejected(self):
+        """Test that an event signed with the wrong secret is not stored"""
+        from app.models import StripeEvent
+
+        response = self._signed_post(self._event('evt_2'), secret='whsec_wrong')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_unhandled_and_failed_events(self):
+        """Test unknown types are ignored and handler errors are kept for retry"""
+        from app.models import StripeEvent
+        from app.stripe_webhooks import process_pending_events
+
+        broken = self._event('evt_4')
+        broken['data']['object']['metadata'] = {}
+        with self.captureOnCommitCallbacks(execute=False):
+            self._signed_post(self._event('evt_3', 'customer.created'))
+            self._signed_post(broken)
+
+        self.assertEqual(process_pending_events(), 2)
+        self.assertEqual(StripeEvent.objects.get(id='evt_3').status, 'ignored')
+        failed = StripeEvent.objects.get(id='evt_4')
+        self.assertEqual(failed.status, 'failed')
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('metadata', failed.error)
+
+    def test_renewal_intent_event_is_processed(self):
+        """Test that the webhook for an off-session renewal charge is handled, not retried forever"""
+        from app.models import StripeEvent
+        from app.stripe_webhooks import process_stripe_event
+
+        renewal = self._event('evt_renewal')
+        renewal['data']['object']['id'] = 'pi_renewal_1'
+        renewal['data']['object']['metadata'] = {'plan_id': str(self.plan.id), 'subscription_id': '1',
+                                                 'renewal': 'true'}
+        with self.captureOnCommitCallbacks(execute=False):
+            self._signed_post(renewal)
+
+        self.assertEqual(process_stripe_event('evt_renewal').status, 'processed')
+        self.assertEqual(StripeEvent.objects.get(id='evt_renewal').error, '')
+        self.assertFalse(Payment.objects.filter(transaction_id='pi_renewal_1').exists())
+
+    def test_stuck_processing_events_are_reclaimed(self):
+        """Test that events a dead worker left processing are retried once the claim is stale"""
+        from app.models import StripeEvent
+        from app.stripe_webhooks import MAX_ATTEMPTS, process_pending_events
+
+        with self.captureOnCommitCallbacks(execute=False):
+            self._signed_post(self._event('evt_5', 'customer.created'))
+            self._signed_post(self._event('evt_6', 'customer.created'))
+            self._signed_post(self._event('evt_7', 'customer.created'))
+        long_ago = timezone.now() - timedelta(hours=1)
+        StripeEvent.objects.filter(id='evt_5').update(status='processing', attempts=1, claimed_at=long_ago)
+        StripeEvent.objects.filter(id='evt_6').update(status='processing', attempts=1, claimed_at=timezone.now())
+        StripeEvent.objects.filter(id='evt_7').update(status='processing', attempts=MAX_ATTEMPTS,
+                                                      claimed_at=long_ago)
+
+        self.assertEqual(process_pending_events(), 1)
+        self.assertEqual(StripeEvent.objects.get(id='evt_5').status, 'ignored')
+        self.assertEqual(StripeEvent.objects.get(id='evt_6').status, 'processing')
+        self.assertEqual(StripeEvent.objects.get(id='evt_7').status, 'failed')
+
+
+class PaymentConfirmationIdempotencyTest(TestCase):
+    """Test 20: Confirming the same payment twice replays the first result"""
+
+    def setUp(self):
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        self.body = {'payment_intent_id': 'pi_demo_double_click', 'user_email': 'buyer@example.com',
+                     'plan_id': self.plan.id}
+
+    def test_retry_replays_original_confirmation(self):
+        """Test that a double click creates one payment and one subscription"""
+        first = self.client.post('/api/confirm-payment/', self.body, content_type='application/json')
+        retry = self.client.post('/api/confirm-payment/', self.body, content_type='application/json')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Payment.objects.filter(transaction_id='pi_demo_double_click').count(), 1)
+        self.assertEqual(Subscription.objects.filter(user__email='buyer@example.com').count(), 1)
+
+        other = dict(self.body, user_email='someone@example.com')
+        self.assertEqual(self.client.post('/api/confirm-payment/', other,
+                                          content_type='application/json').status_code, 409)
+
+    def test_transaction_id_is_unique(self):
+        """Test the database rejects a second payment row for one transaction"""
+        from django.db import IntegrityError, transaction
+
+        user = User.objects.create_user(email="unique@example.com", password="testpass123")
+        Payment.objects.create(user=user, plan=self.plan, amount=self.plan.price, transaction_id='pi_1')
+        Payment.objects.create(user=user, plan=self.plan, amount=self.plan.price)
+        Payment.objects.create(user=user, plan=self.plan, amount=self.plan.price)  # blank ids are allowed
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Payment.objects.create(user=user, plan=self.plan, amount=self.plan.price, transaction_id='pi_1')
+
+    def test_failed_attempt_upgraded_to_paid(self):
+        """Test that a payment intent that failed then succeeded keeps one row"""
+        from app.payments import activate_paid_plan
+
+        user = User.objects.create_user(email="retry@example.com", password="testpass123")
+        Payment.objects.create(user=user, plan=self.plan, amount=self.plan.price, status='failed',
+                               transaction_id='pi_retry')
+        payment, subscription, created = activate_paid_plan("retry@example.com", self.plan, transaction_id='pi_retry')
+        self.assertTrue(created)
+        self.assertEqual(payment.status, 'paid')
+        self.assertEqual(Payment.objects.filter(transaction_id='pi_retry').count(), 1)
+        self.assertEqual(subscription.status, 'active')
+
+
+class StripeGatewayTest(TestCase):
+    """Test 21: The shared Stripe client retries within its budget against a local stub server"""
+
+    def setUp(self):
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.requests = []
+        self.failures = 0
+        test = self
+
+        class StubStripe(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, code, body):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                test.requests.append((self.command, self.path, self.headers.get('Idempotency-Key')))
+                if test.failures:
+                    test.failures -= 1
+                    return self._reply(503, {'error': {'type': 'api_error', 'message': 'try again'}})
+                self._reply(200, {'id': 'pi_stub_1', 'object': 'payment_intent', 'status': 'succeeded',
+                                  'amount': 999, 'client_secret': 'pi_stub_1_secret'})
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubStripe)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _gateway(self, **kwargs):
+        from app.stripe_client import StripeGateway
+        options = {'backoff_base': 0.01, 'backoff_max': 0.02, **kwargs}
+        return StripeGateway('sk_test_stub', api_base=f'http://127.0.0.1:{self.server.server_port}', **options)
+
+    def test_create_retries_with_one_idempotency_key(self):
+        """Test that 5xx responses are retried with the same idempotency key and metered"""
+        gateway = self._gateway()
+        self.failures = 2
+        intent = gateway.create_payment_intent(amount=999, currency='eur')
+
+        self.assertEqual(intent.id, 'pi_stub_1')
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(len({key for _, _, key in self.requests}), 1)
+        self.assertIsNotNone(self.requests[0][2])
+
+        metrics = gateway.metrics.snapshot()['payment_intents.create']
+        self.assertEqual((metrics['calls'], metrics['retries'], metrics['errors']), (1, 2, 0))
+        self.assertIsNotNone(metrics['p95_ms'])
+
+    def test_retry_limit_and_budget(self):
+        """Test that retries stop at max_retries and when the time budget is spent"""
+        import stripe
+
+        gateway = self._gateway(max_retries=1)
+        self.failures = 5
+        with self.assertRaises(stripe.APIError):
+            gateway.retrieve_payment_intent('pi_stub_1')
+        self.assertEqual(len(self.requests), 2)
+
+        self.requests.clear()
+        gateway = self._gateway(max_retries=5, retry_budget=0.0)
+        with self.assertRaises(stripe.APIError):
+            gateway.retrieve_payment_intent('pi_stub_1')
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(gateway.metrics.snapshot()['payment_intents.retrieve']['errors'], 1)
+
+    def test_shared_retry_budget_and_metrics_endpoint(self):
+        """Test that retries stop process-wide once the retry tokens run out, and the endpoint reports it"""
+        import stripe
+        from app.stripe_client import set_stripe_gateway
+
+        gateway = self._gateway(max_retries=5, retry_tokens=3, retry_token_refill=0.5)
+        self.failures = 100
+        with self.assertRaises(stripe.APIError):
+            gateway.retrieve_payment_intent('pi_stub_1')
+        with self.assertRaises(stripe.APIError):
+            gateway.retrieve_payment_intent('pi_stub_1')
+        # 3 retries for the first call, none left for the second
+        self.assertEqual(len(self.requests), 5)
+
+        self.failures = 0
+        gateway.retrieve_payment_intent('pi_stub_1')
+        set_stripe_gateway(gateway)
+        try:
+            body = self.client.get('/api/stripe/metrics/').json()
+        finally:
+            set_stripe_gateway(None)
+        self.assertEqual(body['retry_tokens'], {'available': 0.5, 'capacity': 3})
+        self.assertEqual(body['operations']['payment_intents.retrieve']['calls'], 3)
+        self.assertEqual(body['operations']['payment_intents.retrieve']['retries'], 3)
+
+
+class CheckoutIntentReuseTest(TestCase):
+    """Test 22: Reopened checkouts reuse their PaymentIntent and stale ones are swept"""
+
+    class FakeGateway:
+        def __init__(self):
+            self.created = []
+            self.canceled = []
+            self.refuse_cancel = {}
+            self.customers = []
+
+        def create_customer(self, idempotency_key=None, **params):
+            from types import SimpleNamespace
+            self.customers.append(params['email'])
+            return SimpleNamespace(id=f"cus_fake_{len(self.customers)}")
+
+        def create_payment_intent(self, **params):
+            from types import SimpleNamespace
+            intent_id = f"pi_fake_{len(self.created) + 1}"
+            self.created.append(params)
+            return SimpleNamespace(id=intent_id, client_secret=f"{intent_id}_secret")
+
+        def cancel_payment_intent(self, intent_id):
+            import stripe
+            if intent_id in self.refuse_cancel:
+                raise stripe.InvalidRequestError('cannot cancel', param=None)
+            self.canceled.append(intent_id)
+
+        def retrieve_payment_intent(self, intent_id):
+            from types import SimpleNamespace
+            return SimpleNamespace(id=intent_id, status=self.refuse_cancel[intent_id])
+
+    def setUp(self):
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        self.gateway = self.FakeGateway()
+
+    def _checkout(self, email='buyer@example.com', amount=999):
+        from app.checkout import get_or_create_checkout_intent
+        return get_or_create_checkout_intent(self.gateway, email, self.plan, amount, 'eur', {'plan_id': self.plan.id})
+
+    def test_reopened_checkout_reuses_intent(self):
+        """Test that the same checkout gets the same intent and one Stripe create"""
+        first = self._checkout()
+        second = self._checkout()
+        self.assertEqual(second[:2], first[:2])
+        self.assertEqual((first[2], second[2]), (False, True))
+        self.assertEqual(len(self.gateway.created), 1)
+
+        self._checkout(amount=1999)
+        self._checkout(email='other@example.com')
+        self.assertEqual(len(self.gateway.created), 3)
+
+        # Each buyer gets one Stripe customer and the card is saved for renewals
+        self.assertEqual(self.gateway.customers, ['buyer@example.com', 'other@example.com'])
+        self.assertEqual([p['customer'] for p in self.gateway.created], ['cus_fake_1', 'cus_fake_1', 'cus_fake_2'])
+        self.assertTrue(all(p['setup_future_usage'] == 'off_session' for p in self.gateway.created))
+        self.assertEqual(User.objects.get(email='buyer@example.com').stripe_customer_id, 'cus_fake_1')
+
+    def test_sweep_cancels_expired_and_records_succeeded(self):
+        """Test that expired intents are cancelled in batches and paid ones are kept"""
+        from app.checkout import sweep_stale_intents
+        from app.models import CheckoutIntent
+
+        for i in range(5):
+            self._checkout(email=f"user{i}@example.com")
+        self._checkout(email='fresh@example.com')
+        CheckoutIntent.objects.exclude(user_email='fresh@example.com').update(
+            expires_at=timezone.now() - timedelta(minutes=1))
+        self.gateway.refuse_cancel['pi_fake_1'] = 'succeeded'
+
+        counts = sweep_stale_intents(self.gateway, batch_size=2)
+
+        self.assertEqual(counts, {'canceled': 4, 'succeeded': 1, 'reopened': 0})
+        self.assertEqual(CheckoutIntent.objects.get(payment_intent_id='pi_fake_1').status, 'succeeded')
+        self.assertEqual(CheckoutIntent.objects.get(payment_intent_id='pi_fake_6').status, 'open')
+        self.assertEqual(self._checkout(email='user2@example.com')[0], 'pi_fake_7')
+
+    def test_confirmed_payment_closes_intent(self):
+        """Test that activating the plan marks the intent succeeded so it is not reused"""
+        from app.models import CheckoutIntent
+        from app.payments import activate_paid_plan
+
+        intent_id, _, _ = self._checkout()
+        activate_paid_plan('buyer@example.com', self.plan, transaction_id=intent_id)
+        self.assertEqual(CheckoutIntent.objects.get(payment_intent_id=intent_id).status, 'succeeded')
+        self.assertNotEqual(self._checkout()[0], intent_id)
+
+
+class QueryIndexBenchmarkTest(TestCase):
+    """Test 23: The hot-path indexes exist and the benchmark command compares plans with and without them"""
+
+    def test_benchmark_runs_and_rolls_back(self):
+        """Test that the benchmark reports every query shape and leaves no seeded rows"""
+        from io import StringIO
+        from django.core.management import call_command
+        from app.management.commands.benchmark_queries import QUERY_SHAPES
+
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command('benchmark_queries', users=5, stdout=StringIO())
+
+        out = StringIO()
+        call_command('benchmark_queries', users=5, payments_per_user=2, sessions_per_user=3,
+                     repeat=1, seed=7, locks_ok=True, stdout=out)
+        output = out.getvalue()
+
+        for name, _ in QUERY_SHAPES:
+            self.assertIn(name, output.split('Summary')[1])
+        self.assertIn('Without indexes', output)
+        self.assertFalse(User.objects.filter(email__startswith='bench').exists())
+        self.assertFalse(UserSession.objects.exists())
+
+        from django.db import connection
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, UserSession._meta.db_table)
+        self.assertIn('session_open_user_idx', constraints)
+
+
+class ActiveSubscriptionConstraintTest(TestCase):
+    """Test 24: A user has at most one active subscription and plan activation swaps it"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="single@example.com", password="testpass123")
+        self.pro = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        self.premium = Plan.objects.create(name="Premium", price=Decimal("19.99"))
+
+    def test_second_active_subscription_rejected(self):
+        """Test the database refuses two active rows but allows any number of canceled ones"""
+        from django.db import IntegrityError, transaction
+
+        Subscription.objects.create(user=self.user, plan=self.pro, status='active')
+        Subscription.objects.create(user=self.user, plan=self.pro, status='canceled')
+        Subscription.objects.create(user=self.user, plan=self.premium, status='canceled')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subscription.objects.create(user=self.user, plan=self.premium, status='active')
+
+    def test_swap_replaces_active_subscription(self):
+        """Test that swapping closes the old row and the lookup returns the new one"""
+        from app.payments import active_subscription, swap_active_subscription
+
+        old = Subscription.objects.create(user=self.user, plan=self.pro, status='active')
+        new = swap_active_subscription(self.user, self.premium)
+
+        old.refresh_from_db()
+        self.assertEqual(old.status, 'canceled')
+        self.assertIsNotNone(old.end_date)
+        with self.assertNumQueries(1):
+            current = active_subscription(self.user)
+            self.assertEqual(current.plan.name, "Premium")
+        self.assertEqual(current.id, new.id)
+
+    def test_swap_clears_past_due_subscription(self):
+        """Test that checking out again closes a subscription left past due by renewals"""
+        from app.payments import swap_active_subscription
+
+        past_due = Subscription.objects.create(user=self.user, plan=self.pro, status='past_due')
+        swap_active_subscription(self.user, self.premium)
+
+        past_due.refresh_from_db()
+        self.assertEqual(past_due.status, 'canceled')
+        self.assertEqual(list(Subscription.objects.filter(user=self.user).exclude(status='canceled')
+                              .values_list('status', flat=True)), ['active'])
+
+
+class SubscriptionRenewalTest(TestCase):
+    """Test 25: Due renewals are charged or expired in batches with bulk writes"""
+
+    def setUp(self):
+        self.pro = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        self.free = Plan.objects.create(name="Free", price=Decimal("0.00"))
+        self.now = timezone.now()
+        self.due = []
+        for i in range(7):
+            user = User.objects.create_user(email=f"renew{i}@example.com", password="testpass123")
+            self.due.append(Subscription.objects.create(
+                user=user, plan=self.pro, status='active', renewal_date=self.now - timedelta(days=i)))
+        later = User.objects.create_user(email="later@example.com", password="testpass123")
+        self.not_due = Subscription.objects.create(user=later, plan=self.pro, status='active',
+                                                   renewal_date=self.now + timedelta(days=3))
+
+    def test_renews_and_expires_in_batches(self):
+        """Test that charged renewals move a period forward and declined ones expire"""
+        from app.payments import SUBSCRIPTION_PERIOD
+        from app.renewals import RenewalDeclined, process_due_renewals
+
+        declined = self.due[2].id
+
+        def charger(subscription, source):
+            if subscription.id == declined:
+                raise RenewalDeclined('card declined')
+            return f"pi_renew_{subscription.id}"
+
+        counts = process_due_renewals(charger, batch_size=3, concurrency=4, now=self.now)
+
+        self.assertEqual(counts, {'renewed': 6, 'expired': 1, 'past_due': 0, 'skipped': 0})
+        self.assertFalse(Subscription.objects.exclude(renewal_claimed_at=None).exists())
+        renewed = Subscription.objects.get(id=self.due[0].id)
+        self.assertEqual(renewed.renewal_date, self.now + SUBSCRIPTION_PERIOD)
+        self.assertTrue(Payment.objects.filter(transaction_id=f"pi_renew_{renewed.id}", status='paid').exists())
+
+        expired = Subscription.objects.get(id=declined)
+        self.assertEqual(expired.status, 'canceled')
+        self.assertEqual(Payment.objects.filter(status='failed').count(), 1)
+        self.assertEqual(Subscription.objects.get(id=self.not_due.id).renewal_date, self.not_due.renewal_date)
+
+        # Nothing is due any more, so a second run charges no one
+        self.assertEqual(process_due_renewals(charger, now=self.now)['renewed'], 0)
+
+    def test_free_plans_and_outages(self):
+        """Test that free plans renew without a charge and Stripe outages leave rows due"""
+        import stripe
+        from app.renewals import process_due_renewals
+
+        # Oldest first: the four most overdue rows make up the run
+        Subscription.objects.filter(id=self.due[6].id).update(plan=self.free)
+        calls = []
+
+        def charger(subscription, source):
+            calls.append(subscription.id)
+            raise stripe.APIConnectionError('timeout')
+
+        counts = process_due_renewals(charger, batch_size=50, now=self.now, limit=4)
+
+        self.assertEqual(counts, {'renewed': 1, 'expired': 0, 'past_due': 0, 'skipped': 3})
+        self.assertNotIn(self.due[6].id, calls)
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(Subscription.objects.filter(status='active', renewal_date__lte=self.now).count(), 6)
+
+    def test_long_overdue_subscription_charged_once_per_run(self):
+        """Test that a subscription 3 periods overdue is charged once and moved past now"""
+        from app.payments import SUBSCRIPTION_PERIOD
+        from app.renewals import process_due_renewals
+
+        Subscription.objects.filter(id__in=[s.id for s in self.due[1:]]).update(status='canceled')
+        overdue = self.due[0]
+        Subscription.objects.filter(id=overdue.id).update(renewal_date=self.now - 3 * SUBSCRIPTION_PERIOD)
+        calls = []
+
+        def charger(subscription, source):
+            calls.append(subscription.id)
+            return f"pi_overdue_{len(calls)}"
+
+        counts = process_due_renewals(charger, batch_size=1, now=self.now)
+
+        self.assertEqual(calls, [overdue.id])
+        self.assertEqual(counts['renewed'], 1)
+        renewal_date = Subscription.objects.get(id=overdue.id).renewal_date
+        self.assertEqual(renewal_date, self.now + SUBSCRIPTION_PERIOD)
+
+    def test_no_saved_card_is_past_due_and_claims_are_respected(self):
+        """Test that renewals without a saved card go past due and claimed rows are left alone"""
+        from app.renewals import NoSavedPaymentMethod, process_due_renewals
+
+        # Claimed a moment ago by another scheduler: not touched
+        Subscription.objects.filter(id=self.due[0].id).update(renewal_claimed_at=timezone.now())
+        # Claimed long ago by a scheduler that died: picked up again
+        Subscription.objects.filter(id=self.due[1].id).update(
+            renewal_claimed_at=timezone.now() - timedelta(hours=1))
+
+        def charger(subscription, source):
+            raise NoSavedPaymentMethod('no card')
+
+        counts = process_due_renewals(charger, now=self.now)
+
+        self.assertEqual(counts, {'renewed': 0, 'expired': 0, 'past_due': 6, 'skipped': 0})
+        self.assertEqual(Subscription.objects.get(id=self.due[0].id).status, 'active')
+        self.assertEqual(Subscription.objects.get(id=self.due[1].id).status, 'past_due')
+        self.assertFalse(Payment.objects.exists())
+
+
+class AccountSummaryTest(TestCase):
+    """Test 26: The account summary is two queries, cached per user and invalidated on change"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.user = User.objects.create_user(email="summary@example.com", password="testpass123")
+        self.pro = Plan.objects.create(name="Pro", price=Decimal("9.99"))
+        self.premium = Plan.objects.create(name="Premium", price=Decimal("19.99"))
+        Subscription.objects.create(user=self.user, plan=self.pro, status='active',
+                                    renewal_date=timezone.now() + timedelta(days=10, hours=1))
+        for i in range(8):
+            Payment.objects.create(user=self.user, plan=self.pro if i % 2 else self.premium,
+                                   amount=Decimal("9.99"), transaction_id=f"pi_summary_{i}")
+
+    def test_summary_two_queries_then_cached(self):
+        """Test that subscription, next payment and history cost two queries, then none"""
+        with self.assertNumQueries(2):
+            summary = self.client.get('/api/account-summary/', {'email': 'summary@example.com'}).json()
+
+        self.assertEqual(summary['subscription']['plan_name'], "Pro")
+        self.assertEqual(summary['next_payment']['days_until_payment'], 10)
+        self.assertEqual(len(summary['payment_history']), 5)
+        self.assertEqual(summary['payment_history'][0]['transaction_id'], "pi_summary_7")
+
+        with self.assertNumQueries(0):
+            info = self.client.post('/api/subscription-management/', {'email': 'summary@example.com'},
+                                    content_type='application/json').json()
+            legacy = self.client.get('/api/user-subscription/', {'email': 'summary@example.com'}).json()
+        self.assertEqual(info['plan_name'], "Pro")
+        self.assertEqual(legacy['payment_history'], summary['payment_history'])
+        self.assertEqual(self.client.get('/api/account-summary/', {'email': 'nobody@example.com'}).status_code, 404)
+
+    def test_payment_and_plan_changes_invalidate(self):
+        """Test that a new payment, a plan swap and a plan edit show up immediately"""
+        from app.accounts import get_account_summary
+        from app.payments import activate_paid_plan
+
+        get_account_summary("summary@example.com")
+        activate_paid_plan("summary@example.com", self.premium, transaction_id="pi_summary_new")
+        summary = get_account_summary("summary@example.com")
+        self.assertEqual(summary['subscription']['plan_name'], "Premium")
+        self.assertEqual(summary['payment_history'][0]['transaction_id'], "pi_summary_new")
+
+        self.premium.name = "Premium Plus"
+        self.premium.save()
+        self.assertEqual(get_account_summary("summary@example.com")['subscription']['plan_name'], "Premium Plus")
+
+    def test_emails_differing_in_case_are_cached_apart(self):
+        """Test that two accounts whose emails differ only in case never share a cached summary"""
+        from django.core.cache import cache
+        from app.accounts import GENERATION_KEY, get_account_summary
+
+        User.objects.create_user(email="Summary@example.com", password="testpass123")
+        self.assertIsNotNone(get_account_summary("summary@example.com")['subscription'])
+        self.assertIsNone(get_account_summary("Summary@example.com")['subscription'])
+
+        # A culled generation counter restarts at a fresh value, not at an old generation
+        generation = cache.get(GENERATION_KEY)
+        cache.delete(GENERATION_KEY)
+        get_account_summary("summary@example.com")
+        self.assertGreater(cache.get(GENERATION_KEY), generation)
+
+
+class PaymentLedgerTest(TestCase):
+    """Test 27: Per-user payment totals stay in step with payments and drive LTV sorting"""
+
+    def setUp(self):
+        self.plan = Plan.objects.create(name="Pro", price=Decimal("10.00"))
+        self.big = User.objects.create_user(email="big@example.com", password="testpass123")
+        self.small = User.objects.create_user(email="small@example.com", password="testpass123")
+        self.none = User.objects.create_user(email="none@example.com", password="testpass123")
+        for i in range(3):
+            Payment.objects.create(user=self.big, plan=self.plan, amount=Decimal("10.00"), transaction_id=f"pi_big_{i}")
+        Payment.objects.create(user=self.small, plan=self.plan, amount=Decimal("4.50"))
+        Payment.objects.create(user=self.small, plan=self.plan, amount=Decimal("99.00"), status='failed')
+
+    def test_totals_maintained_on_insert_update_delete(self):
+        """Test that inserts increment, and edits/deletes recompute, the stats row"""
+        from app.models import UserPaymentStats
+
+        stats = UserPaymentStats.objects.get(user=self.big)
+        self.assertEqual((stats.total_paid, stats.payment_count), (Decimal("30.00"), 3))
+        self.assertIsNotNone(stats.first_payment_at)
+        self.assertEqual(UserPaymentStats.objects.get(user=self.small).total_paid, Decimal("4.50"))
+        self.assertEqual(UserPaymentStats.objects.get(user=self.none).payment_count, 0)
+
+        failed = Payment.objects.get(user=self.small, status='failed')
+        failed.status = 'paid'
+        failed.save()
+        Payment.objects.filter(transaction_id="pi_big_0").get().delete()
+
+        self.assertEqual(UserPaymentStats.objects.get(user=self.small).total_paid, Decimal("103.50"))
+        self.assertEqual(UserPaymentStats.objects.get(user=self.big).payment_count, 2)
+
+    def test_purchases_paginated_and_users_sorted_by_ltv(self):
+        """Test keyset pages of purchases and the ?sort=ltv admin list"""
+        first = self.client.get(f'/api/users/{self.big.id}/payments/', {'limit': 2}).json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(first['stats']['total_paid'], 30.0)
+        rest = self.client.get(f'/api/users/{self.big.id}/payments/', {'cursor': first['next_cursor']}).json()
+        self.assertEqual([p['transaction_id'] for p in first['results'] + rest['results']],
+                         ["pi_big_2", "pi_big_1", "pi_big_0"])
+        self.assertIsNone(rest['next_cursor'])
+
+        page = self.client.get('/api/users/', {'sort': 'ltv', 'limit': 2, 'fields': 'email,total_paid'}).json()
+        self.assertEqual([u['email'] for u in page['results']], ["big@example.com", "small@example.com"])
+        last = self.client.get('/api/users/', {'sort': 'ltv', 'cursor': page['next_cursor'], 'fields': 'email'}).json()
+        self.assertEqual([u['email'] for u in last['results']], ["none@example.com"])
+        self.assertEqual(self.client.get('/api/users/', {'sort': 'random'}).status_code, 400)
+
+    def test_ltv_pages_include_users_without_stats(self):
+        """Test that users missing a stats row (bulk-created) sort as 0 and appear exactly once"""
+        from app.models import UserPaymentStats
+
+        User.objects.bulk_create([User(email=f"bulk{i}@example.com") for i in range(3)])
+        self.assertEqual(UserPaymentStats.objects.count(), 3)
+
+        emails, cursor = [], None
+        while True:
+            params = {'sort': 'ltv', 'limit': 1, 'fields': 'email'}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.client.get('/api/users/', params).json()
+            emails += [u['email'] for u in page['results']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(emails[:2], ["big@example.com", "small@example.com"])
+        self.assertEqual(sorted(emails), sorted(User.objects.values_list('email', flat=True)))
+
+
+class PlanChangeTest(TestCase):
+    """Test 28: Plan changes are prorated events, not fake payments"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="switch@example.com", password="testpass123")
+        self.pro = Plan.objects.create(name="Pro", price=Decimal("10.00"))
+        self.premium = Plan.objects.create(name="Premium", price=Decimal("20.00"))
+        self.subscription = Subscription.objects.create(
+            user=self.user, plan=self.pro, status='active', renewal_date=timezone.now() + timedelta(days=15))
+
+    def test_upgrade_records_prorated_change(self):
+        """Test that half a period left on an upgrade owes half the price difference"""
+        response = self.client.post('/api/change-plan/', {'user_email': 'switch@example.com',
+                                                          'plan_id': self.premium.id},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['proration']['amount'], '5.00')
+
+        from app.models import PlanChange
+        change = PlanChange.objects.get()
+        self.assertEqual((change.from_plan, change.to_plan, change.subscription), (self.pro, self.premium,
+                                                                                   self.subscription))
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.plan, self.premium)
+        self.assertFalse(Payment.objects.exists())
+
+        purchases = self.client.get(f'/api/users/{self.user.id}/payments/').json()
+        self.assertEqual(purchases['plan_changes'][0]['to_plan'], "Premium")
+
+    def test_downgrade_credit_and_rejections(self):
+        """Test downgrade credits, same-plan rejection and the missing-subscription case"""
+        from app.plan_changes import NoActiveSubscription, PlanChangeError, change_plan
+
+        self.subscription.plan = self.premium
+        self.subscription.save()
+        now = self.subscription.renewal_date - timedelta(days=6)
+        change = change_plan(self.user, self.pro, now=now)
+        self.assertEqual(change.proration_amount, Decimal("-2.00"))
+
+        with self.assertRaises(PlanChangeError):
+            change_plan(self.user, self.pro)
+        other = User.objects.create_user(email="nosub@example.com", password="testpass123")
+        with self.assertRaises(NoActiveSubscription):
+            change_plan(other, self.pro)
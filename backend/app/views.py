@@ -4,25 +4,40 @@ from rest_framework import status
 from django.contrib.auth import authenticate, login
 from .serializers import UserSignupSerializer
 from .serializers import DashBoardSerializer, UserListSerializer
-from django.http import JsonResponse, HttpResponse
-from app.models import Plan, User, Payment, Subscription, Cost, UserSession, Game
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
+from app.models import Plan, User, Payment, Subscription, Cost, UserSession, Game, ReportJob, UserPaymentStats, PlanChange
 from io import BytesIO
-from supabase import create_client  # Add this import
 from django.conf import settings
-from collections import Counter
 from datetime import timedelta, datetime
 from decimal import Decimal
-import matplotlib.pyplot as plt
 import stripe
 import os
+import uuid
 from rest_framework.permissions import AllowAny
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from django.utils.decorators import method_decorator
-from django.db.models import Sum, Q, Count, Avg
-from django.db.models.functions import TruncDate
-import random
+from django.db.models import Sum, Q, Count, Avg, DecimalField, Value
+from django.db.models.functions import Coalesce, TruncDate
 from django.views import View
+from .accounts import get_account_summary
+from .catalog import get_catalog, plan_payload
+from .charts import chart_response
+from .checkout import get_or_create_checkout_intent
+from .analytics import (
+    plan_subscription_counts, cost_breakdown, parse_date_window, daily_session_minutes, daily_cost_series,
+    UserActivityAnalytics
+)
+from .costs import CostImportError, rows_from_csv, validate_cost_rows, save_cost_rows, delete_costs
+from .exports import EXPORTS, EXPORT_FORMATS, stream_export
+from .ledger import stats_payload
+from .payments import activate_paid_plan
+from .plan_changes import NoActiveSubscription, PlanChangeError, change_plan
+from .stripe_client import current_stripe_gateway, get_stripe_gateway
+from .stripe_webhooks import WebhookError, record_event
+from .pagination import approximate_count, keyset_page, parse_limit
+from .idempotency import IdempotencyConflict, request_fingerprint, run_idempotent, stored_response
+from .reports import ReportSnapshot, get_cached_report, render_report_bytes, report_filename, enqueue_report_job
 
 # PDF generation imports
 from reportlab.lib import colors
@@ -40,24 +55,59 @@ import pandas as pd
 import numpy as np
 
 
+PLAN_CHANGE_HISTORY = 20
+
+
 class UserPurchasesView(APIView):
+    """A user's payments, newest first, keyset-paginated on (payment_date, id).
+
+    ?limit= (default 50), ?cursor= (next_cursor of the previous page). The
+    lifetime totals come from the user's UserPaymentStats row; the first page
+    also lists the user's latest plan changes.
+    """
     permission_classes = [AllowAny]  # Add this line
 
     def get(self, request, user_id):
         try:
-            payments = Payment.objects.filter(user_id=user_id).select_related('plan').order_by('-payment_date')
-            
+            try:
+                limit = parse_limit(request.GET.get('limit'))
+                rows, next_cursor = keyset_page(
+                    Payment.objects.filter(user_id=user_id).values(
+                        'id', 'amount', 'currency', 'status', 'transaction_id', 'payment_date', 'plan__name'
+                    ),
+                    ('payment_date', 'id'), request.GET.get('cursor'), limit
+                )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
             data = [{
-                'id': payment.id,
-                'amount': float(payment.amount),
-                'currency': payment.currency,
-                'status': payment.status,
-                'transaction_id': payment.transaction_id,
-                'payment_date': payment.payment_date,
-                'plan_name': payment.plan.name if payment.plan else None, 
-            } for payment in payments]
-            
-            return Response(data, status=status.HTTP_200_OK)
+                'id': row['id'],
+                'amount': float(row['amount']),
+                'currency': row['currency'],
+                'status': row['status'],
+                'transaction_id': row['transaction_id'],
+                'payment_date': row['payment_date'],
+                'plan_name': row['plan__name'],
+            } for row in rows]
+            
+            plan_changes = []
+            if not request.GET.get('cursor'):
+                plan_changes = [{
+                    'id': change.id,
+                    'from_plan': change.from_plan.name if change.from_plan else None,
+                    'to_plan': change.to_plan.name if change.to_plan else None,
+                    'proration_amount': float(change.proration_amount),
+                    'currency': change.currency,
+                    'changed_at': change.changed_at,
+                } for change in PlanChange.objects.filter(user_id=user_id).select_related(
+                    'from_plan', 'to_plan').order_by('-changed_at', '-id')[:PLAN_CHANGE_HISTORY]]
+
+            return Response({
+                'results': data,
+                'next_cursor': next_cursor,
+                'stats': stats_payload(UserPaymentStats.objects.filter(user_id=user_id).first()),
+                'plan_changes': plan_changes,
+            }, status=status.HTTP_200_OK)
             
         except Exception as e:
             print(f"Exception in UserPurchasesView: {str(e)}")
@@ -104,18 +154,15 @@ class LoginView(APIView):
 class Plans(APIView):
     permission_classes = [AllowAny]
     def get(self, request):
-        plans = Plan.objects.all()
-        data = [
-            {
-                "id": plan.id,
-                "name": plan.name,
-                "price": float(plan.price),
-                "currency": plan.currency,
-                "features": plan.features,
-            }
-            for plan in plans
-        ]
-        return Response(data, status=status.HTTP_200_OK)
+        # Cached JSON bytes + ETag; plans change a few times a year
+        catalog = get_catalog()
+        if catalog['etag'] in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(catalog['body'], content_type='application/json')
+        response['ETag'] = catalog['etag']
+        response['Cache-Control'] = f"public, max-age={settings.PLANS_CACHE_MAX_AGE}"
+        return response
     
     def post(self, request):
         # Create new plan
@@ -126,13 +173,7 @@ class Plans(APIView):
                 currency=request.data.get('currency', 'EUR'),
                 features=request.data.get('features', '')
             )
-            return Response({
-                "id": plan.id,
-                "name": plan.name,
-                "price": float(plan.price),
-                "currency": plan.currency,
-                "features": plan.features,
-            }, status=status.HTTP_201_CREATED)
+            return Response(plan_payload(plan), status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -150,13 +191,7 @@ class Plans(APIView):
             plan.features = request.data.get('features', plan.features)
             plan.save()
             
-            return Response({
-                "id": plan.id,
-                "name": plan.name,
-                "price": float(plan.price),
-                "currency": plan.currency,
-                "features": plan.features,
-            }, status=status.HTTP_200_OK)
+            return Response(plan_payload(plan), status=status.HTTP_200_OK)
         except Plan.DoesNotExist:
             return Response({'error': 'Plan not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -175,12 +210,79 @@ class Plans(APIView):
         except Plan.DoesNotExist:
             return Response({'error': 'Plan not found'}, status=status.HTTP_404_NOT_FOUND)
 
+# ?fields= name -> model column for the admin user list (same shape as UserListSerializer)
+USER_LIST_FIELDS = {
+    'id': 'id',
+    'email': 'email',
+    'username': 'username',
+    'role': 'role',
+    'is_active': 'is_active',
+    'created_at': 'date_joined',
+    'total_paid': 'payment_stats__total_paid',
+    'payment_count': 'payment_stats__payment_count',
+    'last_payment_at': 'payment_stats__last_payment_at',
+}
+
+# ?sort= orderings for the admin user list; each ends in a unique key for the cursor
+USER_LIST_SORTS = {
+    'newest': ('date_joined', 'id'),
+    'ltv': ('ltv', 'id'),
+}
+
+# Sort keys computed per row; a user without a stats row sorts as 0, never NULL, so the cursor stays exact
+USER_LIST_SORT_ANNOTATIONS = {
+    'ltv': Coalesce('payment_stats__total_paid', Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=12, decimal_places=2)),
+}
+
+
 class Users(APIView):
+    """Admin user list, newest first, keyset-paginated on (date_joined, id).
+
+    ?limit= (default 50), ?cursor= (next_cursor of the previous page),
+    ?role=, ?is_active=true|false, ?email_prefix=, ?fields=id,email,...,
+    ?sort=ltv for highest lifetime value first (from UserPaymentStats)
+    """
     permission_classes = [AllowAny]
     def get(self, request):
-        users = User.objects.all().order_by('-date_joined')
-        serializer = UserListSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        params = request.GET
+        fields = [f.strip() for f in params.get('fields', '').split(',') if f.strip()] or list(USER_LIST_FIELDS)
+        unknown = [f for f in fields if f not in USER_LIST_FIELDS]
+        if unknown:
+            return Response({'error': f"Unknown field(s): {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = User.objects.all()
+        if params.get('role'):
+            users = users.filter(role=params['role'])
+        if params.get('is_active'):
+            users = users.filter(is_active=params['is_active'].lower() in ('1', 'true', 'yes'))
+        if params.get('email_prefix'):
+            users = users.filter(email__istartswith=params['email_prefix'])
+        filtered = any(params.get(name) for name in ('role', 'is_active', 'email_prefix'))
+
+        keys = USER_LIST_SORTS.get(params.get('sort') or 'newest')
+        if keys is None:
+            return Response({'error': f"'sort' must be one of: {', '.join(USER_LIST_SORTS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        users = users.annotate(**{key: USER_LIST_SORT_ANNOTATIONS[key] for key in keys
+                                  if key in USER_LIST_SORT_ANNOTATIONS})
+
+        try:
+            limit = parse_limit(params.get('limit'))
+            # Keys are always selected so the next cursor can be built
+            columns = {USER_LIST_FIELDS[f] for f in fields} | set(keys)
+            rows, next_cursor = keyset_page(users.values(*columns), keys, params.get('cursor'), limit)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        count, count_is_exact = approximate_count(users, filtered)
+        return Response({
+            'results': [{f: row[USER_LIST_FIELDS[f]] for f in fields} for row in rows],
+            'next_cursor': next_cursor,
+            'count': count,
+            'count_is_exact': count_is_exact,
+        }, status=status.HTTP_200_OK)
     
     def patch(self, request):
         user_id = request.data.get('id')
@@ -216,127 +318,101 @@ class Users(APIView):
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
-class plans_piechart(APIView):
-    permission_classes = [AllowAny]
+class plans_piechart(View):
+    """Pie chart with the number of subscriptions per plan"""
 
     def get(self, request):
         try:
-            supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-
-            # ia planurile (id + nume)
-            plans_resp = supabase.table("app_plan").select("id, name").execute()
-            plan_map = {p["id"]: p["name"] for p in plans_resp.data}
+            # numără abonamentele per plan (un singur query grupat)
+            counts = plan_subscription_counts()
 
-            subs_resp = supabase.table("app_subscription").select("user_id, plan_id").execute()
-            sub_plan_ids = [s["plan_id"] for s in subs_resp.data if s.get("plan_id")]
-
-            if not sub_plan_ids:
+            if not counts:
                 return HttpResponse("No subscriptions found", status=404)
 
-            # numără userii per plan
-            counts = Counter(plan_map.get(pid, "Necunoscut") for pid in sub_plan_ids)
-
-            labels = list(counts.keys())
-            sizes = list(counts.values())
+            labels = [name for name, _ in counts]
+            sizes = [count for _, count in counts]
 
-            # grafic
-            # culori pentru pie chart
-            pie_colors = ["#ff4d4d", "#4db8ff", "#4caf50"]  # roșu, albastru deschis, verde
+            def draw(fig, ax):
+                # culori pentru pie chart
+                pie_colors = ["#ff4d4d", "#4db8ff", "#4caf50"]  # roșu, albastru deschis, verde
 
-            # grafic
-            fig, ax = plt.subplots(figsize=(8, 6))
-            fig.patch.set_facecolor("#1e242c")   # fundal exterior
-            ax.set_facecolor("#2b3139")          # fundal interior (ax)
+                fig.patch.set_facecolor("#1e242c")   # fundal exterior
+                ax.set_facecolor("#2b3139")          # fundal interior (ax)
 
-            wedges, texts, autotexts = ax.pie(
-                sizes,
-                labels=None,
-                autopct='%1.1f%%',
-                colors=[pie_colors[i % len(pie_colors)] for i in range(len(sizes))],
-                textprops={'color': 'white', 'fontsize': 10}
-            )
-            
-             # stil text legendă
-            for text in texts:
-                text.set_color("white")
+                wedges, texts, autotexts = ax.pie(
+                    sizes,
+                    labels=None,
+                    autopct='%1.1f%%',
+                    colors=[pie_colors[i % len(pie_colors)] for i in range(len(sizes))],
+                    textprops={'color': 'white', 'fontsize': 10}
+                )
 
-            ax.axis("equal")  # cerc perfect
+                # stil text legendă
+                for text in texts:
+                    text.set_color("white")
 
-            # legendă separată
-            ax.legend(wedges, labels, title="Plans", loc="center left",
-                      bbox_to_anchor=(1, 0, 0.5, 1), facecolor="#1e242c", labelcolor="white")
+                ax.axis("equal")  # cerc perfect
 
-            # export imagine
-            buf = BytesIO()
-            plt.savefig(buf, format="png", bbox_inches="tight", facecolor=fig.get_facecolor())
-            plt.close(fig)
-            buf.seek(0)
+                # legendă separată
+                ax.legend(wedges, labels, title="Plans", loc="center left",
+                          bbox_to_anchor=(1, 0, 0.5, 1), facecolor="#1e242c", labelcolor="white")
 
-            return HttpResponse(buf.getvalue(), content_type='image/png')
+            return chart_response(request, "plans_piechart", (labels, sizes), draw,
+                                  default_figsize=(8, 6), preferred_format="webp")
 
         except Exception as e:
             print(f"Pie chart error: {str(e)}")
             return HttpResponse(f"Pie chart error: {str(e)}", status=500)
 
-class monthly_costs_linechart(APIView):
-    permission_classes = [AllowAny]
+class monthly_costs_linechart(View):
+    """Line chart with the infrastructure cost of every service"""
 
     def get(self, request):
         try:
-            # conectare la supabase
-            supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-
             # ia toate costurile din tabelul app_cost
-            costs_resp = supabase.table("app_cost").select("description, amount").execute()
-            costs_data = costs_resp.data
+            costs_data = cost_breakdown()
 
             if not costs_data:
                 return HttpResponse("No costs found", status=404)
 
             # extrage etichetele (serviciile) și valorile (costurile)
-            labels = [c["description"] for c in costs_data]
-            values = [c["amount"] for c in costs_data]
-
-            # figure & ax
-            fig, ax = plt.subplots(figsize=(8, 6))
-            fig.patch.set_facecolor("#1e242c")  # fundal general
-            ax.set_facecolor("#2b3139")         # fundal grafic
-
-            # linia principală
-            ax.plot(
-                labels, values,
-                marker="o", markersize=7,
-                linestyle="-", linewidth=2,
-                color="#ff4d4d", label="Cost per service"
-            )
-
-            # titluri
-            ax.set_title("Infrastructure Costs - Current Month",
-                         fontsize=16, color="white", pad=15)
-            ax.set_ylabel("Cost (€)", fontsize=12, color="white")
+            labels = [description for description, _ in costs_data]
+            values = [amount for _, amount in costs_data]
+
+            def draw(fig, ax):
+                fig.patch.set_facecolor("#1e242c")  # fundal general
+                ax.set_facecolor("#2b3139")         # fundal grafic
+
+                # linia principală
+                ax.plot(
+                    labels, values,
+                    marker="o", markersize=7,
+                    linestyle="-", linewidth=2,
+                    color="#ff4d4d", label="Cost per service"
+                )
 
-            # axe & ticks
-            ax.tick_params(axis="x", rotation=25, labelcolor="white", labelsize=9)
-            ax.tick_params(axis="y", labelcolor="white", labelsize=9)
+                # titluri
+                ax.set_title("Infrastructure Costs - Current Month",
+                             fontsize=16, color="white", pad=15)
+                ax.set_ylabel("Cost (€)", fontsize=12, color="white")
 
-            # grid discret
-            ax.grid(linestyle="--", alpha=0.4, color="white")
+                # axe & ticks
+                ax.tick_params(axis="x", rotation=25, labelcolor="white", labelsize=9)
+                ax.tick_params(axis="y", labelcolor="white", labelsize=9)
 
-            # legendă minimalistă
-            legend = ax.legend(loc="upper right", frameon=False, fontsize=10)
-            for text in legend.get_texts():
-                text.set_color("white")
+                # grid discret
+                ax.grid(linestyle="--", alpha=0.4, color="white")
 
-            # margini mai aerisite
-            plt.tight_layout()
+                # legendă minimalistă
+                legend = ax.legend(loc="upper right", frameon=False, fontsize=10)
+                for text in legend.get_texts():
+                    text.set_color("white")
 
-            # export imagine în buffer
-            buf = BytesIO()
-            plt.savefig(buf, format="png", bbox_inches="tight", facecolor=fig.get_facecolor())
-            plt.close(fig)
-            buf.seek(0)
+                # margini mai aerisite
+                fig.tight_layout()
 
-            return HttpResponse(buf.getvalue(), content_type="image/png")
+            return chart_response(request, "monthly_costs_linechart", (labels, values), draw,
+                                  default_figsize=(8, 6), preferred_format="svg")
 
         except Exception as e:
             print(f"Line chart error: {str(e)}")
@@ -344,9 +420,6 @@ class monthly_costs_linechart(APIView):
 
 
 
-# Set Stripe API key
-stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', None) or os.getenv('STRIPE_SECRET_KEY')
-
 
 def _get_stripe_secret_key():
     """Fetch the Stripe secret key from settings/environment."""
@@ -390,7 +463,9 @@ class CreatePaymentIntent(APIView):
 
             if _is_demo_mode(stripe_secret_key):
                 print("Stripe secret key missing or demo mode enabled, returning mock payment intent")
-                mock_id = f"pi_mock_{plan.id}_{request.data.get('user_email', 'unknown').replace('@', '_at_')}"
+                # Unique per attempt: confirmations are deduplicated on the payment intent id
+                mock_id = (f"pi_mock_{plan.id}_{request.data.get('user_email', 'unknown').replace('@', '_at_')}"
+                           f"_{uuid.uuid4().hex[:12]}")
                 return Response({
                     'client_secret': f"{mock_id}_secret",
                     'payment_intent_id': mock_id,
@@ -416,27 +491,32 @@ class CreatePaymentIntent(APIView):
                     )
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            stripe.api_key = stripe_secret_key
-
             amount_in_cents = int(Decimal(str(plan.price)) * 100)
             print(f"Creating Stripe PaymentIntent for plan {plan.id}, amount (cents): {amount_in_cents}")
 
-            intent = stripe.PaymentIntent.create(
-                amount=amount_in_cents,
-                currency=plan.currency.lower(),
-                automatic_payment_methods={'enabled': True},
-                metadata={
-                    'plan_id': plan.id,
-                    'plan_name': plan.name,
-                    'user_email': request.data.get('user_email', ''),
-                }
-            )
+            gateway = get_stripe_gateway(stripe_secret_key)
+            user_email = request.data.get('user_email', '')
+            metadata = {'plan_id': plan.id, 'plan_name': plan.name, 'user_email': user_email}
+
+            if user_email:
+                # Reopening the checkout reuses the intent created last time
+                intent_id, client_secret, reused = get_or_create_checkout_intent(
+                    gateway, user_email, plan, amount_in_cents, plan.currency.lower(), metadata
+                )
+            else:
+                intent = gateway.create_payment_intent(
+                    amount=amount_in_cents,
+                    currency=plan.currency.lower(),
+                    automatic_payment_methods={'enabled': True},
+                    metadata=metadata
+                )
+                intent_id, client_secret, reused = intent.id, intent.client_secret, False
 
-            print(f"Stripe PaymentIntent created: {intent.id}")
+            print(f"Stripe PaymentIntent {'reused' if reused else 'created'}: {intent_id}")
 
             return Response({
-                'client_secret': intent.client_secret,
-                'payment_intent_id': intent.id,
+                'client_secret': client_secret,
+                'payment_intent_id': intent_id,
                 'demo_mode': False,
                 'plan': {
                     'id': plan.id,
@@ -475,6 +555,17 @@ class ConfirmPayment(APIView):
                     'error': 'Payment intent ID, user email, and plan ID are required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            # A retry (double click, client timeout) replays the original confirmation
+            fingerprint = request_fingerprint({'user_email': user_email, 'plan_id': str(plan_id)})
+            try:
+                replay = stored_response('payments.confirm', payment_intent_id, fingerprint)
+            except IdempotencyConflict as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+            if replay is not None:
+                response = Response(replay[1], status=replay[0])
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
             stripe_secret_key = _get_stripe_secret_key()
             intent = None
 
@@ -494,10 +585,9 @@ class ConfirmPayment(APIView):
                                  'Please configure STRIPE_SECRET_KEY in the backend environment.'
                     }, status=status.HTTP_400_BAD_REQUEST)
 
-                stripe.api_key = stripe_secret_key
                 try:
                     print("Retrieving PaymentIntent from Stripe...")
-                    intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+                    intent = get_stripe_gateway(stripe_secret_key).retrieve_payment_intent(payment_intent_id)
                 except stripe.error.StripeError as stripe_error:
                     print(f"Stripe error during retrieval: {stripe_error}")
                     return Response({'error': f'Stripe error: {stripe_error}'}, status=status.HTTP_400_BAD_REQUEST)
@@ -505,16 +595,6 @@ class ConfirmPayment(APIView):
                 payment_succeeded = intent.status == 'succeeded'
             
             if payment_succeeded:
-                # Get or create user in database
-                try:
-                    user = User.objects.get(email=user_email)
-                except User.DoesNotExist:
-                    # Create user if doesn't exist
-                    user = User.objects.create_user(
-                        email=user_email,
-                        role='user'
-                    )
-                
                 # Get the plan
                 try:
                     plan = Plan.objects.get(id=plan_id)
@@ -523,58 +603,38 @@ class ConfirmPayment(APIView):
                         'error': 'Plan not found'
                     }, status=status.HTTP_404_NOT_FOUND)
                 
-                # Create payment record
-                final_amount = Decimal(str(amount)) if amount not in (None, "") else None
-                if final_amount is None:
-                    if intent and getattr(intent, 'amount', None) is not None:
-                        final_amount = Decimal(intent.amount) / 100
-                    else:
-                        final_amount = Decimal(plan.price)
-
-                currency_code = (currency or plan.currency or 'EUR').upper()
-                    
-                payment = Payment.objects.create(
-                    user=user,
-                    plan=plan,
-                    amount=final_amount,
-                    currency=currency_code,
-                    status='paid',
-                    transaction_id=payment_intent_id
-                )
-                
-                # Cancel any existing active subscriptions for this user
-                Subscription.objects.filter(
-                    user=user, 
-                    status='active'
-                ).update(status='canceled')
-                
-                # Create new subscription
-                renewal_date = timezone.now() + timedelta(days=30)  # Monthly subscription
-                
-                subscription = Subscription.objects.create(
-                    user=user,
-                    plan=plan,
-                    status='active',
-                    renewal_date=renewal_date
-                )
-                
-                return Response({
-                    'success': True,
-                    'message': 'Payment confirmed and subscription activated',
-                    'subscription': {
-                        'id': subscription.id,
-                        'plan_name': plan.name,
-                        'status': subscription.status,
-                        'start_date': subscription.start_date,
-                        'renewal_date': subscription.renewal_date
-                    },
-                    'payment': {
-                        'id': payment.id,
-                        'amount': str(payment.amount),
-                        'currency': payment.currency,
-                        'transaction_id': payment.transaction_id
+                final_amount = amount
+                if final_amount in (None, "") and intent and getattr(intent, 'amount', None) is not None:
+                    final_amount = Decimal(intent.amount) / 100
+
+                def confirm():
+                    # One transaction with the user row locked; the Stripe webhook may already have recorded it
+                    payment, subscription, _ = activate_paid_plan(
+                        user_email, plan, final_amount, currency, payment_intent_id
+                    )
+                    return status.HTTP_200_OK, {
+                        'success': True,
+                        'message': 'Payment confirmed and subscription activated',
+                        'subscription': {
+                            'id': subscription.id,
+                            'plan_name': subscription.plan.name,
+                            'status': subscription.status,
+                            'start_date': subscription.start_date,
+                            'renewal_date': subscription.renewal_date
+                        } if subscription else None,
+                        'payment': {
+                            'id': payment.id,
+                            'amount': str(payment.amount),
+                            'currency': payment.currency,
+                            'transaction_id': payment.transaction_id
+                        }
                     }
-                }, status=status.HTTP_200_OK)
+
+                try:
+                    code, payload, _ = run_idempotent('payments.confirm', payment_intent_id, fingerprint, confirm)
+                except IdempotencyConflict as e:
+                    return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+                return Response(payload, status=code)
             else:
                 return Response({
                     'success': False,
@@ -586,6 +646,22 @@ class ConfirmPayment(APIView):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class StripeWebhookView(View):
+    """Stripe webhook receiver: verify, store in the event inbox, acknowledge"""
+
+    def post(self, request):
+        try:
+            event, created = record_event(request.body, request.headers.get('Stripe-Signature', ''))
+        except WebhookError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            print(f"Error in StripeWebhookView: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+        # Processing runs on the worker pool; Stripe only needs the 2xx
+        return JsonResponse({'received': True, 'id': event.id, 'duplicate': not created})
+
+
 class StripeConfig(APIView):
     permission_classes = [AllowAny]
     
@@ -600,6 +676,18 @@ class StripeConfig(APIView):
         })
 
 
+class StripeMetricsView(APIView):
+    """Latency, retry and error counts of this process's Stripe calls, and the shared retry budget left"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        gateway = current_stripe_gateway()
+        if gateway is None:
+            # No live Stripe call made yet in this process (or demo mode)
+            return Response({'operations': {}, 'retry_tokens': None})
+        return Response(gateway.metrics_snapshot())
+
+
 class UserSubscription(APIView):
     permission_classes = [AllowAny]
     def get(self, request):
@@ -611,59 +699,50 @@ class UserSubscription(APIView):
                     'error': 'User email is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            try:
-                user = User.objects.get(email=user_email)
-                
-                # Get user's active subscription
-                subscription = Subscription.objects.filter(
-                    user=user,
-                    status='active'
-                ).first()
-                
-                if subscription:
-                    # Get payment history
-                    payments = Payment.objects.filter(user=user).order_by('-payment_date')[:5]
-                    
-                    payment_history = []
-                    for payment in payments:
-                        payment_history.append({
-                            'id': payment.id,
-                            'amount': str(payment.amount),
-                            'currency': payment.currency,
-                            'plan_name': payment.plan.name,
-                            'date': payment.payment_date,
-                            'status': payment.status,
-                            'transaction_id': payment.transaction_id
-                        })
-                    
-                    return Response({
-                        'subscription': {
-                            'id': subscription.id,
-                            'plan_name': subscription.plan.name,
-                            'plan_price': str(subscription.plan.price),
-                            'plan_currency': subscription.plan.currency,
-                            'plan_features': subscription.plan.features,
-                            'status': subscription.status,
-                            'start_date': subscription.start_date,
-                            'renewal_date': subscription.renewal_date
-                        },
-                        'payment_history': payment_history
-                    })
-                else:
-                    return Response({
-                        'subscription': None,
-                        'payment_history': []
-                    })
-                    
-            except User.DoesNotExist:
+            summary = get_account_summary(user_email)
+            if summary is None:
                 return Response({
                     'error': 'User not found'
                 }, status=status.HTTP_404_NOT_FOUND)
+            
+            if summary['subscription']:
+                return Response({
+                    'subscription': summary['subscription'],
+                    'payment_history': summary['payment_history']
+                })
+            return Response({
+                'subscription': None,
+                'payment_history': []
+            })
                 
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class AccountSummaryView(APIView):
+    """Active subscription, next payment info and recent payments in one response"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            user_email = request.GET.get('email')
+            if not user_email:
+                return Response({
+                    'error': 'User email is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            summary = get_account_summary(user_email)
+            if summary is None:
+                return Response({
+                    'error': 'User not found'
+                }, status=status.HTTP_404_NOT_FOUND)
+            return Response(summary)
+
+        except Exception as e:
+            print(f"Error in AccountSummaryView: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class UserSubscriptionManagement(APIView):
     """Enhanced subscription management with next payment info"""
     permission_classes = [AllowAny]
@@ -678,32 +757,26 @@ class UserSubscriptionManagement(APIView):
                     'error': 'User email is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            try:
-                user = User.objects.get(email=user_email)
-            except User.DoesNotExist:
+            summary = get_account_summary(user_email)
+            if summary is None:
                 return Response({
                     'error': 'User not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            current_subscription = Subscription.objects.filter(
-                user=user,
-                status='active'
-            ).first()
-            
             if action == 'get_next_payment_info':
+                current_subscription = summary['subscription']
                 if current_subscription:
-                    next_payment_date = current_subscription.renewal_date
-                    days_until_payment = (next_payment_date - timezone.now()).days if next_payment_date else 0
+                    next_payment = summary['next_payment']
                     
                     return Response({
                         'has_active_subscription': True,
-                        'plan_name': current_subscription.plan.name,
-                        'plan_price': str(current_subscription.plan.price),
-                        'plan_currency': current_subscription.plan.currency,
-                        'next_payment_date': next_payment_date,
-                        'days_until_payment': max(0, days_until_payment),
-                        'auto_renew': True,
-                        'subscription_status': current_subscription.status
+                        'plan_name': current_subscription['plan_name'],
+                        'plan_price': current_subscription['plan_price'],
+                        'plan_currency': current_subscription['plan_currency'],
+                        'next_payment_date': next_payment['next_payment_date'],
+                        'days_until_payment': next_payment['days_until_payment'],
+                        'auto_renew': next_payment['auto_renew'],
+                        'subscription_status': current_subscription['status']
                     })
                 else:
                     return Response({
@@ -725,57 +798,8 @@ class RevenueAnalyticsView(APIView):
     
     def get(self, request):
         try:
-            now = timezone.now()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=7)
-            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            # Calculate revenue for different periods
-            daily_revenue = Payment.objects.filter(
-                payment_date__gte=today_start,
-                status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            weekly_revenue = Payment.objects.filter(
-                payment_date__gte=week_start,
-                status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            monthly_revenue = Payment.objects.filter(
-                payment_date__gte=month_start,
-                status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            total_revenue = Payment.objects.filter(
-                status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Generate daily chart data for last 30 days
-            daily_chart = []
-            for i in range(30):
-                day_start = today_start - timedelta(days=i)
-                day_end = day_start + timedelta(days=1)
-                day_revenue = Payment.objects.filter(
-                    payment_date__gte=day_start,
-                    payment_date__lt=day_end,
-                    status='paid'
-                ).aggregate(total=Sum('amount'))['total'] or 0
-                
-                daily_chart.append({
-                    'date': day_start.strftime('%Y-%m-%d'),
-                    'amount': float(day_revenue)
-                })
-            
-            daily_chart.reverse()  # Show oldest to newest
-            
-            return Response({
-                'daily': float(daily_revenue),
-                'weekly': float(weekly_revenue),
-                'monthly': float(monthly_revenue),
-                'total': float(total_revenue),
-                'dailyChart': daily_chart,
-                'monthlyChart': []  # Can be expanded later
-            })
+            # Shared with the plan/cost endpoints and the PDF report
+            return Response(ReportSnapshot.current().revenue_payload())
             
         except Exception as e:
             print(f"Error in RevenueAnalyticsView: {str(e)}")
@@ -788,67 +812,8 @@ class HostingCostsView(APIView):
     
     def get(self, request):
         try:
-            costs = Cost.objects.all().order_by('-date')
-            
-            # If no costs exist, create sample data based on your specifications
-            if not costs.exists():
-                # Get all plans to create plan-specific costs
-                plans = Plan.objects.all()
-                
-                # Create plan-specific server costs (Premium=100, Pro=50, Free=25)
-                plan_costs = {}
-                for plan in plans:
-                    plan_name = plan.name.lower()
-                    if 'premium' in plan_name:
-                        plan_costs[plan.name] = 100.00
-                    elif 'pro' in plan_name:
-                        plan_costs[plan.name] = 50.00
-                    else:  # Free plan or any other plan
-                        plan_costs[plan.name] = 25.00
-                
-                # Create costs for each plan
-                for plan in plans:
-                    cost_amount = plan_costs[plan.name]
-                    
-                    Cost.objects.create(
-                        description=f'Server Infrastructure for {plan_name} Plan',
-                        amount=cost_amount,
-                        category='hosting',
-                        currency='EUR',
-                        plan=plan
-                    )
-                
-                # Add some general infrastructure costs
-                general_costs = [
-                    {'description': 'Supabase Database Service', 'amount': 25.00, 'category': 'supabase'},
-                    {'description': 'CDN & Load Balancer', 'amount': 15.50, 'category': 'cdn'},
-                    {'description': 'SSL Certificates & Security', 'amount': 12.00, 'category': 'hosting'},
-                    {'description': 'Docker Registry & Monitoring', 'amount': 8.99, 'category': 'docker'},
-                ]
-                
-                for general_cost in general_costs:
-                    Cost.objects.create(
-                        description=general_cost['description'],
-                        amount=general_cost['amount'],
-                        category=general_cost['category'],
-                        currency='EUR'
-                    )
-                
-                # Refresh the costs queryset
-                costs = Cost.objects.all().order_by('-date')
-            
-            data = []
-            for cost in costs:
-                data.append({
-                    'id': cost.id,
-                    'description': cost.description,
-                    'amount': str(cost.amount),
-                    'currency': cost.currency,
-                    'date': cost.date,
-                    'category': cost.category,
-                    'plan_id': cost.plan.id if cost.plan else None
-                })
-            return Response(data)
+            # Read-only: demo costs are seeded with `manage.py seed_demo_data`
+            return Response(ReportSnapshot.current().costs)
         except Exception as e:
             print(f"Error in HostingCostsView GET: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -863,12 +828,27 @@ class HostingCostsView(APIView):
                 except Plan.DoesNotExist:
                     return Response({'error': 'Plan not found'}, status=status.HTTP_404_NOT_FOUND)
             
+            recurrence = request.data.get('recurrence', 'monthly')
+            if recurrence not in dict(Cost.RECURRENCE_CHOICES):
+                return Response({'error': f"Unsupported recurrence '{recurrence}'"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                period_start, period_end = parse_date_window({
+                    'from': request.data.get('period_start'),
+                    'to': request.data.get('period_end'),
+                })
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
             cost = Cost.objects.create(
                 description=request.data.get('description'),
                 amount=request.data.get('amount'),
                 currency='EUR',  # Default currency
                 category=request.data.get('category', 'hosting'),
-                plan=plan
+                plan=plan,
+                recurrence=recurrence,
+                period_start=period_start,
+                period_end=period_end
             )
             
             return Response({
@@ -878,7 +858,10 @@ class HostingCostsView(APIView):
                 'currency': cost.currency,
                 'date': cost.date,
                 'category': cost.category,
-                'plan_id': cost.plan.id if cost.plan else None
+                'plan_id': cost.plan.id if cost.plan else None,
+                'recurrence': cost.recurrence,
+                'period_start': cost.period_start,
+                'period_end': cost.period_end
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
@@ -886,6 +869,96 @@ class HostingCostsView(APIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class HostingCostsDailyView(APIView):
+    """Amortized daily cost series (?from=YYYY-MM-DD&to=YYYY-MM-DD&plan_id=, default last 30 days)"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            start, end = parse_date_window(request.GET)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        plan_id = request.GET.get('plan_id') or None
+        if plan_id is not None:
+            try:
+                plan_id = int(plan_id)
+            except ValueError:
+                return Response({'error': 'plan_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            end = end or timezone.localdate()
+            start = start or end - timedelta(days=29)
+            series = daily_cost_series(start, end, plan=plan_id)
+            return Response([{'date': day.isoformat(), 'amount': amount} for day, amount in series])
+        except Exception as e:
+            print(f"Error in HostingCostsDailyView: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class HostingCostsBulkView(APIView):
+    """Batch cost import/update (POST JSON, text/csv or a multipart `file`) and batch delete.
+
+    Rows with an `id` update that cost, the others are created. Send an
+    `Idempotency-Key` header so retried uploads replay the first result.
+    """
+    permission_classes = [AllowAny]
+
+    def _read_rows(self, request):
+        if (request.content_type or '').startswith('text/csv'):
+            return rows_from_csv(request.body.decode('utf-8-sig'))
+        upload = request.FILES.get('file') if 'multipart' in (request.content_type or '') else None
+        if upload is not None:
+            return rows_from_csv(upload.read().decode('utf-8-sig'))
+        data = request.data
+        return data.get('costs') if isinstance(data, dict) else data
+
+    def post(self, request):
+        try:
+            rows = self._read_rows(request)
+        except UnicodeDecodeError:
+            return Response({'error': 'CSV must be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+
+        def handler():
+            try:
+                new_costs, updated_costs, updated_fields = validate_cost_rows(rows)
+            except CostImportError as e:
+                return status.HTTP_400_BAD_REQUEST, {'error': str(e), 'errors': e.errors}
+            created = save_cost_rows(new_costs, updated_costs, updated_fields)
+            return status.HTTP_201_CREATED, {
+                'created': len(created),
+                'updated': len(updated_costs),
+                'created_ids': [cost.id for cost in created],
+            }
+
+        try:
+            code, payload, replayed = run_idempotent(
+                'costs.bulk', request.headers.get('Idempotency-Key'), request_fingerprint(rows), handler
+            )
+        except IdempotencyConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except Exception as e:
+            print(f"Error in HostingCostsBulkView POST: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = Response(payload, status=code)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def delete(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response({'deleted': delete_costs(ids)})
+        except (TypeError, ValueError):
+            return Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            print(f"Error in HostingCostsBulkView DELETE: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class HostingCostDetailView(APIView):
     """Individual hosting cost management"""
     permission_classes = [AllowAny]
@@ -908,42 +981,7 @@ class PlanAnalyticsView(APIView):
     
     def get(self, request):
         try:
-            plans = Plan.objects.all()
-            analytics_data = []
-            
-            for plan in plans:
-                # Count active subscriptions for this plan
-                active_subscriptions = Subscription.objects.filter(
-                    plan=plan,
-                    status='active'
-                ).count()
-                
-                # Calculate total revenue (user count * plan price)
-                total_revenue = active_subscriptions * float(plan.price)
-                
-                # Get plan-specific costs
-                plan_costs = Cost.objects.filter(plan=plan)
-                monthly_cost = sum(float(cost.amount) for cost in plan_costs)
-                
-                # Calculate net profit (total revenue - monthly costs)
-                net_profit = total_revenue - monthly_cost
-                
-                # Calculate profit margin
-                profit_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else 0
-                
-                analytics_data.append({
-                    'id': plan.id,
-                    'name': plan.name,
-                    'price_per_user': float(plan.price),
-                    'active_users': active_subscriptions,
-                    'total_revenue': total_revenue,
-                    'monthly_cost': monthly_cost,
-                    'net_profit': net_profit,
-                    'profit_margin': profit_margin,
-                    'currency': plan.currency
-                })
-            
-            return Response(analytics_data)
+            return Response(ReportSnapshot.current().plans)
             
         except Exception as e:
             print(f"Error in PlanAnalyticsView: {str(e)}")
@@ -952,7 +990,11 @@ class PlanAnalyticsView(APIView):
 
 @method_decorator(csrf_exempt, name='dispatch')
 class GeneratePDFReportView(View):
-    """Generate professional PDF report for admin dashboard"""
+    """Generate professional PDF report for admin dashboard.
+
+    Kept for existing scripts: a cache miss renders inside the request. The
+    dashboard uses the background job endpoints (/api/reports/) instead.
+    """
     
     def options(self, request, *args, **kwargs):
         """Handle preflight CORS requests"""
@@ -964,282 +1006,28 @@ class GeneratePDFReportView(View):
     
     def get(self, request):
         try:
-            # Check accept header
-            accept_header = request.META.get('HTTP_ACCEPT', '')
-            print(f"Accept header: {accept_header}")
-            print(f"Request method: {request.method}")
-            print(f"Request path: {request.path}")
-            
-            # Create the HttpResponse object with PDF headers
-            response = HttpResponse(content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="PlayAtac_Dashboard_Report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
+            # Identical report data -> identical PDF, served from the report cache
+            digest, pdf, generated_at = get_cached_report()
+            etag = f'"{digest}"'
+
+            if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+                response = HttpResponse(status=304)
+            else:
+                response = HttpResponse(content_type='application/pdf')
+                response['Content-Disposition'] = f'attachment; filename="{report_filename(generated_at)}"'
+                response.write(pdf)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
             response['Access-Control-Allow-Origin'] = '*'
             response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
             response['Access-Control-Allow-Headers'] = 'Content-Type, Accept, Authorization'
-            
-            # Create the PDF object
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-            
-            # Container for the 'Flowable' objects
-            story = []
-            
-            # Styles
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                spaceAfter=30,
-                textColor=colors.HexColor('#22c55e'),
-                alignment=TA_CENTER
-            )
-            
-            heading_style = ParagraphStyle(
-                'CustomHeading',
-                parent=styles['Heading2'],
-                fontSize=16,
-                spaceAfter=12,
-                textColor=colors.HexColor('#1f2937'),
-                alignment=TA_LEFT
-            )
-            
-            normal_style = ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontSize=10,
-                spaceAfter=6,
-                alignment=TA_LEFT
-            )
-            
-            # Header
-            story.append(Paragraph("🎮 PlayAtac Business Analytics Report", title_style))
-            story.append(Paragraph(f"Generated on {(datetime.now() + timedelta(hours=3)).strftime('%B %d, %Y at %I:%M %p')}", normal_style))
-            story.append(Spacer(1, 30))
-            
-            # Fetch data for the report
-            # Revenue Data
-            now = timezone.now()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=7)
-            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            daily_revenue = Payment.objects.filter(
-                payment_date__gte=today_start, status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            weekly_revenue = Payment.objects.filter(
-                payment_date__gte=week_start, status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            monthly_revenue = Payment.objects.filter(
-                payment_date__gte=month_start, status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            total_revenue = Payment.objects.filter(
-                status='paid'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            # User data
-            total_users = User.objects.count()
-            admin_users = User.objects.filter(role='admin').count()
-            
-            # Plans data
-            plans = Plan.objects.all()
-            total_plans = plans.count()
-            
-            # Costs data
-            costs = Cost.objects.all()
-            total_monthly_costs = sum(float(cost.amount) for cost in costs)
-            
-            # Plan analytics
-            plan_analytics = []
-            for plan in plans:
-                active_subscriptions = Subscription.objects.filter(plan=plan, status='active').count()
-                total_plan_revenue = active_subscriptions * float(plan.price)
-                
-                # Get monthly cost based on plan name (as per your specification)
-                plan_name = plan.name.lower()
-                if 'premium' in plan_name:
-                    monthly_cost = 100.0
-                elif 'pro' in plan_name:
-                    monthly_cost = 50.0
-                else:
-                    monthly_cost = 25.0  # Free plan
-                
-                net_profit = total_plan_revenue - monthly_cost
-                profit_margin = (net_profit / total_plan_revenue * 100) if total_plan_revenue > 0 else 0
-                
-                plan_analytics.append({
-                    'name': plan.name,
-                    'active_users': active_subscriptions,
-                    'price_per_user': float(plan.price),
-                    'total_revenue': total_plan_revenue,
-                    'monthly_cost': monthly_cost,
-                    'net_profit': net_profit,
-                    'profit_margin': profit_margin,
-                    'status': 'Profitable' if net_profit >= 0 else 'Loss'
-                })
-            
-            # Executive Summary Section
-            story.append(Paragraph("📊 Executive Summary", heading_style))
-            
-            summary_data = [
-                ['Metric', 'Value'],
-                ['Total Users', f"{total_users}"],
-                ['Admin Users', f"{admin_users}"],
-                ['Available Plans', f"{total_plans}"],
-                ['Total Revenue', f"€{float(total_revenue):.2f}"],
-                ['Monthly Revenue', f"€{float(monthly_revenue):.2f}"],
-                ['Monthly Costs', f"€{total_monthly_costs:.2f}"],
-                ['Net Profit', f"€{float(total_revenue) - total_monthly_costs:.2f}"],
-            ]
-            
-            summary_table = Table(summary_data, colWidths=[2.5*inch, 2*inch])
-            summary_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22c55e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-            ]))
-            
-            story.append(summary_table)
-            story.append(Spacer(1, 20))
-            
-            # Revenue Analytics Section
-            story.append(Paragraph("💰 Revenue Analytics", heading_style))
-            
-            revenue_data = [
-                ['Period', 'Revenue'],
-                ['Daily', f"€{float(daily_revenue):.2f}"],
-                ['Weekly', f"€{float(weekly_revenue):.2f}"],
-                ['Monthly', f"€{float(monthly_revenue):.2f}"],
-                ['Total (All Time)', f"€{float(total_revenue):.2f}"],
-            ]
-            
-            revenue_table = Table(revenue_data, colWidths=[2.5*inch, 2*inch])
-            revenue_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22c55e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-            ]))
-            
-            story.append(revenue_table)
-            story.append(Spacer(1, 20))
-            
-            # Plan Profitability Analysis Section
-            story.append(Paragraph("📈 Plan Profitability Analysis", heading_style))
-            
-            plan_data = [['Plan Name', 'Users', 'Price/User', 'Revenue', 'Server Cost', 'Net Profit', 'Margin %', 'Status']]
-            
-            for analytics in plan_analytics:
-                plan_data.append([
-                    analytics['name'],
-                    f"{analytics['active_users']}",
-                    f"€{analytics['price_per_user']:.2f}",
-                    f"€{analytics['total_revenue']:.2f}",
-                    f"€{analytics['monthly_cost']:.2f}",
-                    f"€{analytics['net_profit']:.2f}",
-                    f"{analytics['profit_margin']:.1f}%",
-                    analytics['status']
-                ])
-            
-            plan_table = Table(plan_data, colWidths=[1.2*inch, 0.6*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.7*inch, 0.7*inch])
-            plan_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22c55e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-            ]))
-            
-            story.append(plan_table)
-            story.append(Spacer(1, 20))
-            
-            # Infrastructure Costs Section
-            story.append(Paragraph("🏗️ Infrastructure Cost Breakdown", heading_style))
-            
-            # Group costs by category
-            cost_categories = {}
-            for cost in costs:
-                category = cost.category or 'Other'
-                cost_categories[category] = cost_categories.get(category, 0) + float(cost.amount)
-            
-            cost_data = [['Category', 'Monthly Cost', '% of Total']]
-            for category, total in cost_categories.items():
-                percentage = (total / total_monthly_costs * 100) if total_monthly_costs > 0 else 0
-                cost_data.append([
-                    category.title(),
-                    f"€{total:.2f}",
-                    f"{percentage:.1f}%"
-                ])
-            
-            # Add total row
-            cost_data.append(['TOTAL', f"€{total_monthly_costs:.2f}", '100.0%'])
-            
-            cost_table = Table(cost_data, colWidths=[2*inch, 1.5*inch, 1*inch])
-            cost_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22c55e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f9ff')),  # Total row
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),  # Bold total row
-                ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.lightgrey]),
-            ]))
-            
-            story.append(cost_table)
-            story.append(Spacer(1, 30))
-            
-            # Footer
-            story.append(Paragraph("PlayAtac Business Intelligence", 
-                         ParagraphStyle('Footer', parent=styles['Normal'], fontSize=10, 
-                                      textColor=colors.HexColor('#6b7280'), alignment=TA_CENTER)))
-            story.append(Paragraph("This report was automatically generated by the Admin Dashboard system.", 
-                         ParagraphStyle('FooterSub', parent=styles['Normal'], fontSize=8, 
-                                      textColor=colors.HexColor('#6b7280'), alignment=TA_CENTER)))
-            story.append(Paragraph(f"© {datetime.now().year} PlayAtac. All rights reserved.", 
-                         ParagraphStyle('Copyright', parent=styles['Normal'], fontSize=8, 
-                                      textColor=colors.HexColor('#6b7280'), alignment=TA_CENTER)))
-            
-            # Build PDF
-            print("Building PDF document...")
-            doc.build(story)
-            print("PDF document built successfully")
-            
-            # Get PDF data and return
-            pdf = buffer.getvalue()
-            buffer.close()
+            response['Access-Control-Expose-Headers'] = 'ETag, Content-Disposition'
             
             print(f"Generated PDF size: {len(pdf)} bytes")
             
             if len(pdf) == 0:
                 raise Exception("Generated PDF is empty")
             
-            response.write(pdf)
             return response
             
         except Exception as e:
@@ -1255,6 +1043,137 @@ class GeneratePDFReportView(View):
             return error_response
 
 
+def _report_job_payload(job):
+    return {
+        'id': str(job.id),
+        'status': job.status,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'file_size': job.file_size,
+        'detailed': job.detailed,
+        'period_start': job.period_start,
+        'period_end': job.period_end,
+        'progress': job.progress,
+        'pages': job.pages,
+        'error': job.error or None,
+        'status_url': f'/api/reports/{job.id}/',
+        'download_url': f'/api/reports/{job.id}/download/' if job.status == 'done' else None,
+    }
+
+
+class ReportJobsView(APIView):
+    """Queue PDF report generation on the background worker pool.
+
+    Body: {"detailed": true, "from": "YYYY-MM-DD", "to": "YYYY-MM-DD"} adds
+    every payment and per-user activity in the period as extra pages.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        try:
+            start, end = parse_date_window(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        detailed = str(request.data.get('detailed', '')).lower() in ('1', 'true', 'yes')
+        try:
+            job = enqueue_report_job(detailed=detailed, period_start=start, period_end=end)
+            return Response(_report_job_payload(job), status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            print(f"Error in ReportJobsView POST: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ReportJobDetailView(APIView):
+    """Poll the status of a report job"""
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        try:
+            job = ReportJob.objects.get(id=job_id)
+        except ReportJob.DoesNotExist:
+            return Response({'error': 'Report not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_report_job_payload(job))
+
+
+class ReportJobDownloadView(APIView):
+    """Stream a finished report from the file store"""
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        try:
+            job = ReportJob.objects.get(id=job_id)
+        except ReportJob.DoesNotExist:
+            return Response({'error': 'Report not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if job.status != 'done':
+            return Response(_report_job_payload(job), status=status.HTTP_409_CONFLICT)
+        if not os.path.exists(job.file_path):
+            return Response({'error': 'Report file is no longer available'}, status=status.HTTP_410_GONE)
+
+        response = FileResponse(open(job.file_path, 'rb'), as_attachment=True,
+                                filename=job.file_name, content_type='application/pdf')
+        response['Access-Control-Allow-Origin'] = '*'
+        response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+        return response
+
+
+class ReportSnapshotExportView(View):
+    """Export the dashboard snapshot as JSON, CSV or PDF (?format=json|csv|pdf)"""
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'json').lower()
+        snapshot = ReportSnapshot.current()
+
+        if export_format == 'json':
+            response = JsonResponse(snapshot.to_json())
+        elif export_format == 'csv':
+            response = HttpResponse(snapshot.to_csv(), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="PlayAtac_Dashboard_Report.csv"'
+        elif export_format == 'pdf':
+            response = HttpResponse(render_report_bytes(snapshot.report_data(), snapshot.now),
+                                    content_type='application/pdf')
+            response['Content-Disposition'] = f'attachment; filename="{report_filename(snapshot.now)}"'
+        else:
+            return JsonResponse({'error': 'Unsupported format. Use json, csv or pdf'}, status=400)
+
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+
+class DataExportView(View):
+    """Stream a table as CSV or NDJSON (?format=csv|ndjson&from=&to=&gzip=1)"""
+
+    def get(self, request, resource):
+        if resource not in EXPORTS:
+            return JsonResponse({'error': f"Unknown export '{resource}'. Use one of: {', '.join(EXPORTS)}"}, status=404)
+
+        export_format = request.GET.get('format', 'csv').lower()
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'error': 'Unsupported format. Use csv or ndjson'}, status=400)
+
+        try:
+            start, end = parse_date_window(request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        use_gzip = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+        filename = f"{resource}.{export_format}"
+        content_type = EXPORT_FORMATS[export_format]
+        if use_gzip:
+            filename += '.gz'
+            content_type = 'application/gzip'
+
+        response = StreamingHttpResponse(
+            stream_export(resource, export_format, start, end, gzip=use_gzip),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class TestPDFView(View):
     """Simple test view for PDF generation debugging"""
@@ -1381,274 +1300,68 @@ class UserActivityAnalyticsView(APIView):
     
     def get(self, request):
         try:
-            now = timezone.now()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=7)
-            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            # Create sample data if no real sessions exist
-            sessions = UserSession.objects.all()
-            if not sessions.exists():
-                # Generate realistic sample data
-                self._create_sample_data()
-                sessions = UserSession.objects.all()
-            
-            # Total active users
-            total_active_users = sessions.values('user').distinct().count()
-            
-            # Today's active users
-            today_sessions = sessions.filter(login_time__gte=today_start)
-            today_active = today_sessions.values('user').distinct().count()
-            
-            # Week's active users  
-            week_sessions = sessions.filter(login_time__gte=week_start)
-            week_active = week_sessions.values('user').distinct().count()
-            
-            # Average session duration
-            avg_duration = sessions.filter(duration_minutes__gt=0).aggregate(
-                avg=Avg('duration_minutes')
-            )['avg'] or 0
-            
-            # Total time spent (hours)
-            total_minutes = sessions.aggregate(total=Sum('duration_minutes'))['total'] or 0
-            total_hours = round(total_minutes / 60, 1)
-            
-            # Currently online users - check active sessions without logout
-            fifteen_minutes_ago = now - timedelta(minutes=15)
-            active_sessions = UserSession.objects.filter(
-                logout_time__isnull=True,
-                login_time__gte=fifteen_minutes_ago
-            ).select_related('user').order_by('-login_time')
-            
-            currently_online_count = active_sessions.values('user').distinct().count()
-            
-            online_users = []
-            seen_users = set()
-            for session in active_sessions:
-                if session.user.email not in seen_users:
-                    online_users.append({
-                        'email': session.user.email,
-                        'id': str(session.user.id),
-                        'last_active': session.login_time.isoformat()
-                    })
-                    seen_users.add(session.user.email)
-            
-            # Daily activity trend - use actual date range from database
-            # Get the earliest and latest session dates
-            from django.db.models import Min, Max
-            date_range = sessions.aggregate(
-                earliest=Min('login_time'),
-                latest=Max('login_time')
-            )
-            
-            earliest_date = date_range['earliest']
-            latest_date = date_range['latest']
-            
-            if earliest_date and latest_date:
-                earliest_date = earliest_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                latest_date = latest_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                
-                # Calculate number of days between earliest and latest
-                days_diff = (latest_date - earliest_date).days + 1  # +1 to include both start and end days
-            else:
-                earliest_date = today_start
-                days_diff = 1
-            
-            daily_activity = []
-            for i in range(days_diff):
-                day_start = earliest_date + timedelta(days=i)
-                day_end = day_start + timedelta(days=1)
-                
-                day_sessions = sessions.filter(login_time__gte=day_start, login_time__lt=day_end)
-                active_users = day_sessions.values('user').distinct().count()
-                total_time = day_sessions.aggregate(total=Sum('duration_minutes'))['total'] or 0
-                
-                daily_activity.append({
-                    'date': day_start.strftime('%Y-%m-%d'),
-                    'active_users': active_users,
-                    'total_minutes': total_time,
-                    'total_hours': round(total_time / 60, 1)
-                })
-            
-            # Top active users
-            top_users_data = sessions.values('user__email', 'user__id').annotate(
-                total_time=Sum('duration_minutes'),
-                session_count=Count('id')
-            ).order_by('-total_time')[:10]
-            
-            top_users = []
-            for user in top_users_data:
-                hours = (user['total_time'] or 0) // 60
-                minutes = (user['total_time'] or 0) % 60
-                top_users.append({
-                    'email': user['user__email'],
-                    'total_minutes': user['total_time'] or 0,
-                    'total_formatted': f"{hours}h {minutes}m",
-                    'session_count': user['session_count']
-                })
-            
-            # Hourly distribution - aggregate across all sessions
-            hourly_activity = []
-            for hour in range(24):
-                # Get all sessions that have login times in this hour (across all days)
-                hour_count = sessions.filter(
-                    login_time__hour=hour
-                ).values('user').distinct().count()
-                
-                hourly_activity.append({
-                    'hour': f"{hour:02d}:00",
-                    'users': hour_count
-                })
-            
-            return Response({
-                'overview': {
-                    'total_active_users': total_active_users,
-                    'currently_online': currently_online_count,
-                    'today_active': today_active,
-                    'week_active': week_active,
-                    'avg_session_minutes': round(avg_duration, 1),
-                    'total_time_hours': total_hours
-                },
-                'online_users': online_users,  # Added list of currently online users
-                'top_users': top_users,
-                'daily_activity': daily_activity,
-                'hourly_activity': hourly_activity
-            })
+            return Response(UserActivityAnalytics().build())
             
         except Exception as e:
             print(f"Error in UserActivityAnalyticsView: {str(e)}")
             import traceback
             traceback.print_exc()
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    def _create_sample_data(self):
-        """Create sample user session data for demonstration"""
-        try:
-            users = User.objects.all()[:5]  # Get up to 5 users
-            if not users:
-                return
-            
-            now = timezone.now()
-            
-            # Create sessions for last 30 days
-            for day_offset in range(30):
-                day = now - timedelta(days=day_offset)
-                
-                # Random number of sessions per day (1-5)
-                num_sessions = random.randint(1, min(5, len(users)))
-                selected_users = random.sample(list(users), num_sessions)
-                
-                for user in selected_users:
-                    # Random login time during the day
-                    hour = random.randint(8, 20)
-                    minute = random.randint(0, 59)
-                    login_time = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                    
-                    # Random session duration (15-180 minutes)
-                    duration = random.randint(15, 180)
-                    logout_time = login_time + timedelta(minutes=duration)
-                    
-                    UserSession.objects.create(
-                        user=user,
-                        login_time=login_time,
-                        logout_time=logout_time,
-                        duration_minutes=duration,
-                        ip_address='127.0.0.1'
-                    )
-        except Exception as e:
-            print(f"Error creating sample data: {str(e)}")
 
 
-class UserActivityChartView(APIView):
+class UserActivityChartView(View):
     """Generate user activity time chart"""
-    permission_classes = [AllowAny]
     
     def get(self, request):
         try:
-            now = timezone.now()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Ensure we have data
-            if not UserSession.objects.exists():
-                UserActivityAnalyticsView()._create_sample_data()
-            
-            # Get actual date range from database
-            from django.db.models import Min, Max
-            sessions = UserSession.objects.all()
-            date_range = sessions.aggregate(
-                earliest=Min('login_time'),
-                latest=Max('login_time')
-            )
-            
-            earliest_date = date_range['earliest']
-            latest_date = date_range['latest']
-            
-            if earliest_date and latest_date:
-                earliest_date = earliest_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                latest_date = latest_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                
-                # Calculate number of days
-                days_diff = (latest_date - earliest_date).days + 1
-            else:
-                earliest_date = today_start
-                days_diff = 1
-            
-            daily_data = []
-            labels = []
-            
-            for i in range(days_diff):
-                day_start = earliest_date + timedelta(days=i)
-                day_end = day_start + timedelta(days=1)
-                
-                # Total time spent (in hours) for this day
-                day_minutes = UserSession.objects.filter(
-                    login_time__gte=day_start,
-                    login_time__lt=day_end
-                ).aggregate(total=Sum('duration_minutes'))['total'] or 0
-                
-                hours = day_minutes / 60
-                daily_data.append(hours)
-                labels.append(day_start.strftime('%m/%d'))
-            
-            # Create chart with matching theme
-            fig, ax = plt.subplots(figsize=(12, 6))
-            fig.patch.set_facecolor("#1e242c")
-            ax.set_facecolor("#2b3139")
-            
-            # Plot with gradient fill
-            ax.fill_between(range(len(daily_data)), daily_data, alpha=0.3, color="#22c55e")
-            ax.plot(labels, daily_data, marker="o", markersize=6,
-                   linestyle="-", linewidth=2.5, color="#22c55e", label="Hours Online")
-            
-            # Styling to match admin dashboard with dynamic date range
+            try:
+                start, end = parse_date_window(request.GET)
+            except ValueError as e:
+                return HttpResponse(str(e), status=400, content_type="text/plain")
+
+            # One grouped query for the whole window, missing days filled with 0
+            series = daily_session_minutes(start, end)
+
+            daily_data = [minutes / 60 for _, minutes in series]
+            labels = [day.strftime('%m/%d') for day, _ in series]
+            earliest_date = series[0][0]
+            latest_date = series[-1][0]
+
             date_range_text = f"{earliest_date.strftime('%b %d')} - {latest_date.strftime('%b %d, %Y')}"
-            ax.set_title(f"User Engagement - Time Spent Online ({date_range_text})",
-                        fontsize=16, color="white", pad=15, fontweight='bold')
-            ax.set_xlabel("Date", fontsize=12, color="white")
-            ax.set_ylabel("Total Hours", fontsize=12, color="white")
-            
-            # Rotate x-axis labels
-            ax.tick_params(axis="x", rotation=45, labelcolor="white", labelsize=9)
-            ax.tick_params(axis="y", labelcolor="white", labelsize=10)
-            
-            # Grid
-            ax.grid(linestyle="--", alpha=0.3, color="white")
-            
-            # Legend
-            legend = ax.legend(loc="upper left", frameon=False, fontsize=10)
-            for text in legend.get_texts():
-                text.set_color("white")
-            
-            plt.tight_layout()
-            
-            # Export
-            buf = BytesIO()
-            plt.savefig(buf, format="png", bbox_inches="tight", 
-                       facecolor=fig.get_facecolor(), dpi=100)
-            plt.close(fig)
-            buf.seek(0)
-            
-            response = HttpResponse(buf.getvalue(), content_type="image/png")
+
+            def draw(fig, ax):
+                # Create chart with matching theme
+                fig.patch.set_facecolor("#1e242c")
+                ax.set_facecolor("#2b3139")
+
+                # Plot with gradient fill
+                ax.fill_between(range(len(daily_data)), daily_data, alpha=0.3, color="#22c55e")
+                ax.plot(labels, daily_data, marker="o", markersize=6,
+                       linestyle="-", linewidth=2.5, color="#22c55e", label="Hours Online")
+
+                # Styling to match admin dashboard with dynamic date range
+                ax.set_title(f"User Engagement - Time Spent Online ({date_range_text})",
+                            fontsize=16, color="white", pad=15, fontweight='bold')
+                ax.set_xlabel("Date", fontsize=12, color="white")
+                ax.set_ylabel("Total Hours", fontsize=12, color="white")
+
+                # Rotate x-axis labels
+                ax.tick_params(axis="x", rotation=45, labelcolor="white", labelsize=9)
+                ax.tick_params(axis="y", labelcolor="white", labelsize=10)
+
+                # Grid
+                ax.grid(linestyle="--", alpha=0.3, color="white")
+
+                # Legend
+                legend = ax.legend(loc="upper left", frameon=False, fontsize=10)
+                for text in legend.get_texts():
+                    text.set_color("white")
+
+                fig.tight_layout()
+
+            response = chart_response(request, "user_activity_chart",
+                                      (date_range_text, labels, daily_data), draw,
+                                      default_figsize=(12, 6), preferred_format="svg")
             response['Access-Control-Allow-Origin'] = '*'
             return response
             
@@ -1785,7 +1498,7 @@ class GamesView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 class ChangePlanView(APIView):
-    """API endpoint to change user's subscription plan without payment"""
+    """API endpoint to change user's subscription plan without payment (the proration is recorded, not charged)"""
     permission_classes = [AllowAny]
     
     def post(self, request):
@@ -1814,41 +1527,22 @@ class ChangePlanView(APIView):
                     'error': 'Plan not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Get current active subscription
-            current_subscription = Subscription.objects.filter(
-                user=user,
-                status='active'
-            ).first()
-            
-            if not current_subscription:
+            # Lock, swap and record the change in one transaction
+            try:
+                change = change_plan(user, new_plan)
+            except PlanChangeError as e:
                 return Response({
-                    'error': 'No active subscription found'
-                }, status=status.HTTP_404_NOT_FOUND)
+                    'error': str(e)
+                }, status=status.HTTP_404_NOT_FOUND if isinstance(e, NoActiveSubscription) else status.HTTP_400_BAD_REQUEST)
             
-            # Save old plan info for logging
-            old_plan_name = current_subscription.plan.name
-            old_plan_price = current_subscription.plan.price
-            
-            # Update the subscription to the new plan
-            current_subscription.plan = new_plan
-            current_subscription.save()
-            
-            # Create a payment record for the plan change (with $0 amount for downgrade tracking)
-            # This allows admins to see plan changes in the purchase history
-            Payment.objects.create(
-                user=user,
-                plan=new_plan,
-                amount=0,  # No charge for plan changes
-                currency=new_plan.currency,
-                status='plan_change',  # Special status to distinguish from actual payments
-                transaction_id=f'plan_change_{current_subscription.id}_{timezone.now().timestamp()}'
-            )
+            current_subscription = change.subscription
+            old_plan = change.from_plan
             
-            print(f"Plan changed: {user_email} from {old_plan_name} (€{old_plan_price}) to {new_plan.name} (€{new_plan.price})")
+            print(f"Plan changed: {user_email} from {old_plan.name} (€{old_plan.price}) to {new_plan.name} (€{new_plan.price}), proration {change.proration_amount}")
             
             return Response({
                 'success': True,
-                'message': f'Plan changed from {old_plan_name} to {new_plan.name}',
+                'message': f'Plan changed from {old_plan.name} to {new_plan.name}',
                 'subscription': {
                     'id': current_subscription.id,
                     'plan_name': new_plan.name,
@@ -1860,8 +1554,13 @@ class ChangePlanView(APIView):
                     'renewal_date': current_subscription.renewal_date
                 },
                 'old_plan': {
-                    'name': old_plan_name,
-                    'price': str(old_plan_price)
+                    'name': old_plan.name,
+                    'price': str(old_plan.price)
+                },
+                'proration': {
+                    'amount': str(change.proration_amount),
+                    'currency': change.currency,
+                    'remaining_fraction': float(change.remaining_fraction)
                 }
             }, status=status.HTTP_200_OK)
             
@@ -1949,6 +1648,10 @@ class ProfitPredictionView(APIView):
         now = timezone.now()
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
         
+        # Amortized costs for the whole window in one query
+        daily_costs = dict(daily_cost_series((today_start - timedelta(days=30)).date(),
+                                             (today_start - timedelta(days=1)).date()))
+
         # Get recent data for feature engineering
         data = []
         for i in range(30, 0, -1):  # Last 30 days
@@ -1969,10 +1672,7 @@ class ProfitPredictionView(APIView):
             ).count()
             
             # Costs
-            total_costs = Cost.objects.all().aggregate(
-                total=Sum('amount')
-            )['total'] or 0
-            daily_cost = float(total_costs) / 30
+            daily_cost = daily_costs.get(day_start.date(), 0)
             
             # User activity
             sessions = UserSession.objects.filter(
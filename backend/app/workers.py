@@ -0,0 +1,50 @@
+"""
+In-process background worker pool.
+
+Slow work (report generation, webhook processing) is submitted here after
+the surrounding transaction commits so web workers can answer immediately.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared thread pool, sized by BACKGROUND_WORKERS"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+                    thread_name_prefix='playatac-worker'
+                )
+    return _executor
+
+
+def _run(fn, args, kwargs):
+    close_old_connections()
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        print(f"Background task {fn.__name__} failed: {str(e)}")
+        raise
+    finally:
+        # Worker threads own their DB connection; don't leak it between tasks
+        connection.close()
+
+
+def submit(fn, *args, **kwargs):
+    """Run `fn` on the worker pool and return its Future"""
+    return get_executor().submit(_run, fn, args, kwargs)
+
+
+def submit_after_commit(fn, *args, **kwargs):
+    """Run `fn` on the worker pool once the current transaction commits"""
+    transaction.on_commit(lambda: submit(fn, *args, **kwargs))
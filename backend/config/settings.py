@@ -146,8 +146,65 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Use the in-memory Supabase stand-in (local development / tests)
+SUPABASE_USE_FAKE = os.getenv("SUPABASE_USE_FAKE", "false").lower() in ("1", "true", "yes")
 
 # Stripe configuration
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.environ.get("STRIPE_PUBLISHABLE_KEY")
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+
+# Chart rendering cache (seconds)
+CHART_CACHE_TIMEOUT = int(os.environ.get("CHART_CACHE_TIMEOUT", 300))
+
+# Background worker pool (report generation, webhook processing)
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", 2))
+
+# Local file store for generated PDF reports
+REPORTS_ROOT = os.environ.get("REPORTS_ROOT", str(BASE_DIR / "reports"))
+
+# Content-addressed PDF report cache limits
+REPORT_CACHE_MAX_AGE = int(os.environ.get("REPORT_CACHE_MAX_AGE", 24 * 3600))
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("REPORT_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+# Shared admin dashboard snapshot cache (seconds)
+REPORT_SNAPSHOT_TTL = int(os.environ.get("REPORT_SNAPSHOT_TTL", 60))
+
+# Rows fetched per server-side cursor round trip in streaming exports
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 2000))
+
+# Public plans catalog: browser/CDN max-age and how long each process trusts its in-memory copy (seconds)
+PLANS_CACHE_MAX_AGE = int(os.environ.get("PLANS_CACHE_MAX_AGE", 60))
+PLANS_CATALOG_LOCAL_TTL = int(os.environ.get("PLANS_CATALOG_LOCAL_TTL", 5))
+
+# Stripe HTTP client: timeouts (seconds), retries of idempotent calls and their total time budget
+STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE") or None
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get("STRIPE_CONNECT_TIMEOUT", 3))
+STRIPE_READ_TIMEOUT = float(os.environ.get("STRIPE_READ_TIMEOUT", 15))
+STRIPE_MAX_RETRIES = int(os.environ.get("STRIPE_MAX_RETRIES", 2))
+STRIPE_RETRY_BUDGET = float(os.environ.get("STRIPE_RETRY_BUDGET", 20))
+# Retries shared by every Stripe call in the process: each retry spends a token, each success earns back REFILL
+STRIPE_RETRY_TOKENS = float(os.environ.get("STRIPE_RETRY_TOKENS", 10))
+STRIPE_RETRY_TOKEN_REFILL = float(os.environ.get("STRIPE_RETRY_TOKEN_REFILL", 0.1))
+
+# How long an open checkout PaymentIntent is reused before the sweeper cancels it (seconds)
+CHECKOUT_INTENT_TTL = int(os.environ.get("CHECKOUT_INTENT_TTL", 3600))
+
+# Subscription renewal scheduler: rows claimed per batch, concurrent charges, and seconds between runs with --watch
+RENEWAL_BATCH_SIZE = int(os.environ.get("RENEWAL_BATCH_SIZE", 200))
+RENEWAL_CONCURRENCY = int(os.environ.get("RENEWAL_CONCURRENCY", 8))
+RENEWAL_INTERVAL = int(os.environ.get("RENEWAL_INTERVAL", 60))
+# A renewal claim older than this (seconds) belongs to a scheduler that died mid-batch and is retried
+RENEWAL_CLAIM_TIMEOUT = int(os.environ.get("RENEWAL_CLAIM_TIMEOUT", 600))
+
+# Per-user account summary cache (seconds); payment, subscription and plan changes invalidate it
+ACCOUNT_SUMMARY_TTL = int(os.environ.get("ACCOUNT_SUMMARY_TTL", 30))
+
+# A Stripe webhook event still 'processing' after this many seconds is reclaimed by process_stripe_events
+STRIPE_EVENT_CLAIM_TIMEOUT = int(os.environ.get("STRIPE_EVENT_CLAIM_TIMEOUT", 300))
+
+# Report jobs pending or running longer than this (seconds) are requeued or failed by process_report_jobs
+REPORT_JOB_TIMEOUT = int(os.environ.get("REPORT_JOB_TIMEOUT", 900))
+
+# Set on a dedicated copy of the database so benchmark_queries may lock its tables without a flag
+BENCHMARK_DATABASE = os.environ.get("BENCHMARK_DATABASE", "").lower() in ("1", "true", "yes")
@@ -21,12 +21,14 @@ from .views import UserDashboardView
 from .views import LoginView
 from . import views
 from app.views import (
-    Plans, Users, CreatePaymentIntent, ConfirmPayment, StripeConfig, 
-    UserSubscription, UserPurchasesView, UserSubscriptionManagement, 
-    RevenueAnalyticsView, HostingCostsView, HostingCostDetailView, 
+    Plans, Users, CreatePaymentIntent, ConfirmPayment, StripeConfig, StripeWebhookView, StripeMetricsView,
+    UserSubscription, AccountSummaryView, UserPurchasesView, UserSubscriptionManagement, 
+    RevenueAnalyticsView, HostingCostsView, HostingCostsBulkView, HostingCostsDailyView, HostingCostDetailView, 
     PlanAnalyticsView, GeneratePDFReportView, TestPDFView, TestConnectionView, 
     UserActivityAnalyticsView, UserActivityChartView, UserSessionTrackingView, 
-    GamesView, ChangePlanView, ProfitPredictionView, ModelTrainingStatusView
+    GamesView, ChangePlanView, ProfitPredictionView, ModelTrainingStatusView,
+    ReportJobsView, ReportJobDetailView, ReportJobDownloadView, ReportSnapshotExportView,
+    DataExportView
 )
 from app.views import plans_piechart
 from app.views import monthly_costs_linechart
@@ -41,7 +43,10 @@ urlpatterns = [
     path('api/create-payment-intent/', CreatePaymentIntent.as_view(), name='create-payment-intent'),
     path('api/confirm-payment/', ConfirmPayment.as_view(), name='confirm-payment'),
     path('api/stripe-config/', StripeConfig.as_view(), name='stripe-config'),
+    path('api/stripe/webhook/', StripeWebhookView.as_view(), name='stripe-webhook'),
+    path('api/stripe/metrics/', StripeMetricsView.as_view(), name='stripe-metrics'),
     path('api/user-subscription/', UserSubscription.as_view(), name='user-subscription'),
+    path('api/account-summary/', AccountSummaryView.as_view(), name='account-summary'),
     path('piechart.png', plans_piechart.as_view(), name='plans_piechart'),
     path('api/users/<str:user_id>/payments/', UserPurchasesView.as_view(), name='user_purchases'),
     path('api/subscription-management/', UserSubscriptionManagement.as_view(), name='subscription_management'),
@@ -49,9 +54,17 @@ urlpatterns = [
     path('api/analytics/revenue/', RevenueAnalyticsView.as_view(), name='revenue_analytics'),
     path('api/analytics/plans/', PlanAnalyticsView.as_view(), name='plan_analytics'),
     path('api/hosting-costs/', HostingCostsView.as_view(), name='hosting_costs'),
+    path('api/hosting-costs/bulk/', HostingCostsBulkView.as_view(), name='hosting_costs_bulk'),
+    path('api/hosting-costs/daily/', HostingCostsDailyView.as_view(), name='hosting_costs_daily'),
     path('api/hosting-costs/<int:cost_id>/', HostingCostDetailView.as_view(), name='hosting_cost_detail'),
     # PDF Report generation
     path('api/generate-pdf-report/', GeneratePDFReportView.as_view(), name='generate_pdf_report'),
+    path('api/reports/', ReportJobsView.as_view(), name='report_jobs'),
+    path('api/reports/snapshot/', ReportSnapshotExportView.as_view(), name='report_snapshot_export'),
+    path('api/reports/<uuid:job_id>/', ReportJobDetailView.as_view(), name='report_job_detail'),
+    path('api/reports/<uuid:job_id>/download/', ReportJobDownloadView.as_view(), name='report_job_download'),
+    # Streaming CSV/NDJSON exports
+    path('api/exports/<str:resource>/', DataExportView.as_view(), name='data_export'),
     path('api/test-pdf/', TestPDFView.as_view(), name='test_pdf'),
     path('api/test-connection/', TestConnectionView.as_view(), name='test_connection'),
     path("charts/monthly-costs/", monthly_costs_linechart.as_view(), name="monthly-costs-linechart"),
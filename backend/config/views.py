@@ -10,7 +10,7 @@ from django.http import HttpResponse
 from io import BytesIO
 import matplotlib.pyplot as plt
 from collections import Counter
-from supabase import create_client
+from app.supabase_client import get_supabase_client
 from django.conf import settings
 from rest_framework.permissions import AllowAny
 
@@ -19,7 +19,7 @@ class UserPurchasesView(APIView):
     
     def get(self, request, user_id):
         try:
-            supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+            supabase = get_supabase_client()
             response = supabase.table("app_payment").select("*").eq("user_id", user_id).execute()
             
             if response.error:
@@ -91,7 +91,7 @@ class plans_piechart(APIView):
 
     def get(self, request):
         try:
-            supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+            supabase = get_supabase_client()
 
             # ia planurile (id + nume)
             plans_resp = supabase.table("app_plan").select("id, name").execute()
@@ -156,7 +156,7 @@ class monthly_costs_linechart(APIView):
     def get(self, request):
         try:
             # conectare la supabase
-            supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+            supabase = get_supabase_client()
 
             # ia toate costurile din tabelul app_cost
             costs_resp = supabase.table("app_cost").select("description, amount").execute()
@@ -308,14 +308,20 @@ const SmartChartCard = memo(function SmartChartCard({ title, icon, chartUrl, alt
   );
 });
 
+const USERS_PAGE_SIZE = 100;
+
 export default function AdminDashboard() {
   const { user, signOut } = useAuth();
   const navigate = useNavigate();
 
   // STATE (enhanced with analytics)
   const [users, setUsers] = useState([]);
+  const [usersCursor, setUsersCursor] = useState(null);
+  const [usersTotal, setUsersTotal] = useState({ count: 0, exact: true });
   const [expandedUser, setExpandedUser] = useState(null);
   const [userPurchases, setUserPurchases] = useState({});
+  const [purchasesCursor, setPurchasesCursor] = useState({});
+  const [userPlanChanges, setUserPlanChanges] = useState({});
   const [plans, setPlans] = useState([]);
   const [loading, setLoading] = useState(true);
   const [editingPlan, setEditingPlan] = useState(null);
@@ -379,7 +385,7 @@ export default function AdminDashboard() {
 
   // Memoize admin and user counts
   const adminCount = useMemo(() => users.filter(u => u.role === 'admin').length, [users]);
-  const userCount = useMemo(() => users.length, [users]);
+  const userCount = useMemo(() => usersTotal.count, [usersTotal]);
 
   useEffect(() => { 
     fetchAdminData();
@@ -400,19 +406,35 @@ export default function AdminDashboard() {
       const API_URL = process.env.REACT_APP_DJANGO_URL || 'http://localhost:8000';
       const [plansResponse, usersResponse] = await Promise.all([
         fetch(`${API_URL}/api/plans/`),
-        fetch(`${API_URL}/api/users/`)
+        fetch(`${API_URL}/api/users/?limit=${USERS_PAGE_SIZE}`)
       ]);
       if (!plansResponse.ok) throw new Error(`Plans API error: ${plansResponse.status}`);
       if (!usersResponse.ok) throw new Error(`Users API error: ${usersResponse.status}`);
       const plansData = await plansResponse.json();
       const usersData = await usersResponse.json();
-      setUsers(usersData || []);
+      setUsers(usersData.results || []);
+      setUsersCursor(usersData.next_cursor);
+      setUsersTotal({ count: usersData.count, exact: usersData.count_is_exact });
       setPlans(plansData || []);
     } catch (e) {
       console.error('Error fetching admin data:', e);
     } finally { setLoading(false); }
   }, []);
 
+  const loadMoreUsers = async () => {
+    if (!usersCursor) return;
+    try {
+      const API_URL = process.env.REACT_APP_DJANGO_URL || 'http://localhost:8000';
+      const res = await fetch(`${API_URL}/api/users/?limit=${USERS_PAGE_SIZE}&cursor=${encodeURIComponent(usersCursor)}`);
+      if (!res.ok) throw new Error(`Users API error: ${res.status}`);
+      const data = await res.json();
+      setUsers(prev => [...prev, ...data.results]);
+      setUsersCursor(data.next_cursor);
+    } catch (e) {
+      console.error('Error loading more users:', e);
+    }
+  };
+
   const fetchRevenueData = async () => {
     try {
       const API_URL = process.env.REACT_APP_DJANGO_URL || 'http://localhost:8000';
@@ -470,11 +492,26 @@ export default function AdminDashboard() {
       const API_URL = process.env.REACT_APP_DJANGO_URL || 'http://localhost:8000';
       const res = await fetch(`${API_URL}/api/users/${userId}/payments/`, { headers: { 'Content-Type': 'application/json' } });
       if (!res.ok) throw new Error(`API error: ${res.status}`);
-      const purchases = await res.json();
-      setUserPurchases(prev => ({ ...prev, [userId]: purchases }));
+      const data = await res.json();
+      setUserPurchases(prev => ({ ...prev, [userId]: data.results || [] }));
+      setPurchasesCursor(prev => ({ ...prev, [userId]: data.next_cursor }));
+      setUserPlanChanges(prev => ({ ...prev, [userId]: data.plan_changes || [] }));
     } catch (e) { console.error('Error fetching user purchases:', e); }
   };
 
+  const loadMorePurchases = async (userId) => {
+    const cursor = purchasesCursor[userId];
+    if (!cursor) return;
+    try {
+      const API_URL = process.env.REACT_APP_DJANGO_URL || 'http://localhost:8000';
+      const res = await fetch(`${API_URL}/api/users/${userId}/payments/?cursor=${encodeURIComponent(cursor)}`, { headers: { 'Content-Type': 'application/json' } });
+      if (!res.ok) throw new Error(`API error: ${res.status}`);
+      const data = await res.json();
+      setUserPurchases(prev => ({ ...prev, [userId]: [...(prev[userId] || []), ...data.results] }));
+      setPurchasesCursor(prev => ({ ...prev, [userId]: data.next_cursor }));
+    } catch (e) { console.error('Error loading more purchases:', e); }
+  };
+
   const toggleUserRole = async (userId, currentRole) => {
     try {
       const API_URL = process.env.REACT_APP_DJANGO_URL || 'http://localhost:8000';
@@ -493,6 +530,7 @@ export default function AdminDashboard() {
       const res = await fetch(`${API_URL}/api/users/`, { method: 'DELETE', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ id: userId }) });
       if (!res.ok) { const data = await res.json(); throw new Error(data.error || `API error: ${res.status}`); }
       setUsers(users.filter(u => u.id !== userId));
+      setUsersTotal(t => ({ ...t, count: Math.max(0, t.count - 1) }));
     } catch (e) { console.error('Error deleting user:', e); alert('Failed to delete user: ' + e.message); }
   };
 
@@ -657,28 +695,51 @@ export default function AdminDashboard() {
       // Show loading notification
       addNotification('📄 Generating professional PDF report...', 'info', 3000);
 
-      // Call the Django backend API to generate PDF
+      // Queue the report on the backend worker pool, then poll until the file is ready
       const API_URL = process.env.REACT_APP_DJANGO_URL || 'http://localhost:8000';
-      const response = await fetch(`${API_URL}/api/generate-pdf-report/`, {
+      const readError = async (response) => {
+        try {
+          const errorData = await response.json();
+          return errorData.error || `HTTP ${response.status}: ${response.statusText}`;
+        } catch (parseError) {
+          return `HTTP ${response.status}: ${response.statusText}`;
+        }
+      };
+
+      const queued = await fetch(`${API_URL}/api/reports/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+        body: JSON.stringify({}),
+      });
+      if (!queued.ok) {
+        throw new Error(await readError(queued));
+      }
+      let job = await queued.json();
+
+      const deadline = Date.now() + 5 * 60 * 1000;
+      while (job.status === 'pending' || job.status === 'running') {
+        if (Date.now() > deadline) {
+          throw new Error('Report is taking too long; try again in a few minutes');
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const polled = await fetch(`${API_URL}${job.status_url}`, { headers: { 'Accept': 'application/json' } });
+        if (!polled.ok) {
+          throw new Error(await readError(polled));
+        }
+        job = await polled.json();
+      }
+      if (job.status !== 'done') {
+        throw new Error(job.error || `Report ${job.status}`);
+      }
+
+      const response = await fetch(`${API_URL}${job.download_url}`, {
         method: 'GET',
         headers: {
           'Accept': 'application/pdf',
         },
       });
-
       if (!response.ok) {
-        let errorMessage = `HTTP ${response.status}: ${response.statusText}`;
-        
-        // Try to get detailed error from response
-        try {
-          const errorData = await response.json();
-          errorMessage = errorData.error || errorMessage;
-        } catch (parseError) {
-          // If not JSON, use the status text
-          errorMessage = `Server returned ${response.status}: ${response.statusText}`;
-        }
-        
-        throw new Error(errorMessage);
+        throw new Error(await readError(response));
       }
 
       // Get the PDF blob from response
@@ -693,10 +754,11 @@ export default function AdminDashboard() {
       const link = document.createElement('a');
       link.href = url;
       
-      // Generate filename with current timestamp
-      const timestamp = new Date().toISOString().split('T')[0];
-      const timeString = new Date().toTimeString().split(' ')[0].replace(/:/g, '-');
-      link.download = `PlayAtac_Dashboard_Report_${timestamp}_${timeString}.pdf`;
+      // Use the file name the backend stamped on the report
+      const disposition = response.headers.get('Content-Disposition') || '';
+      const match = disposition.match(/filename="?([^"]+)"?/);
+      const fileName = match ? match[1] : `PlayAtac_Dashboard_Report_${job.id}.pdf`;
+      link.download = fileName;
       
       // Trigger download
       document.body.appendChild(link);
@@ -708,7 +770,7 @@ export default function AdminDashboard() {
 
       // Show success message
       addNotification(
-        `✅ PDF Report Downloaded! File: PlayAtac_Dashboard_Report_${timestamp}_${timeString}.pdf`, 
+        `✅ PDF Report Downloaded! File: ${fileName}`, 
         'success', 
         8000
       );
@@ -722,7 +784,7 @@ export default function AdminDashboard() {
       if (error.message.includes('HTTP 500')) {
         errorMsg = '❌ Server Error: Check Django server console for detailed error logs';
       } else if (error.message.includes('HTTP 404')) {
-        errorMsg = '❌ API Endpoint Not Found: Verify the PDF endpoint exists in Django urls.py';
+        errorMsg = '❌ API Endpoint Not Found: Verify the report endpoints exist in Django urls.py';
       } else if (error.message.includes('HTTP 406')) {
         errorMsg = '❌ Content Type Error: Server cannot generate PDF in requested format';
       } else if (error.message.includes('fetch')) {
@@ -1219,7 +1281,7 @@ export default function AdminDashboard() {
               {/* Users panel */}
               <section id="users" className="panel">
                 <header className="panel__head" style={{ cursor: 'pointer' }} onClick={() => setUserListExpanded(!userListExpanded)}>
-                  <h2>Users ({users.length})</h2>
+                  <h2>Users ({usersTotal.exact ? usersTotal.count : `~${usersTotal.count}`})</h2>
                   <div style={{ display: 'flex', alignItems: 'center', gap: '12px' }}>
                     <span style={{ fontSize: '14px', color: 'var(--muted)' }}>
                       {userListExpanded ? 'Click to collapse' : 'Click to expand'}
@@ -1333,30 +1395,59 @@ export default function AdminDashboard() {
                                               {userPurchases[u.id].map(p => (
                                                 <tr key={p.id}>
                                                   <td>{p.plan_name}</td>
-                                                  <td>
-                                                    {p.status === 'plan_change' 
-                                                      ? <span style={{ color: '#f59e0b', fontWeight: 'bold' }}>Plan Change</span>
-                                                      : `${p.amount} ${p.currency}`
-                                                    }
-                                                  </td>
+                                                  <td>{`${p.amount} ${p.currency}`}</td>
                                                   <td>{new Date(p.payment_date).toLocaleDateString()}</td>
                                                   <td>
-                                                    <span className={`pill ${
-                                                      p.status === 'paid' ? 'pill--ok' : 
-                                                      p.status === 'plan_change' ? 'pill--warn' : 
-                                                      'pill--bad'
-                                                    }`}>
-                                                      {p.status === 'plan_change' ? 'Changed Plan' : p.status}
+                                                    <span className={`pill ${p.status === 'paid' ? 'pill--ok' : 'pill--bad'}`}>
+                                                      {p.status}
                                                     </span>
                                                   </td>
                                                 </tr>
                                               ))}
                                             </tbody>
                                           </table>
+                                          {purchasesCursor[u.id] && (
+                                            <div style={{ marginTop: '8px', textAlign: 'center' }}>
+                                              <button className="btn btn-sm btn-info" onClick={() => loadMorePurchases(u.id)}>
+                                                Load more purchases
+                                              </button>
+                                            </div>
+                                          )}
                                         </div>
                                       ) : (
                                         <p className="muted i">No purchase history available</p>
                                       )}
+                                      {userPlanChanges[u.id]?.length > 0 && (
+                                        <>
+                                          <h4>Plan Changes</h4>
+                                          <div className="table-wrap">
+                                            <table className="table table--compact">
+                                              <thead>
+                                                <tr>
+                                                  <th>From</th>
+                                                  <th>To</th>
+                                                  <th>Proration</th>
+                                                  <th>Date</th>
+                                                </tr>
+                                              </thead>
+                                              <tbody>
+                                                {userPlanChanges[u.id].map(c => (
+                                                  <tr key={c.id}>
+                                                    <td>{c.from_plan || '—'}</td>
+                                                    <td>{c.to_plan || '—'}</td>
+                                                    <td>
+                                                      <span className={`pill ${c.proration_amount < 0 ? 'pill--ok' : 'pill--warn'}`}>
+                                                        {`${c.proration_amount} ${c.currency}`}
+                                                      </span>
+                                                    </td>
+                                                    <td>{new Date(c.changed_at).toLocaleDateString()}</td>
+                                                  </tr>
+                                                ))}
+                                              </tbody>
+                                            </table>
+                                          </div>
+                                        </>
+                                      )}
                                     </div>
                                   </td>
                                 </tr>
@@ -1381,6 +1472,13 @@ export default function AdminDashboard() {
                         </div>
                       )}
                     </div>
+                    {usersCursor && (
+                      <div style={{ marginTop: '16px', textAlign: 'center' }}>
+                        <button className="btn btn-sm btn-success" onClick={(e) => { e.stopPropagation(); loadMoreUsers(); }}>
+                          Load more users
+                        </button>
+                      </div>
+                    )}
                   </div>
                 )}
               </section>